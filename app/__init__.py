@@ -2,10 +2,7 @@
 # It creates and configures the Flask app, initializes extensions,
 # registers blueprints, and sets up context processors.
 
-import logging
-from logging.handlers import RotatingFileHandler
-import os
-from flask import Flask, request
+from flask import Flask
 from flask_talisman import Talisman
 from whitenoise import WhiteNoise
 from config import Config
@@ -18,30 +15,90 @@ def create_app(config_class=Config):
 # Apply ProxyFix middleware
 # You should use this when your Flask app is deployed behind a proxy (like on Heroku) and you 
 # want to ensure your app behaves correctly when handling HTTPS traffic.
-    app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1)
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_X_FOR'], x_proto=1)
 
-    # Set up logging
-    if not app.debug and not app.testing:
-        if not os.path.exists('logs'):
-            os.mkdir('logs')
-        file_handler = RotatingFileHandler('logs/physioengine.log', maxBytes=10240, backupCount=10)
-        file_handler.setFormatter(logging.Formatter(
-            '%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]'))
-        file_handler.setLevel(logging.INFO)
-        app.logger.addHandler(file_handler)
+    # Set up logging: records are queued and written by a background thread
+    from app.utils import logging_setup
+    logging_setup.init_app(app)
+    app.logger.info('PhysioEngine startup')
 
-        app.logger.setLevel(logging.INFO)
-        app.logger.info('PhysioEngine startup')
+    # Per-endpoint latency metrics, merged across workers at /metrics
+    from app.utils import metrics
+    metrics.init_app(app)
+
+    # CPU and memory profiling of live workers; only registered with PROFILING_TOKEN
+    from app.utils import profiling
+    profiling.init_app(app)
+
+    # Redacted JSONL trace of requests for benchmarks.replay; before the rate limiter
+    from app.utils import traffic_capture
+    traffic_capture.init_app(app)
+
+    # Compile questionnaire data once; routes read it from the registry
+    from app.utils import questionnaire_registry
+    questionnaire_registry.init_app(app)
+
+    # Shared storage for sessions and submitted responses
+    from app.utils import result_store
+    result_store.init_app(app)
+
+    # Signed patient form tokens, verified without a store lookup
+    from app.utils import session_tokens
+    session_tokens.init_app(app)
+
+    # Per-IP token buckets shared by all workers; 429 before any other work
+    from app.utils import rate_limit
+    rate_limit.init_app(app)
+
+    # Append-only archive of scored submissions (also `flask archive`)
+    from app.utils import outcome_archive
+    outcome_archive.init_app(app)
+
+    # PDF reports rendered in a process pool, served by physio.report_pdf
+    from app.utils import reports
+    reports.init_app(app)
+
+    # Session funnel events, batched into SQLite (also `flask funnel report`)
+    from app.utils import funnel
+    funnel.init_app(app)
+
+    # Periodic expiry of abandoned sessions and leftover files (also `flask sweep`)
+    from app.utils import janitor
+    janitor.init_app(app)
+
+    # QR codes are rendered in memory and served by main.qr_code
+    from app.utils import qr
+    qr.init_app(app)
+
+    # Questionnaire pages are rendered once per questionnaire and template version
+    from app.utils import page_cache
+    page_cache.init_app(app)
+
+    # In-process channel that wakes waiting pages when a result is saved
+    from app.utils import notifier
+    notifier.init_app(app)
+
+    # Hashed, precompressed static files (built by `flask assets build`) and asset_url()
+    from app.utils import assets
+    assets.init_app(app)
+
+    # Template bytecode cache and `flask startup-report`; gunicorn.conf.py calls warm_up
+    from app.utils import warmup
+    warmup.init_app(app)
 
     # Register blueprints
-    from app.routes import main, user, physio
+    from app.routes import main, user, physio, api
     app.register_blueprint(main.bp)
     app.register_blueprint(user.bp, url_prefix='/user')
     app.register_blueprint(physio.bp, url_prefix='/physio')
+    app.register_blueprint(api.bp, url_prefix='/api/v1')
 
     # Initialize extensions
     Talisman(app, content_security_policy=app.config['CSP'], force_https=True)
-    app.wsgi_app = WhiteNoise(app.wsgi_app, root='app/static/')
+    app.wsgi_app = WhiteNoise(app.wsgi_app, root='app/static/', max_age=app.config['STATIC_MAX_AGE'],
+                              immutable_file_test=assets.is_hashed,
+                              add_headers_function=assets.add_immutable_headers)
+    app.wsgi_app.add_files(app.static_folder, prefix='static/')
 
     @app.after_request
     def add_security_headers(response):
@@ -49,9 +106,4 @@ def create_app(config_class=Config):
             response.headers[header] = value
         return response
 
-    @app.before_request
-    def log_request_info():
-        app.logger.info('Headers: %s', request.headers)
-        app.logger.info('Body: %s', request.get_data())
-
     return app
\ No newline at end of file
@@ -14,7 +14,9 @@ QUESTIONNAIRES = {
             (26, 50): 'Moderate problems',
             (51, 75): 'Mild problems',
             (76, 100): 'No significant problems'
-        }
+        },
+        # Answers 0 (none) to 4 (extreme); 100 means no problems
+        'scoring': {'min': 0, 'max': 4, 'inverted': True}
     },
     'hoos': {
         'name': 'HOOS (Hip dysfunction and Osteoarthritis Outcome Score)',
@@ -31,7 +33,9 @@ QUESTIONNAIRES = {
             (26, 50): 'Moderate problems',
             (51, 75): 'Mild problems',
             (76, 100): 'No significant problems'
-        }
+        },
+        # Answers 0 (none) to 4 (extreme); 100 means no problems
+        'scoring': {'min': 0, 'max': 4, 'inverted': True}
     },
     'dash_swedish': {
         'name': 'DASH (Disabilities of the Arm, Shoulder and Hand) - Svenska',
@@ -50,6 +54,19 @@ QUESTIONNAIRES = {
             (51, 75): 'Måttlig funktionsnedsättning',
             (76, 100): 'Allvarlig funktionsnedsättning'
         },
+        # Answers 1 (no difficulty) to 5 (unable); 100 means most disability.
+        # The DASH score uses Q1-Q30; work and music/sports are optional modules
+        # scored on their own. Yes/no and free-text questions are not scored.
+        'scoring': {
+            'min': 1,
+            'max': 5,
+            'inverted': False,
+            'total': 'items',
+            'total_sections': ['Förmåga att utföra aktiviteter', 'Påverkan på socialt liv och dagliga aktiviteter',
+                               'Symtom', 'Sömn och självförtroende'],
+            'optional_sections': ['Arbetsförmåga', 'Musik och idrott'],
+            'unscored': ['Q31', 'Q32', 'Q37', 'Q38']
+        },
         'file': 'dash_swedish.json',
         'template': 'dash_swedish.html',
         'language': 'sv'
@@ -0,0 +1,194 @@
+"""
+JSON API for scoring submissions from tablets and EHR integrations.
+
+``POST /api/v1/score/<slug>`` scores one set of answers. ``POST
+/api/v1/submissions`` takes a streamed NDJSON body with one submission per
+line and streams back one NDJSON result per line, so a batch of any size is
+processed with the memory of a single record. Answers are checked against
+the questionnaire's precompiled ``ResponseSchema`` before scoring, and valid
+submissions are appended to the outcome archive.
+
+The API is disabled unless API_TOKEN is set; requests must send
+``Authorization: Bearer <API_TOKEN>``.
+"""
+
+import hmac
+import json
+
+from flask import Blueprint, Response, abort, current_app, jsonify, request, stream_with_context
+from werkzeug.exceptions import HTTPException
+
+from app.utils.metrics import timer
+from app.utils.outcome_archive import PseudonymKeyMissing, get_archive
+from app.utils.scoring import get_plan
+from app.utils.validation import ValidationError, get_schema
+
+bp = Blueprint('api', __name__)
+
+
+@bp.before_request
+def require_api_token():
+    """
+    Allow API access only with the configured bearer token.
+
+    Raises:
+        404: If no API_TOKEN is configured.
+        401: If the request does not carry the token.
+    """
+    token = current_app.config.get('API_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                               f'Bearer {token}'.encode('utf-8')):
+        abort(401)
+
+
+@bp.errorhandler(HTTPException)
+def json_error(e):
+    """Return API errors as JSON instead of HTML pages."""
+    response = jsonify(error=e.name, message=e.description)
+    response.status_code = e.code
+    if getattr(e, 'retry_after', None):
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response
+
+
+def score_submission(slug, answers, clinic='', patient=''):
+    """
+    Validate, score and archive one submission.
+
+    Args:
+        slug (str): Questionnaire slug.
+        answers (dict): Question ID to answer.
+        clinic (str, optional): Clinic identifier for the archive.
+        patient (str, optional): Patient identifier; only its pseudonym is archived.
+
+    Returns:
+        dict: The scoring result, see ``ScoringPlan.score``.
+
+    Raises:
+        LookupError: If the questionnaire is unknown.
+        ValidationError: If the answers do not match the questionnaire.
+        PseudonymKeyMissing: If a patient is given but no
+            ``ARCHIVE_PSEUDONYM_KEY`` is configured.
+    """
+    schema = get_schema(slug) if isinstance(slug, str) else None
+    plan = get_plan(slug) if schema is not None else None
+    if plan is None:
+        raise LookupError(f'unknown questionnaire {slug!r}')
+    archive = get_archive()
+    clinic = str(clinic or '').strip()[:32]
+    patient = str(patient or '').strip()
+    patient_key = archive.pseudonymize(clinic, patient)
+    responses = schema.validate(answers)
+    with timer('score'):
+        result = plan.score(responses)
+
+    try:
+        with timer('archive_append'):
+            archive.append(slug, responses, result, clinic=clinic, patient_key=patient_key)
+    except Exception as e:
+        current_app.logger.error("Error archiving %s submission: %s", slug, e, exc_info=True)
+    return result
+
+
+@bp.route('/score/<slug>', methods=['POST'])
+def score(slug):
+    """
+    Score one submission.
+
+    The body is ``{"answers": {...}}`` with optional ``clinic`` and ``patient``.
+
+    Args:
+        slug (str): Questionnaire slug.
+
+    Returns:
+        Response: 200 with ``questionnaire`` and ``result``, or 422 with ``errors``.
+
+    Raises:
+        400: If the body is not a JSON object.
+        404: If the questionnaire is unknown.
+    """
+    body = request.get_json(silent=True)
+    if not isinstance(body, dict):
+        abort(400, 'Expected a JSON object with "answers".')
+    try:
+        result = score_submission(slug, body.get('answers'), body.get('clinic'), body.get('patient'))
+    except LookupError:
+        abort(404, f'Unknown questionnaire {slug!r}.')
+    except PseudonymKeyMissing:
+        abort(400, 'Patient identifiers are not accepted on this server.')
+    except ValidationError as e:
+        return jsonify(questionnaire=slug, errors=e.errors), 422
+    return jsonify(questionnaire=slug, result=result)
+
+
+@bp.route('/submissions', methods=['POST'])
+def submissions():
+    """
+    Score a streamed NDJSON batch of submissions.
+
+    Every line is ``{"questionnaire": slug, "answers": {...}}`` with optional
+    ``id``, ``clinic`` and ``patient``. The response streams one line per
+    record: ``{"line", "id", "ok"}`` plus ``result`` or ``errors``. Records
+    are independent; a bad record does not stop the batch.
+
+    Returns:
+        Response: A streamed ``application/x-ndjson`` response.
+    """
+    max_records = current_app.config['API_MAX_BATCH']
+    max_line = current_app.config['API_MAX_LINE_BYTES']
+    stream = request.stream
+
+    def results():
+        records = 0
+        line_number = 0
+        while True:
+            line = stream.readline(max_line + 1)
+            if not line:
+                return
+            line_number += 1
+            if len(line) > max_line and not line.endswith(b'\n'):
+                # Skip the rest of the oversized line without buffering it
+                while line and not line.endswith(b'\n'):
+                    line = stream.readline(max_line)
+                yield _result_line(line_number, None, errors=[{'error': f'line longer than {max_line} bytes'}])
+                continue
+            if not line.strip():
+                continue
+            records += 1
+            if records > max_records:
+                yield _result_line(line_number, None, errors=[{'error': f'batch limited to {max_records} records'}])
+                return
+            yield _process_line(line_number, line)
+
+    return Response(stream_with_context(results()), mimetype='application/x-ndjson')
+
+
+def _process_line(line_number, line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return _result_line(line_number, None, errors=[{'error': 'invalid JSON'}])
+    if not isinstance(record, dict):
+        return _result_line(line_number, None, errors=[{'error': 'record must be a JSON object'}])
+    record_id = record.get('id')
+    slug = record.get('questionnaire')
+    try:
+        result = score_submission(slug, record.get('answers'), record.get('clinic'), record.get('patient'))
+    except LookupError:
+        return _result_line(line_number, record_id, errors=[{'error': f'unknown questionnaire {slug!r}'}])
+    except PseudonymKeyMissing:
+        return _result_line(line_number, record_id, errors=[{'error': 'patient identifiers are not accepted'}])
+    except ValidationError as e:
+        return _result_line(line_number, record_id, errors=e.errors)
+    return _result_line(line_number, record_id, result=result)
+
+
+def _result_line(line_number, record_id, result=None, errors=None):
+    line = {'line': line_number, 'id': record_id, 'ok': errors is None}
+    if errors is None:
+        line['result'] = result
+    else:
+        line['errors'] = errors
+    return json.dumps(line, ensure_ascii=False) + '\n'
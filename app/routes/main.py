@@ -5,20 +5,35 @@ It handles the home page, QR code generation, patient forms, and result processi
 The blueprint 'main' is defined here and various routes are associated with it.
 """
 
-from flask import Blueprint, render_template, request, redirect, url_for, current_app
-import qrcode
-import os
-import uuid
-import logging
+from flask import Blueprint, render_template, request, redirect, url_for, current_app, Response, abort
+import hashlib
 import json
+import re
+import uuid
+import time
 from urllib.parse import urljoin
-from app.utils.koos_calculator import calculate_koos_scores
 from app.questionnaires_config import QUESTIONNAIRES
-from app.utils import calculate_koos_scores, calculate_hoos_scores
+from app.utils.scoring import get_plan
+from app.utils.questionnaire_registry import get_registry
+from app.utils.notifier import get_notifier
+from app.utils.result_store import get_store, session_key, result_key, idempotency_key
+from app.utils.qr import get_qr_renderer, MIMETYPES
+from app.utils.page_cache import get_page_cache
+from app.utils.assets import asset_url
+from app.utils.outcome_archive import PseudonymKeyMissing, get_archive
+from app.utils.metrics import timer
+from app.utils.funnel import trace
+from app.utils.reports import request_report
+from app.utils.validation import ValidationError, get_schema
+from app.utils.session_tokens import TokenError, TokenExpired, get_session_tokens
+from app.utils.dashboard import track_session
 
 # Create a Blueprint named 'main' for organizing routes
 bp = Blueprint('main', __name__)
 
+# Idempotency keys sent by the offline form script (UUIDs)
+IDEMPOTENCY_KEY_RE = re.compile(r'^[A-Za-z0-9-]{16,64}$')
+
 @bp.route('/')
 def home():
     """
@@ -29,51 +44,76 @@ def home():
     """
     return render_template('index.html', show_navbar=True)
 
-@bp.route('/generate_qr')
+@bp.route('/generate_qr', methods=['GET', 'POST'])
 def generate_qr():
     """
     Generate a QR code for a specific evaluation form.
 
-    This function creates a unique session ID, generates a URL for the patient form,
-    creates a QR code for this URL, and saves it as an image.
+    This function creates a unique session ID and registers it in the result store.
+    The QR code for the patient form URL is rendered on demand by ``qr_code``.
+    Optional ``clinic`` and ``patient`` values tag the outcome in the archive;
+    the patient identifier is only stored as a pseudonymous key. It is only
+    accepted in a POST body, so it never appears in URLs, access logs or the
+    browser history. The session is also added to the physio's dashboard.
 
     Returns:
         Response: Redirect to the wait_for_result page or an error message.
 
     Raises:
-        400: If no evaluation form is specified in the request.
+        400: If no evaluation form is specified in the request, or a patient
+            identifier is sent in the query string or without
+            ``ARCHIVE_PSEUDONYM_KEY``.
     """
-    evaluation_form = request.args.get('evaluation_form')
+    if 'patient' in request.args:
+        current_app.logger.warning("Rejected a patient identifier in the generate_qr query string.")
+        return "Send the patient identifier in a POST body, not in the URL.", 400
+    evaluation_form = request.values.get('evaluation_form')
     if not evaluation_form:
         current_app.logger.warning("No evaluation form specified in the generate_qr request.")
         return "No evaluation form specified.", 400
 
-    session_id = str(uuid.uuid4())
-    base_url = current_app.config['BASE_URL']
-    
-    # Generate the relative URL
-    relative_url = url_for('main.patient_form', session_id=session_id, evaluation_form=evaluation_form)
-    
-    # Join the base URL with the relative URL
-    patient_form_url = urljoin(base_url, relative_url)
+    # Register the session so other workers and dynos can resolve it
+    try:
+        session_id, session = create_sessions([evaluation_form], request.values.get('clinic', ''),
+                                              request.form.get('patient', ''))[0]
+    except PseudonymKeyMissing:
+        current_app.logger.warning("Rejected a patient identifier: ARCHIVE_PSEUDONYM_KEY is not set.")
+        return "Patient identifiers are not accepted on this server.", 400
+    current_app.logger.debug("Generated QR code URL: %s", patient_form_url(session_id, session))
+    track_session(session_id)
 
-    current_app.logger.info(f"Generated QR code URL: {patient_form_url}")
+    return redirect(url_for('main.wait_for_result', session_id=session_id, evaluation_form=evaluation_form))
 
-    # Create and save the QR code image
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(patient_form_url)
-    qr.make(fit=True)
-    img = qr.make_image(fill='black', back_color='white')
+@bp.route('/qr/<session_id>.<any(png, svg):fmt>')
+def qr_code(session_id, fmt):
+    """
+    Serve the QR code for a session as a PNG or SVG image.
 
-    qr_directory = os.path.join('app', 'static', 'qr_codes')
-    if not os.path.exists(qr_directory):
-        os.makedirs(qr_directory)
+    The image is rendered from the session's patient form URL and cached in
+    memory. Responses carry an ETag and may be cached privately for the
+    lifetime of the session, because a session's URL never changes.
 
-    qr_filename = f"{session_id}.png"
-    qr_path = os.path.join(qr_directory, qr_filename)
-    img.save(qr_path)
+    Args:
+        session_id (str): Unique identifier for the session.
+        fmt (str): Image format, 'png' or 'svg'.
 
-    return redirect(url_for('main.wait_for_result', session_id=session_id, evaluation_form=evaluation_form))
+    Returns:
+        Response: The QR code image.
+
+    Raises:
+        404: If the session does not exist or has expired.
+    """
+    session = get_store().get(session_key(session_id))
+    if session is None:
+        abort(404)
+
+    body, etag = get_qr_renderer().render(patient_form_url(session_id, session), fmt)
+    response = Response(body, mimetype=MIMETYPES[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['SESSION_TTL']
+    response.cache_control.immutable = True
+    return response.make_conditional(request)
 
 @bp.route('/thank_you')
 def thank_you():
@@ -87,6 +127,58 @@ def thank_you():
     """
     return render_template('thank_you.html', show_navbar=False)
 
+@bp.route('/sw.js')
+def service_worker():
+    """
+    Serve the service worker that keeps questionnaires usable offline.
+
+    The worker is served from the site root so its scope covers the patient
+    form URLs. It precaches the static assets listed in OFFLINE_PRECACHE under
+    their hashed names, the CDN files in OFFLINE_PRECACHE_EXTERNAL, the thank
+    you page and the web app manifest, and serves questionnaire pages from its cache while refreshing them in the
+    background. The cache name changes with the asset build and the
+    questionnaire registry generation, so a deploy or a questionnaire reload
+    replaces the cached copies.
+
+    Returns:
+        Response: The service worker script.
+    """
+    precache = [asset_url(filename) for filename in current_app.config['OFFLINE_PRECACHE']]
+    precache += [url_for('main.thank_you'), url_for('main.web_manifest')]
+    external = list(current_app.config['OFFLINE_PRECACHE_EXTERNAL'])
+    version = hashlib.sha256(json.dumps([precache, external, get_registry().generation]).encode('utf-8')).hexdigest()[:12]
+    # URL prefixes of the questionnaire pages, up to their first variable part
+    page_prefixes = [url_for('main.patient_form', token='~').split('~')[0],
+                     url_for('user.fill_questionnaire', questionnaire_slug='~').split('~')[0]]
+    body = render_template('service_worker.js', version=version, precache=precache, external=external,
+                           static_prefix=url_for('static', filename=''), page_prefixes=page_prefixes)
+    response = Response(body, mimetype='application/javascript')
+    # Browsers check for an updated worker on every visit; never serve a stale one
+    response.cache_control.no_cache = True
+    return response
+
+@bp.route('/manifest.webmanifest')
+def web_manifest():
+    """
+    Serve the web app manifest linked from the questionnaire pages.
+
+    Returns:
+        Response: The manifest as JSON.
+    """
+    manifest = {
+        'name': 'PhysioEngine',
+        'short_name': 'PhysioEngine',
+        'start_url': url_for('main.home'),
+        'display': 'standalone',
+        'background_color': '#ffffff',
+        'theme_color': '#f8f9fa',
+        'icons': [{'src': asset_url('images/logo.png'), 'sizes': '200x200', 'type': 'image/png'}],
+    }
+    response = Response(json.dumps(manifest), mimetype='application/manifest+json')
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['STATIC_MAX_AGE']
+    return response
+
 @bp.route('/test_env')
 def test_env():
     """
@@ -101,26 +193,61 @@ def test_env():
     base_url = current_app.config['BASE_URL']
     return f'HEROKU environment variable is set to: {heroku}<br>BASE_URL is: {base_url}'
 
-@bp.route('/patient_form/<session_id>/<evaluation_form>', methods=['GET', 'POST'])
-def patient_form(session_id, evaluation_form):
+@bp.route('/f/<token>', methods=['GET', 'POST'])
+def patient_form(token):
     """
     Handle GET and POST requests for patient forms.
 
+    The signed session token in the URL identifies the session and its
+    questionnaire, so no storage lookup is needed to serve the form.
     For GET requests, it renders the questionnaire.
     For POST requests, it processes the form submission.
 
     Args:
-        session_id (str): Unique identifier for the session.
-        evaluation_form (str): Type of evaluation form (e.g., 'koos', 'hoos').
+        token (str): Session token minted by ``session_token``.
 
     Returns:
         str: Rendered HTML template or redirect response.
+
+    Raises:
+        404: If the token is forged or malformed.
+        410: If the token has expired.
     """
-    logging.debug(f"Accessing patient_form with session_id: {session_id}, evaluation_form: {evaluation_form}")
+    try:
+        session = get_session_tokens().verify(token)
+    except TokenExpired:
+        current_app.logger.info("Expired patient form link")
+        return "This link has expired.", 410
+    except TokenError as e:
+        current_app.logger.warning("Rejected patient form link: %s", e)
+        return "Form not found", 404
+
+    current_app.logger.debug("Accessing patient_form with session_id: %s, evaluation_form: %s",
+                             session.session_id, session.evaluation_form)
     if request.method == 'POST':
-        return handle_form_submission(session_id)
+        return handle_form_submission(session.session_id, session.evaluation_form)
     else:
-        return render_questionnaire(session_id, evaluation_form)
+        return render_questionnaire(token, session)
+
+@bp.route('/patient_form/<session_id>/<evaluation_form>', methods=['GET', 'POST'])
+def legacy_patient_form(session_id, evaluation_form):
+    """
+    Redirect patient form links created before session tokens to their token URL.
+
+    Args:
+        session_id (str): Unique identifier for the session.
+        evaluation_form (str): Type of evaluation form.
+
+    Returns:
+        Response: A 308 redirect, which keeps the method and body of a POST.
+
+    Raises:
+        404: If the session does not exist, has expired or is for another form.
+    """
+    session = get_store().get(session_key(session_id))
+    if session is None or session['f'] != evaluation_form:
+        abort(404)
+    return redirect(url_for('main.patient_form', token=session_token(session_id, session)), code=308)
 
 @bp.route('/wait_for_result/<session_id>/<evaluation_form>')
 def wait_for_result(session_id, evaluation_form):
@@ -137,63 +264,183 @@ def wait_for_result(session_id, evaluation_form):
         str: Rendered HTML template or processed results.
 
     Raises:
+        404: If no result is waiting and the session does not exist or has expired.
         500: If an error occurs while processing the results.
     """
-    result_file = os.path.join('results', f'{session_id}.json')
-    if os.path.exists(result_file):
-        try:
-            return process_results(result_file, session_id, evaluation_form)
-        except Exception as e:
-            current_app.logger.error(f"Error processing results: {str(e)}", exc_info=True)
-            return "An error occurred while processing your results.", 500
+    try:
+        responses = get_store().consume(result_key(session_id))
+    except Exception as e:
+        current_app.logger.error("Error loading results: %s", e, exc_info=True)
+        return "An error occurred while processing your results.", 500
+
+    if responses is not None:
+        return process_results(responses, session_id, evaluation_form)
     else:
-        return render_template('wait_for_result.html', session_id=session_id, evaluation_form=evaluation_form)
+        session = get_store().get(session_key(session_id))
+        if session is None:
+            return "Session not found or expired.", 404
+        if current_app.config['QR_INLINE']:
+            qr_src = get_qr_renderer().data_uri(patient_form_url(session_id, session), 'svg')
+        else:
+            qr_src = url_for('main.qr_code', session_id=session_id, fmt='svg')
+        form_url = url_for('main.patient_form', token=session_token(session_id, session))
+        return render_template('wait_for_result.html', session_id=session_id, evaluation_form=evaluation_form,
+                               qr_src=qr_src, form_url=form_url)
 
-def handle_form_submission(session_id):
+@bp.route('/result_events/<session_id>')
+def result_events(session_id):
+    """
+    Stream a server-sent event when the session's result is ready.
+
+    The waiting page keeps this one connection open instead of reloading
+    itself. The stream sends a ``ready`` event as soon as
+    ``handle_form_submission`` publishes the session, or when a result saved by
+    another worker is noticed. Streams end after RESULT_EVENTS_MAX_DURATION
+    seconds and the browser reconnects automatically.
+
+    Every open stream holds a worker thread, so at most
+    RESULT_EVENTS_MAX_STREAMS streams per worker are kept open. Over the limit
+    the result is checked once and the stream ends at once, asking the browser
+    to reconnect after RESULT_EVENTS_FALLBACK_RETRY seconds.
+
+    Args:
+        session_id (str): Unique identifier for the session.
+
+    Returns:
+        Response: A ``text/event-stream`` response.
+
+    Raises:
+        404: If the session does not exist or has expired.
+    """
+    notifier = get_notifier()
+    store = get_store()
+    poll_interval = current_app.config['RESULT_EVENTS_POLL_INTERVAL']
+    keepalive_interval = current_app.config['RESULT_EVENTS_KEEPALIVE_INTERVAL']
+    max_duration = current_app.config['RESULT_EVENTS_MAX_DURATION']
+    fallback_retry = current_app.config['RESULT_EVENTS_FALLBACK_RETRY']
+
+    if store.get(session_key(session_id)) is None:
+        abort(404)
+
+    def is_ready():
+        return store.exists(result_key(session_id))
+
+    def stream():
+        # The slot is claimed when the stream starts and released when it ends
+        with notifier.stream_slot() as admitted:
+            if not admitted:
+                yield f"retry: {int(fallback_retry * 1000)}\n\n"
+                if is_ready():
+                    yield "event: ready\ndata: {}\n\n"
+                return
+            yield f"retry: {int(poll_interval * 1000)}\n\n"
+            deadline = time.monotonic() + max_duration
+            while True:
+                remaining = deadline - time.monotonic()
+                if notifier.wait(session_id, is_ready, min(keepalive_interval, max(remaining, 0)), poll_interval):
+                    yield "event: ready\ndata: {}\n\n"
+                    return
+                if remaining <= keepalive_interval:
+                    return
+                yield ": keepalive\n\n"
+
+    return Response(stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def handle_form_submission(session_id, evaluation_form):
     """
     Process the submitted form data.
 
-    This function extracts responses from the form, saves them to a JSON file,
-    and redirects to the thank you page.
+    This function extracts responses from the form, validates them against the
+    questionnaire, saves them to the result store, and redirects to the thank
+    you page. Fields of questions that are no longer in the questionnaire are
+    ignored.
+
+    The form itself is served from the signed token alone, but a submission
+    is only accepted while the session record exists: once the physio has
+    viewed the result the session is closed and further posts get 410, so
+    they cannot recreate (and re-archive) a result.
+
+    Submissions queued offline by the form script carry an ``Idempotency-Key``
+    header. A retry with a key that was already used for the session is
+    answered like the original without saving the responses again, even
+    after the session has been closed.
 
     Args:
         session_id (str): Unique identifier for the session.
+        evaluation_form (str): Type of evaluation form.
 
     Returns:
         Response: Redirect to the thank you page or an error message.
 
     Raises:
+        400: If the answers do not match the questionnaire.
+        404: If the evaluation form is unknown.
+        410: If the session has been closed.
         500: If an error occurs while saving the responses.
     """
-    try:
-        # Extract responses from the form data
-        responses = {key.split('_')[1]: int(value) for key, value in request.form.items() if key.startswith('question_')}
-        
-        result_directory = os.path.join('results')
-        if not os.path.exists(result_directory):
-            os.makedirs(result_directory)
-
-        result_file = os.path.join(result_directory, f'{session_id}.json')
+    schema = get_schema(evaluation_form)
+    if schema is None:
+        current_app.logger.warning("Submission for unknown evaluation form: %s", evaluation_form)
+        return "Form not found", 404
 
-        # Save responses to a JSON file
-        with open(result_file, 'w') as file:
-            json.dump(responses, file)
-        current_app.logger.info(f"Saved responses to {result_file}")
+    try:
+        # Extract and validate responses from the form data
+        answers = parse_responses(request.form)
+        unknown = schema.unknown(answers)
+        if unknown:
+            current_app.logger.warning("Ignoring unknown %s questions in session %s: %s",
+                                       evaluation_form, session_id, unknown)
+        responses = schema.validate(answers, require_all=False, ignore_unknown=True)
+    except ValidationError as e:
+        current_app.logger.warning("Invalid responses for session %s: %s", session_id, e)
+        return "The submitted answers are not valid for this questionnaire.", 400
+
+    key = request.headers.get('Idempotency-Key', '')
+    used_key = idempotency_key(session_id, key) if IDEMPOTENCY_KEY_RE.match(key) else None
+    claimed = None
+    try:
+        store = get_store()
+        if not store.exists(session_key(session_id)):
+            if used_key is not None and store.exists(used_key):
+                current_app.logger.info("Duplicate submission for closed session %s ignored", session_id)
+                return redirect(url_for('main.thank_you'))
+            current_app.logger.info("Submission for closed session %s rejected", session_id)
+            return "This questionnaire has already been submitted.", 410
+
+        if used_key is not None:
+            if not store.add(used_key, 1):
+                current_app.logger.info("Duplicate submission for session %s ignored", session_id)
+                return redirect(url_for('main.thank_you'))
+            claimed = used_key
+
+        # Save responses to the result store
+        store.put(result_key(session_id), responses)
+        current_app.logger.info("Saved responses for session %s", session_id)
+        get_notifier().publish(session_id)
+        trace(session_id, 'form_submitted', evaluation_form)
         
         return redirect(url_for('main.thank_you'))
     except Exception as e:
-        current_app.logger.error(f"Error saving responses: {str(e)}", exc_info=True)
+        current_app.logger.error("Error saving responses: %s", e, exc_info=True)
+        if claimed is not None:
+            # Let the client's retry save the responses
+            get_store().delete(claimed)
         return "An error occurred while saving your responses.", 500
 
-def render_questionnaire(session_id, evaluation_form):
+def render_questionnaire(token, session):
     """
     Render the appropriate questionnaire based on the evaluation form type.
 
-    This function loads the questionnaire data and renders the corresponding template.
+    This function loads the questionnaire data and serves the corresponding
+    template from the page cache, so the page is only rendered once per
+    questionnaire, language and template version; only the token in the form
+    action differs per patient. Pages that bypass the cache are streamed
+    section by section.
 
     Args:
-        session_id (str): Unique identifier for the session.
-        evaluation_form (str): Type of evaluation form.
+        token (str): The session token from the URL.
+        session (SessionToken): The verified session.
 
     Returns:
         str: Rendered HTML template for the questionnaire.
@@ -202,39 +449,51 @@ def render_questionnaire(session_id, evaluation_form):
         404: If the requested evaluation form is unknown.
         500: If an error occurs while loading the questionnaire data.
     """
-    if evaluation_form not in ['koos', 'hoos']:
-        logging.warning(f"Unknown evaluation form requested: {evaluation_form}")
+    evaluation_form = session.evaluation_form
+    if evaluation_form not in QUESTIONNAIRES:
+        current_app.logger.warning("Unknown evaluation form requested: %s", evaluation_form)
         return "Form not found", 404
 
     try:
-        data = load_questionnaire_data(evaluation_form, 'swedish')
+        data = load_questionnaire_data(evaluation_form, session.language)
         if not data['sections']:
-            logging.error(f"No sections found for {evaluation_form}")
+            current_app.logger.error("No sections found for %s", evaluation_form)
             return "An error occurred while loading the questionnaire.", 500
-        
-        return render_template(
-            f'questionnaires/{evaluation_form}/{evaluation_form}_swe.html',
-            session_id=session_id,
-            questionnaire_slug=evaluation_form,
-            questionnaire_title=QUESTIONNAIRES[evaluation_form]['name'],
-            instructions=data.get('instructions', 'Instruktioner saknas.'),
-            sections=data.get('sections', []),
-            evaluation_form=evaluation_form,
-            form_action=url_for('main.patient_form', session_id=session_id, evaluation_form=evaluation_form)
+        trace(session.session_id, 'form_opened', evaluation_form)
+
+        def make_context(page_token):
+            return dict(
+                offline=True,
+                questionnaire_slug=evaluation_form,
+                questionnaire_title=QUESTIONNAIRES[evaluation_form]['name'],
+                instructions=data.get('instructions', 'Instruktioner saknas.'),
+                sections=data.get('sections', []),
+                evaluation_form=evaluation_form,
+                optional_sections=get_plan(evaluation_form).optional_sections,
+                form_action=url_for('main.patient_form', token=page_token)
+            )
+
+        return get_page_cache().render(
+            questionnaire_template(evaluation_form),
+            make_context,
+            key=('main.patient_form', evaluation_form, session.language),
+            session_id=token,
         )
     except Exception as e:
-        logging.error(f"Error loading questionnaire data: {str(e)}")
+        current_app.logger.error("Error loading questionnaire data: %s", e)
         return "An error occurred while loading the questionnaire.", 500
 
-def process_results(result_file, session_id, evaluation_form):
+def process_results(responses, session_id, evaluation_form):
     """
     Process the results of a submitted questionnaire.
 
-    This function loads the responses, calculates scores, and renders the results.
-    It also cleans up temporary files after processing.
+    This function calculates scores from the consumed responses and renders the results.
+    If processing fails the responses are put back in the store so the result
+    can be viewed again. Scored results are appended to the outcome archive, a
+    PDF report is registered and the session record is removed after processing.
 
     Args:
-        result_file (str): Path to the file containing the responses.
+        responses (dict): The responses consumed from the result store.
         session_id (str): Unique identifier for the session.
         evaluation_form (str): Type of evaluation form.
 
@@ -246,89 +505,178 @@ def process_results(result_file, session_id, evaluation_form):
         500: If an error occurs during score calculation or result processing.
     """
     try:
-        with open(result_file, 'r') as file:
-            responses = json.load(file)
-        
-        current_app.logger.info(f"Loaded responses: {responses}")
+        current_app.logger.debug("Loaded %d responses for session %s", len(responses), session_id)
         
-        # Calculate scores based on the evaluation form type
-        if evaluation_form == 'koos':
-            current_app.logger.info("Calculating KOOS scores")
-            result = calculate_koos_scores(responses)
-        elif evaluation_form == 'hoos':
-            current_app.logger.info("Calculating HOOS scores")
-            result = calculate_hoos_scores(responses)
-        else:
-            current_app.logger.error(f"Unknown questionnaire type: {evaluation_form}")
+        # Calculate scores with the questionnaire's compiled scoring plan
+        plan = get_plan(evaluation_form)
+        if plan is None:
+            current_app.logger.error("Unknown questionnaire type: %s", evaluation_form)
             return "Unknown questionnaire type", 400
+        with timer('score'):
+            result = plan.score(responses)
         
-        current_app.logger.info(f"Calculated result: {result}")
+        current_app.logger.debug("Calculated result: %s", result)
         
         if result is None:
             current_app.logger.error("Calculation returned None")
+            get_store().put(result_key(session_id), responses)
             return "Error in score calculation", 500
+        trace(session_id, 'result_scored', evaluation_form)
 
-        # Clean up temporary files
-        os.remove(result_file)
-        current_app.logger.info(f"Removed result file: {result_file}")
-        
-        qr_path = os.path.join('app', 'static', 'qr_codes', f'{session_id}.png')
-        if os.path.exists(qr_path):
-            os.remove(qr_path)
-            current_app.logger.info(f"Removed QR code image: {qr_path}")
+        archive_result(session_id, evaluation_form, responses, result)
+        report_id = request_report(evaluation_form, responses, result)
+
+        # Clean up the session record
+        get_store().delete(session_key(session_id))
         
-        return render_template('display_result.html', result=result)
+        html = render_template('display_result.html', result=result, report_id=report_id)
+        trace(session_id, 'result_viewed', evaluation_form)
+        return html
     except Exception as e:
-        current_app.logger.error(f"Error processing results: {str(e)}", exc_info=True)
+        current_app.logger.error("Error processing results: %s", e, exc_info=True)
+        get_store().put(result_key(session_id), responses)
         return "An error occurred while processing your results.", 500
 
+def archive_result(session_id, evaluation_form, responses, result):
+    """
+    Append a scored submission to the outcome archive.
+
+    Failures are logged and do not prevent the result from being shown.
+
+    Args:
+        session_id (str): Unique identifier for the session.
+        evaluation_form (str): Type of evaluation form.
+        responses (dict): The submitted responses.
+        result (dict): The scoring result.
+    """
+    try:
+        session = get_store().get(session_key(session_id)) or {}
+        with timer('archive_append'):
+            get_archive().append(evaluation_form, responses, result,
+                                 clinic=session.get('k', ''), patient_key=session.get('p', ''))
+    except Exception as e:
+        current_app.logger.error("Error archiving result for session %s: %s", session_id, e, exc_info=True)
+
+def parse_responses(form):
+    """
+    Extract questionnaire answers from submitted form data.
+
+    Fields are named ``question_<id>``. Numeric answers are converted to int;
+    yes/no and free-text answers are kept as stripped strings and are not
+    scored. Empty fields are left out.
+
+    Args:
+        form (MultiDict): The submitted form.
+
+    Returns:
+        dict: Question ID to answer value.
+    """
+    responses = {}
+    for key, value in form.items():
+        if not key.startswith('question_'):
+            continue
+        value = value.strip()
+        if not value:
+            continue
+        responses[key[len('question_'):]] = int(value) if value.lstrip('-').isdigit() else value
+    return responses
+
+def questionnaire_template(questionnaire):
+    """
+    Return the template of a questionnaire.
+
+    A questionnaire can name its template with the ``template`` key in
+    ``QUESTIONNAIRES``; otherwise ``<slug>_swe.html`` is used. Templates live
+    in ``questionnaires/<slug>/``.
+
+    Args:
+        questionnaire (str): Questionnaire slug.
+
+    Returns:
+        str: The template name.
+    """
+    filename = QUESTIONNAIRES[questionnaire].get('template', f'{questionnaire}_swe.html')
+    return f'questionnaires/{questionnaire}/{filename}'
+
+def create_sessions(evaluation_forms, clinic='', patient=''):
+    """
+    Register new patient sessions in one store write.
+
+    Args:
+        evaluation_forms (list): Questionnaire slug of each session.
+        clinic (str, optional): Clinic tag for the outcome archive.
+        patient (str, optional): Patient identifier; only its pseudonym is stored.
+
+    Returns:
+        list: ``(session_id, session)`` pairs in the order of
+        ``evaluation_forms``, where ``session`` is the stored session record.
+
+    Raises:
+        PseudonymKeyMissing: If a patient is given but no
+            ``ARCHIVE_PSEUDONYM_KEY`` is configured.
+    """
+    created = int(time.time())
+    clinic = clinic.strip()[:32]
+    patient = patient.strip()
+    pseudonym = get_archive().pseudonymize(clinic, patient) if patient else None
+    created_sessions = []
+    for evaluation_form in evaluation_forms:
+        session = {'f': evaluation_form, 'c': created}
+        if clinic:
+            session['k'] = clinic
+        if pseudonym:
+            session['p'] = pseudonym
+        created_sessions.append((str(uuid.uuid4()), session))
+    get_store().put_many({session_key(session_id): session for session_id, session in created_sessions})
+    for session_id, session in created_sessions:
+        trace(session_id, 'qr_generated', session['f'])
+    return created_sessions
+
+def session_token(session_id, session):
+    """
+    Return the signed token of a session, valid as long as its store record.
+
+    Args:
+        session_id (str): Unique identifier for the session.
+        session (dict): The session record created by ``create_sessions``.
+
+    Returns:
+        str: The token used in the patient form URL.
+    """
+    expires = session['c'] + current_app.config['SESSION_TTL']
+    return get_session_tokens().mint(session_id, session['f'], expires, clinic=session.get('k', ''))
+
+def patient_form_url(session_id, session):
+    """
+    Build the absolute patient form URL that a session's QR code points to.
+
+    Args:
+        session_id (str): Unique identifier for the session.
+        session (dict): The session record created by ``create_sessions``.
+
+    Returns:
+        str: The patient form URL joined onto BASE_URL.
+    """
+    relative_url = url_for('main.patient_form', token=session_token(session_id, session))
+    return urljoin(current_app.config['BASE_URL'], relative_url)
+
 def load_questionnaire_data(questionnaire, language='swedish'):
     """
-    Load questionnaire data from a JSON file.
+    Return questionnaire data from the in-memory questionnaire registry.
 
-    This function reads the questionnaire data, processes it, and returns a structured format.
+    The registry is built once in ``create_app`` and holds compiled, read-only
+    questionnaires, so no file I/O or JSON decoding happens per request.
 
     Args:
         questionnaire (str): Type of questionnaire to load.
         language (str, optional): Language of the questionnaire. Defaults to 'swedish'.
 
     Returns:
-        dict: A dictionary containing the questionnaire instructions and sections.
-
-    Raises:
-        FileNotFoundError: If the questionnaire data file is not found.
-        json.JSONDecodeError: If there's an error decoding the JSON data.
-        Exception: For any other unexpected errors during data loading.
+        Mapping: The questionnaire instructions and sections. Sections are empty
+        if the questionnaire is unknown or failed to compile.
     """
-    filename = f'{questionnaire}_{language}.json'
-    filepath = os.path.join('data', filename)
-    logging.info(f"Attempting to load questionnaire data from: {filepath}")
-    try:
-        with open(filepath, 'r', encoding='utf-8') as file:
-            data = json.load(file)
-        
-        # Handle case where data is a list (first item is used)
-        if isinstance(data, list):
-            data = data[0]
-        
-        instructions = data.get('instructions', 'Instruktioner saknas.')
-        sections = data.get('sections', [])
-        
-        # Process questions in each section
-        for section in sections:
-            section['questions'] = [
-                q if isinstance(q, dict) and 'id' in q
-                else {'type': 'instructions', 'text': q['text']}
-                for q in section.get('questions', [])
-            ]
-        
-        return {"instructions": instructions, "sections": sections}
-    except FileNotFoundError:
-        logging.error(f"{questionnaire.upper()} data file not found: {filepath}")
-        return {"instructions": "Instructions not available.", "sections": []}
-    except json.JSONDecodeError as e:
-        logging.error(f"Error decoding JSON for {questionnaire}: {e}")
-        return {"instructions": "Instructions not available.", "sections": []}
-    except Exception as e:
-        logging.error(f"Unexpected error loading {questionnaire} data: {str(e)}")
+    data = get_registry().get(questionnaire, language)
+    if data is None:
+        current_app.logger.error("%s questionnaire not found in registry for language: %s", questionnaire.upper(), language)
         return {"instructions": "Instructions not available.", "sections": []}
+    return data
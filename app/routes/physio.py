@@ -1,5 +1,15 @@
-from flask import Blueprint, render_template
+import hmac
+import time
+from urllib.parse import urljoin
+from flask import Blueprint, render_template, Response, abort, current_app, jsonify, request, url_for
 from app.questionnaires_config import QUESTIONNAIRES
+from app.routes.main import create_sessions, patient_form_url
+from app.utils.dashboard import CLOSED, WAITING, forget_sessions, session_statuses, tracked_sessions
+from app.utils.metrics import timer
+from app.utils.outcome_archive import get_archive
+from app.utils.qr import get_qr_renderer
+from app.utils.qr_sheet import pdf_sheet, zip_sheet
+from app.utils.reports import JOB_ID_RE, DONE, PENDING, REQUESTED, get_report_service
 
 bp = Blueprint('physio', __name__)
 
@@ -7,4 +17,232 @@ bp = Blueprint('physio', __name__)
 def physio():
     return render_template('physio.html', questionnaires=QUESTIONNAIRES, show_navbar=True)
 
-# Add other physio-related routes here if needed
\ No newline at end of file
+def dashboard_statuses():
+    """
+    Return the states of the current physio's sessions, newest first.
+
+    Closed sessions are reported once and then removed from the dashboard.
+    """
+    statuses = session_statuses(tracked_sessions()[::-1])
+    forget_sessions(status['session_id'] for status in statuses if status['state'] == CLOSED)
+    return statuses
+
+@bp.route('/dashboard')
+def dashboard():
+    """
+    List all sessions the physio has created and is waiting on.
+
+    The page refreshes every session through ``dashboard_status`` instead of
+    keeping one waiting page per patient open.
+
+    Returns:
+        str: Rendered HTML template for the dashboard.
+    """
+    statuses = [status for status in dashboard_statuses() if status['state'] != CLOSED]
+    response = Response(render_template('dashboard.html', sessions=statuses, now=time.time(),
+                                        show_navbar=True))
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/dashboard/status')
+def dashboard_status():
+    """
+    Return the state of every session on the dashboard in one response.
+
+    All session records and results are read with one store query, so the
+    dashboard makes one request per refresh however many patients are
+    filling in forms. Ready sessions carry an inline score summary.
+
+    Returns:
+        Response: JSON with the ``sessions``, the number still ``waiting``
+        and the ``poll_interval`` in seconds.
+    """
+    statuses = dashboard_statuses()
+    response = jsonify(sessions=statuses,
+                       waiting=sum(status['state'] == WAITING for status in statuses),
+                       poll_interval=current_app.config['DASHBOARD_POLL_INTERVAL'])
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/qr_sheet')
+def qr_sheet():
+    """
+    Create many patient sessions at once and stream their QR codes.
+
+    Query arguments name a questionnaire slug and how many sessions to create
+    for it (``?koos=40&hoos=20``). ``format`` is 'pdf' (default, a printable
+    A4 sheet), 'png' or 'svg' (a ZIP of images); ``clinic`` tags the sessions
+    for the outcome archive. All sessions are registered with one store write
+    before the first byte is sent.
+
+    Returns:
+        Response: The streamed PDF or ZIP file.
+    """
+    fmt = request.args.get('format', 'pdf')
+    if fmt not in ('pdf', 'png', 'svg'):
+        return "Unknown format.", 400
+    limit = current_app.config['QR_SHEET_MAX_SESSIONS']
+    evaluation_forms = []
+    for slug in QUESTIONNAIRES:
+        count = request.args.get(slug, 0, type=int)
+        if count < 0:
+            return "Counts must not be negative.", 400
+        # Check the total before building the list, so huge counts cost nothing
+        if count > limit - len(evaluation_forms):
+            return f"At most {limit} sessions per sheet.", 400
+        evaluation_forms.extend([slug] * count)
+    if not evaluation_forms:
+        return "No sessions requested.", 400
+
+    clinic = request.args.get('clinic', '').strip()[:32]
+    base_url = current_app.config['BASE_URL']
+    entries = [{
+        'session_id': session_id,
+        'evaluation_form': session['f'],
+        'name': QUESTIONNAIRES[session['f']]['name'],
+        'form_url': patient_form_url(session_id, session),
+        'result_url': urljoin(base_url, url_for('main.wait_for_result', session_id=session_id,
+                                                evaluation_form=session['f'])),
+    } for session_id, session in create_sessions(evaluation_forms, clinic)]
+    current_app.logger.info("Created %d sessions for a %s QR sheet", len(entries), fmt)
+
+    renderer = get_qr_renderer()
+    urls = [entry['form_url'] for entry in entries]
+    title = f"PhysioEngine {time.strftime('%Y-%m-%d')}" + (f" - {clinic}" if clinic else '')
+
+    def generate():
+        with timer('qr_sheet'):
+            if fmt == 'pdf':
+                yield from pdf_sheet(entries, renderer.encode_many(urls, 'matrix'), title)
+            else:
+                yield from zip_sheet(entries, renderer.encode_many(urls, fmt), fmt)
+
+    filename = f"qr-{time.strftime('%Y%m%d-%H%M')}.{'pdf' if fmt == 'pdf' else 'zip'}"
+    mimetype = 'application/pdf' if fmt == 'pdf' else 'application/zip'
+    response = Response(generate(), mimetype=mimetype,
+                        headers={'Content-Disposition': f'attachment; filename={filename}'})
+    response.cache_control.no_store = True
+    return response
+
+def require_export_token():
+    """
+    Allow access to archived outcomes only with the configured bearer token.
+
+    Raises:
+        404: If no ARCHIVE_EXPORT_TOKEN is configured.
+        401: If the request does not carry the token.
+    """
+    token = current_app.config.get('ARCHIVE_EXPORT_TOKEN')
+    if not token:
+        abort(404)
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                               f'Bearer {token}'.encode('utf-8')):
+        abort(401)
+
+@bp.route('/outcomes/<questionnaire>/summary')
+def outcome_summary(questionnaire):
+    """
+    Return running outcome aggregates from the archive, overall and per clinic.
+
+    Args:
+        questionnaire (str): Questionnaire slug.
+
+    Returns:
+        Response: JSON with ``overall`` and ``clinics`` summaries.
+    """
+    require_export_token()
+    if questionnaire not in QUESTIONNAIRES:
+        abort(404)
+    archive = get_archive()
+    return jsonify(overall=archive.aggregates(questionnaire), clinics=archive.clinic_summaries(questionnaire))
+
+@bp.route('/outcomes/<questionnaire>.<any(ndjson, csv):fmt>')
+def export_outcomes(questionnaire, fmt):
+    """
+    Stream archived submissions of a questionnaire as NDJSON or CSV.
+
+    Query arguments ``clinic`` and ``since`` (Unix time) filter the rows.
+
+    Args:
+        questionnaire (str): Questionnaire slug.
+        fmt (str): 'ndjson' or 'csv'.
+
+    Returns:
+        Response: A streamed export.
+    """
+    require_export_token()
+    if questionnaire not in QUESTIONNAIRES:
+        abort(404)
+    rows = get_archive().export(questionnaire, fmt, clinic=request.args.get('clinic'),
+                                since=request.args.get('since', type=float))
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(rows, mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename={questionnaire}.{fmt}'})
+
+def lookup_report(report_id):
+    """
+    Return the report service for a well-formed report ID.
+
+    Raises:
+        404: If reports are disabled or the ID is malformed.
+    """
+    service = get_report_service()
+    if service is None or not JOB_ID_RE.match(report_id):
+        abort(404)
+    return service
+
+@bp.route('/reports/<report_id>', methods=['GET', 'POST'])
+def report_status(report_id):
+    """
+    Return the status of a PDF report job; a POST starts rendering it.
+
+    Args:
+        report_id (str): The report ID shown on the result page.
+
+    Returns:
+        Response: JSON with ``status`` ('requested', 'pending', 'done' or
+        'failed') and, once done, the ``url`` of the PDF.
+
+    Raises:
+        404: If the report is unknown or has expired.
+    """
+    service = lookup_report(report_id)
+    status = service.render(report_id) if request.method == 'POST' else service.status(report_id)
+    if status is None:
+        abort(404)
+    body = {'status': status}
+    if status == DONE:
+        body['url'] = url_for('physio.report_pdf', report_id=report_id)
+    response = jsonify(body)
+    response.cache_control.no_store = True
+    return response
+
+@bp.route('/reports/<report_id>.pdf')
+def report_pdf(report_id):
+    """
+    Serve a finished PDF report, starting to render it on the first request.
+
+    Args:
+        report_id (str): The report ID.
+
+    Returns:
+        Response: The PDF, or 202 with Retry-After while it is being rendered.
+
+    Raises:
+        404: If the report is unknown, failed or has expired.
+    """
+    service = lookup_report(report_id)
+    body = service.get(report_id)
+    if body is None:
+        status = service.status(report_id)
+        if status == REQUESTED:
+            status = service.render(report_id)
+        if status == PENDING:
+            return Response("Rapporten skapas, försök igen om en stund.", status=202,
+                            headers={'Retry-After': '2'}, mimetype='text/plain')
+        abort(404)
+    response = Response(body, mimetype='application/pdf',
+                        headers={'Content-Disposition': f'inline; filename=rapport-{report_id[:8]}.pdf'})
+    response.cache_control.private = True
+    response.cache_control.max_age = current_app.config['REPORT_TTL']
+    return response
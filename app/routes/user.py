@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, abort, request, current_app, url_for, redirect
 from app.questionnaires_config import QUESTIONNAIRES
-from app.utils.hoos_calculator import calculate_hoos_scores
-from app.utils.koos_calculator import calculate_koos_scores
-from app.routes.main import load_questionnaire_data
+from app.utils.scoring import get_plan
+from app.routes.main import load_questionnaire_data, parse_responses, questionnaire_template
+from app.utils.metrics import timer
+from app.utils.page_cache import get_page_cache
+from app.utils.reports import request_report
+from app.utils.validation import ValidationError, get_schema
 import logging
 
 bp = Blueprint('user', __name__)
@@ -32,38 +35,41 @@ def fill_questionnaire(questionnaire_slug):
         404: If the questionnaire slug is invalid.
         500: If an error occurs while loading or processing the questionnaire.
     """
-    current_app.logger.info(f"Accessed fill_questionnaire with slug: {questionnaire_slug}, method: {request.method}")
+    current_app.logger.debug("Accessed fill_questionnaire with slug: %s, method: %s", questionnaire_slug, request.method)
     
     if questionnaire_slug not in QUESTIONNAIRES:
-        current_app.logger.error(f"Invalid questionnaire slug: {questionnaire_slug}")
+        current_app.logger.error("Invalid questionnaire slug: %s", questionnaire_slug)
         abort(404)
     
     if request.method == 'POST':
-        current_app.logger.info(f"POST request received for {questionnaire_slug}")
-        current_app.logger.info(f"Form data: {request.form}")
+        current_app.logger.debug("POST request received for %s", questionnaire_slug)
         return handle_user_form_submission(questionnaire_slug)
     
     try:
         questionnaire_data = load_questionnaire_data(questionnaire_slug, 'swedish')
         if not questionnaire_data['sections']:
-            current_app.logger.error(f"No sections found for {questionnaire_slug}")
+            current_app.logger.error("No sections found for %s", questionnaire_slug)
             return "An error occurred while loading the questionnaire.", 500
         
-        template = f'questionnaires/{questionnaire_slug}/{questionnaire_slug}_swe.html'
+        template = questionnaire_template(questionnaire_slug)
         form_action = url_for('user.fill_questionnaire', questionnaire_slug=questionnaire_slug)
-        current_app.logger.info(f"Rendering template: {template} with form_action: {form_action}")
+        current_app.logger.debug("Rendering template: %s with form_action: %s", template, form_action)
         
-        return render_template(
-            template,
-            questionnaire_slug=questionnaire_slug,
-            questionnaire_title=QUESTIONNAIRES[questionnaire_slug]['name'],
-            instructions=questionnaire_data['instructions'],
-            sections=questionnaire_data['sections'],
-            evaluation_form=questionnaire_slug,
-            form_action=form_action
-        )
+        def make_context(session_id):
+            return dict(
+                questionnaire_slug=questionnaire_slug,
+                questionnaire_title=QUESTIONNAIRES[questionnaire_slug]['name'],
+                instructions=questionnaire_data['instructions'],
+                sections=questionnaire_data['sections'],
+                evaluation_form=questionnaire_slug,
+                optional_sections=get_plan(questionnaire_slug).optional_sections,
+                form_action=form_action
+            )
+
+        # The page has no per-user parts, so it is rendered once and served precompressed
+        return get_page_cache().render(template, make_context, key=('user.fill_questionnaire', questionnaire_slug, 'swedish'))
     except Exception as e:
-        current_app.logger.error(f"Error in fill_questionnaire: {str(e)}", exc_info=True)
+        current_app.logger.error("Error in fill_questionnaire: %s", e, exc_info=True)
         return "An error occurred while loading the questionnaire.", 500
 
 def handle_user_form_submission(questionnaire_slug):
@@ -77,27 +83,35 @@ def handle_user_form_submission(questionnaire_slug):
         str: Rendered HTML template displaying the questionnaire results.
 
     Raises:
-        400: If the questionnaire type is unknown.
+        400: If the questionnaire type is unknown or the answers do not match it.
         500: If an error occurs while processing the responses.
     """
-    current_app.logger.info(f"Handling form submission for {questionnaire_slug}")
+    current_app.logger.debug("Handling form submission for %s", questionnaire_slug)
     try:
-        # Extract responses from the form data
-        responses = {key.split('_')[1]: int(value) for key, value in request.form.items() if key.startswith('question_')}
-        current_app.logger.info(f"Received responses: {responses}")
+        # Extract and validate responses from the form data
+        answers = parse_responses(request.form)
+        current_app.logger.debug("Received responses: %s", answers)
+        schema = get_schema(questionnaire_slug)
         
-        # Calculate scores based on the questionnaire type
-        if questionnaire_slug == 'koos':
-            result = calculate_koos_scores(responses)
-        elif questionnaire_slug == 'hoos':
-            result = calculate_hoos_scores(responses)
-        else:
-            current_app.logger.error(f"Unknown questionnaire type: {questionnaire_slug}")
+        # Calculate scores with the questionnaire's compiled scoring plan
+        plan = get_plan(questionnaire_slug)
+        if plan is None or schema is None:
+            current_app.logger.error("Unknown questionnaire type: %s", questionnaire_slug)
             return "Unknown questionnaire type", 400
+        unknown = schema.unknown(answers)
+        if unknown:
+            current_app.logger.warning("Ignoring unknown %s questions: %s", questionnaire_slug, unknown)
+        responses = schema.validate(answers, require_all=False, ignore_unknown=True)
+        with timer('score'):
+            result = plan.score(responses)
         
-        current_app.logger.info(f"Calculated result: {result}")
+        current_app.logger.debug("Calculated result: %s", result)
         
-        return render_template('display_result.html', result=result, show_navbar=True)
+        report_id = request_report(questionnaire_slug, responses, result)
+        return render_template('display_result.html', result=result, report_id=report_id, show_navbar=True)
+    except ValidationError as e:
+        current_app.logger.warning("Invalid responses for %s: %s", questionnaire_slug, e)
+        return "The submitted answers are not valid for this questionnaire.", 400
     except Exception as e:
-        current_app.logger.error(f"Error in handle_user_form_submission: {str(e)}", exc_info=True)
+        current_app.logger.error("Error in handle_user_form_submission: %s", e, exc_info=True)
         return "An error occurred while processing your responses.", 500
\ No newline at end of file
@@ -0,0 +1,118 @@
+// Refreshes the physio dashboard: one status request returns the state of
+// every session, so the page polls once however many patients are answering.
+// Polling stops while nobody is waiting and pauses while the tab is hidden.
+document.addEventListener('DOMContentLoaded', function() {
+    var dashboard = document.getElementById('dashboard');
+    if (!dashboard || !window.fetch) {
+        return;
+    }
+    var tbody = document.getElementById('dashboard-sessions');
+    var empty = document.getElementById('dashboard-empty');
+    var pollInterval = parseFloat(dashboard.dataset.pollInterval) * 1000;
+    var timer = null;
+    var loading = false;
+
+    function cell(row, content) {
+        var td = document.createElement('td');
+        if (content) {
+            td.appendChild(content);
+        }
+        row.appendChild(td);
+        return td;
+    }
+
+    function element(tag, className, text) {
+        var el = document.createElement(tag);
+        el.className = className;
+        el.textContent = text;
+        return el;
+    }
+
+    function ago(created) {
+        return Math.max(0, Math.floor((Date.now() / 1000 - created) / 60)) + ' min ago';
+    }
+
+    function summary(session) {
+        var container = document.createElement('div');
+        if (!session.summary) {
+            return container;
+        }
+        if (session.summary.total_score !== null) {
+            container.appendChild(element('strong', '', String(session.summary.total_score)));
+            container.appendChild(document.createTextNode(' '));
+        }
+        container.appendChild(document.createTextNode(session.summary.interpretation || ''));
+        container.appendChild(element('div', 'small text-muted', session.summary.sections.map(function(section) {
+            return section.name + ' ' + section.score;
+        }).join(' · ')));
+        return container;
+    }
+
+    function render(sessions) {
+        var rows = document.createDocumentFragment();
+        sessions.forEach(function(session) {
+            if (session.state === 'closed') {
+                return;
+            }
+            var ready = session.state === 'ready';
+            var row = document.createElement('tr');
+            row.dataset.sessionId = session.session_id;
+            cell(row, document.createTextNode(session.name));
+            cell(row, document.createTextNode(ago(session.created))).dataset.created = session.created;
+            cell(row, element('span', ready ? 'badge bg-success' : 'badge bg-secondary', ready ? 'Submitted' : 'Waiting'));
+            cell(row, ready ? summary(session) : null);
+            var link = element('a', ready ? 'btn btn-primary btn-sm' : 'btn btn-outline-secondary btn-sm',
+                               ready ? 'Open result' : 'Show QR code');
+            link.href = session.result_url;
+            cell(row, link);
+            rows.appendChild(row);
+        });
+        tbody.replaceChildren(rows);
+        empty.hidden = tbody.children.length > 0;
+    }
+
+    function schedule(delay) {
+        clearTimeout(timer);
+        timer = setTimeout(poll, delay);
+    }
+
+    function poll() {
+        timer = null;
+        if (document.hidden || loading) {
+            return;  // Resumed by visibilitychange
+        }
+        loading = true;
+        fetch(dashboard.dataset.statusUrl, {credentials: 'same-origin'})
+            .then(function(response) {
+                if (!response.ok) {
+                    throw new Error('Status request failed: ' + response.status);
+                }
+                return response.json();
+            })
+            .then(function(status) {
+                loading = false;
+                render(status.sessions);
+                pollInterval = status.poll_interval * 1000;
+                if (status.waiting > 0) {
+                    schedule(pollInterval);
+                }
+            })
+            .catch(function() {
+                loading = false;
+                schedule(pollInterval * 2);
+            });
+    }
+
+    document.addEventListener('visibilitychange', function() {
+        if (!document.hidden && timer === null) {
+            poll();
+        }
+    });
+    // Sessions created in another tab show up when the dashboard is revisited
+    window.addEventListener('focus', function() {
+        if (timer === null) {
+            poll();
+        }
+    });
+    poll();
+});
@@ -0,0 +1,265 @@
+// Questionnaire form behaviour: checks that every question is answered, keeps
+// a draft of the answers on the device, and on patient forms (data-offline)
+// submits through a queue that is retried until the server has the answers.
+// Queued submissions carry an Idempotency-Key so a retry is never saved twice.
+(function() {
+    var script = document.currentScript;
+    var DRAFT_PREFIX = 'physioengine:draft:';
+    var QUEUE_KEY = 'physioengine:queue';
+    var RETRY_MIN = 5000;
+    var RETRY_MAX = 60000;
+    var retryDelay = RETRY_MIN;
+    var retryTimer = null;
+    var sending = false;
+    var flushAgain = false;
+    // Action URL of the form submitted on this page, if any
+    var submittedUrl = null;
+
+    function storage() {
+        try {
+            return window.localStorage;
+        } catch (e) {
+            return null;  // Disabled, e.g. in some private browsing modes
+        }
+    }
+
+    function readJSON(key, fallback) {
+        var store = storage();
+        try {
+            var value = store && store.getItem(key);
+            return value ? JSON.parse(value) : fallback;
+        } catch (e) {
+            return fallback;
+        }
+    }
+
+    function writeJSON(key, value) {
+        var store = storage();
+        try {
+            if (store) {
+                store.setItem(key, JSON.stringify(value));
+            }
+        } catch (e) {
+            // Storage full; the form still works online
+        }
+    }
+
+    function removeItem(key) {
+        var store = storage();
+        if (store) {
+            store.removeItem(key);
+        }
+    }
+
+    function newKey() {
+        if (window.crypto && crypto.randomUUID) {
+            return crypto.randomUUID();
+        }
+        var bytes = new Uint8Array(16);
+        crypto.getRandomValues(bytes);
+        return Array.prototype.map.call(bytes, function(b) { return ('0' + b.toString(16)).slice(-2); }).join('');
+    }
+
+    // Drafts
+
+    function saveDraft(form) {
+        var answers = {};
+        new FormData(form).forEach(function(value, name) {
+            answers[name] = value;
+        });
+        writeJSON(DRAFT_PREFIX + form.action, answers);
+    }
+
+    function restoreDraft(form) {
+        var answers = readJSON(DRAFT_PREFIX + form.action, null);
+        if (!answers) {
+            return;
+        }
+        Array.prototype.forEach.call(form.elements, function(field) {
+            if (!field.name || !(field.name in answers)) {
+                return;
+            }
+            if (field.type === 'radio' || field.type === 'checkbox') {
+                field.checked = field.value === answers[field.name];
+            } else {
+                field.value = answers[field.name];
+            }
+        });
+    }
+
+    // Validation (unchanged from the inline script it replaces)
+
+    function highlightUnanswered(form) {
+        var questions = form.querySelectorAll('.question');
+        var unansweredQuestions = [];
+
+        questions.forEach(function(question) {
+            var radios = question.querySelectorAll('input[type="radio"]');
+            var answered = Array.from(radios).some(function(radio) { return radio.checked; });
+            if (!answered) {
+                unansweredQuestions.push(question);
+            }
+        });
+
+        if (unansweredQuestions.length === 0) {
+            return true;
+        }
+
+        // Remove previous highlights and warnings
+        document.querySelectorAll('.unanswered-highlight').forEach(function(el) {
+            el.classList.remove('unanswered-highlight');
+            var warningMsg = el.querySelector('.alert-warning');
+            if (warningMsg) {
+                warningMsg.remove();
+            }
+        });
+
+        unansweredQuestions.forEach(function(question, index) {
+            question.classList.add('unanswered-highlight');
+
+            var warningMsg = document.createElement('div');
+            warningMsg.className = 'alert alert-warning mt-2';
+            warningMsg.innerHTML = '<strong>Please note:</strong> This question is not answered.';
+            question.appendChild(warningMsg);
+
+            if (index === 0) {
+                question.scrollIntoView({behavior: "smooth", block: "center"});
+            }
+        });
+
+        alert('Please answer all the questions before submitting. ' + unansweredQuestions.length + ' question(s) are unanswered.');
+        return false;
+    }
+
+    // Submission queue
+
+    function showStatus(message, kind) {
+        var status = document.getElementById('submission-status');
+        if (!status) {
+            return;
+        }
+        status.className = 'alert alert-' + kind;
+        status.textContent = message;
+    }
+
+    function dequeue(url) {
+        writeJSON(QUEUE_KEY, readJSON(QUEUE_KEY, []).filter(function(entry) { return entry.url !== url; }));
+    }
+
+    function enqueue(url, body) {
+        var queue = readJSON(QUEUE_KEY, []);
+        var previous = queue.filter(function(entry) { return entry.url === url; })[0];
+        // A form submitted again keeps its key: the server may already have the first attempt
+        var entry = {url: url, body: body, key: previous ? previous.key : newKey()};
+        writeJSON(QUEUE_KEY, queue.filter(function(other) { return other.url !== url; }).concat([entry]));
+        return entry;
+    }
+
+    function send(entry) {
+        return fetch(entry.url, {
+            method: 'POST',
+            body: entry.body,
+            credentials: 'same-origin',
+            headers: {
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'Idempotency-Key': entry.key
+            }
+        }).then(function(response) {
+            // Server errors and rate limits are retried; anything else is final
+            var retry = response.status >= 500 || response.status === 408 || response.status === 429;
+            if (!retry) {
+                dequeue(entry.url);
+                // 410: the session is closed, so the draft can never be sent
+                if (response.ok || response.status === 410) {
+                    removeItem(DRAFT_PREFIX + entry.url);
+                }
+            }
+            return {response: response, retry: retry};
+        }, function() {
+            return {response: null, retry: true};
+        });
+    }
+
+    function scheduleRetry() {
+        if (retryTimer === null) {
+            retryTimer = setTimeout(function() {
+                retryTimer = null;
+                flushQueue();
+            }, retryDelay);
+            retryDelay = Math.min(retryDelay * 2, RETRY_MAX);
+        }
+    }
+
+    // Sends every queued submission, including ones left by earlier visits
+    function flushQueue() {
+        if (sending) {
+            flushAgain = true;
+            return;
+        }
+        var queue = readJSON(QUEUE_KEY, []);
+        if (queue.length === 0) {
+            return;
+        }
+        sending = true;
+        var pending = false;
+        queue.reduce(function(previous, entry) {
+            return previous.then(function() {
+                return send(entry).then(function(outcome) {
+                    pending = pending || outcome.retry;
+                    if (entry.url !== submittedUrl) {
+                        return;
+                    }
+                    if (outcome.response && outcome.response.ok) {
+                        window.location.assign(outcome.response.url);
+                    } else if (outcome.retry) {
+                        showStatus('Ingen anslutning just nu. Dina svar är sparade på enheten och skickas '
+                            + 'automatiskt så snart anslutningen är tillbaka. Stäng inte sidan.', 'warning');
+                    } else {
+                        showStatus('Svaren kunde inte skickas. Kontrollera svaren och försök igen.', 'danger');
+                    }
+                });
+            });
+        }, Promise.resolve()).then(function() {
+            sending = false;
+            if (flushAgain) {
+                flushAgain = false;
+                flushQueue();
+            } else if (pending) {
+                scheduleRetry();
+            } else {
+                retryDelay = RETRY_MIN;
+            }
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function() {
+        var form = document.getElementById('questionnaireForm');
+
+        if (script.dataset.serviceWorker && 'serviceWorker' in navigator) {
+            navigator.serviceWorker.register(script.dataset.serviceWorker).catch(function() {});
+        }
+
+        if (form) {
+            restoreDraft(form);
+            form.addEventListener('change', function() { saveDraft(form); });
+
+            form.addEventListener('submit', function(e) {
+                if (!highlightUnanswered(form)) {
+                    e.preventDefault();
+                    return;
+                }
+                if (form.dataset.offline !== 'true' || !window.fetch || !storage()) {
+                    return;  // Plain form submission
+                }
+                e.preventDefault();
+                submittedUrl = form.action;
+                enqueue(form.action, new URLSearchParams(new FormData(form)).toString());
+                showStatus('Skickar dina svar…', 'info');
+                flushQueue();
+            });
+        }
+
+        window.addEventListener('online', function() { flushQueue(); });
+        flushQueue();
+    });
+})();
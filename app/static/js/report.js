@@ -0,0 +1,52 @@
+// Renders the result's PDF report when the download link is clicked, polls
+// its status and opens the report once it has been rendered.
+document.addEventListener('DOMContentLoaded', function() {
+    var report = document.getElementById('report');
+    if (!report || !window.fetch) {
+        return;
+    }
+    var link = document.getElementById('report-link');
+    var state = document.getElementById('report-state');
+    var statusUrl = report.dataset.statusUrl;
+    var busy = false;
+    var attempts = 0;
+
+    function check(method) {
+        attempts += 1;
+        fetch(statusUrl, {method: method, credentials: 'same-origin'})
+            .then(function(response) {
+                return response.ok ? response.json() : {status: 'failed'};
+            })
+            .then(function(job) {
+                if (job.status === 'done') {
+                    busy = false;
+                    state.textContent = '';
+                    link.classList.remove('disabled');
+                    window.location.href = job.url;
+                } else if ((job.status === 'pending' || job.status === 'requested') && attempts < 60) {
+                    setTimeout(function() { check('GET'); }, 1000);
+                } else {
+                    busy = false;
+                    link.classList.remove('disabled');
+                    state.textContent = 'Rapporten kunde inte skapas.';
+                }
+            })
+            .catch(function() {
+                if (attempts < 60) {
+                    setTimeout(function() { check('GET'); }, 2000);
+                }
+            });
+    }
+
+    link.addEventListener('click', function(event) {
+        event.preventDefault();
+        if (busy) {
+            return;
+        }
+        busy = true;
+        attempts = 0;
+        link.classList.add('disabled');
+        state.textContent = 'Rapporten skapas...';
+        check('POST');
+    });
+});
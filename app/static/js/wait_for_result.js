@@ -0,0 +1,21 @@
+// Waits for the patient's submission on a single server-sent events connection
+// and opens the result page as soon as the server reports it is ready.
+document.addEventListener('DOMContentLoaded', function() {
+    var status = document.getElementById('result-status');
+    if (!status) {
+        return;
+    }
+    var resultUrl = status.dataset.resultUrl;
+
+    if (!window.EventSource) {
+        // Fall back to reloading the page, as before
+        setTimeout(function() { window.location.reload(); }, 5000);
+        return;
+    }
+
+    var source = new EventSource(status.dataset.eventsUrl);
+    source.addEventListener('ready', function() {
+        source.close();
+        window.location.replace(resultUrl);
+    });
+});
@@ -0,0 +1,118 @@
+// Service worker for the patient questionnaires, rendered by main.service_worker.
+// Hashed static assets are served cache-first (their names change with their
+// content), questionnaire pages are served from the cache and refreshed in the
+// background, and the precached pages are a fallback when the network is down.
+// The pinned CDN files in EXTERNAL (Bootstrap) are precached and served
+// cache-first as well, since their URLs carry the version.
+'use strict';
+
+var CACHE_PREFIX = 'physioengine-';
+var CACHE = CACHE_PREFIX + {{ version|tojson }};
+var PRECACHE = {{ precache|tojson }};
+var EXTERNAL = {{ external|tojson }};
+var STATIC_PREFIX = {{ static_prefix|tojson }};
+var PAGE_PREFIXES = {{ page_prefixes|tojson }};
+// Names written by `flask assets build`
+var HASHED_NAME = /\.[0-9a-f]{12}\.[A-Za-z0-9]+$/;
+// Questionnaire pages kept per device; each session has its own URL
+var MAX_PAGES = 10;
+
+self.addEventListener('install', function(event) {
+    event.waitUntil(
+        caches.open(CACHE)
+            .then(function(cache) { return cache.addAll(PRECACHE.concat(EXTERNAL)); })
+            .then(function() { return self.skipWaiting(); })
+    );
+});
+
+self.addEventListener('activate', function(event) {
+    event.waitUntil(
+        caches.keys()
+            .then(function(names) {
+                return Promise.all(names.filter(function(name) {
+                    return name.indexOf(CACHE_PREFIX) === 0 && name !== CACHE;
+                }).map(function(name) { return caches.delete(name); }));
+            })
+            .then(function() { return self.clients.claim(); })
+    );
+});
+
+function isPage(url) {
+    return PAGE_PREFIXES.some(function(prefix) { return url.pathname.indexOf(prefix) === 0; });
+}
+
+function trimPages(cache) {
+    return cache.keys().then(function(requests) {
+        var pages = requests.filter(function(request) { return isPage(new URL(request.url)); });
+        return Promise.all(pages.slice(0, Math.max(pages.length - MAX_PAGES, 0)).map(function(request) {
+            return cache.delete(request);
+        }));
+    });
+}
+
+function cacheFirst(request) {
+    return caches.open(CACHE).then(function(cache) {
+        return cache.match(request).then(function(cached) {
+            return cached || fetch(request).then(function(response) {
+                if (response.ok) {
+                    cache.put(request, response.clone());
+                }
+                return response;
+            });
+        });
+    });
+}
+
+function staleWhileRevalidate(event) {
+    return caches.open(CACHE).then(function(cache) {
+        return cache.match(event.request, {ignoreVary: true}).then(function(cached) {
+            var network = fetch(event.request).then(function(response) {
+                if (response.ok) {
+                    return cache.put(event.request, response.clone())
+                        .then(function() { return trimPages(cache); })
+                        .then(function() { return response; });
+                }
+                return response;
+            });
+            if (cached) {
+                event.waitUntil(network.catch(function() {}));
+                return cached;
+            }
+            return network;
+        });
+    });
+}
+
+function networkFirst(request) {
+    return fetch(request).catch(function(error) {
+        return caches.match(request, {ignoreVary: true}).then(function(cached) {
+            if (cached) {
+                return cached;
+            }
+            throw error;
+        });
+    });
+}
+
+self.addEventListener('fetch', function(event) {
+    var request = event.request;
+    var url = new URL(request.url);
+    // Form submissions go straight to the network
+    if (request.method !== 'GET') {
+        return;
+    }
+    if (url.origin !== self.location.origin) {
+        // Other origins do too, apart from the precached CDN files
+        if (EXTERNAL.indexOf(request.url) !== -1) {
+            event.respondWith(cacheFirst(request));
+        }
+        return;
+    }
+    if (url.pathname.indexOf(STATIC_PREFIX) === 0 && HASHED_NAME.test(url.pathname)) {
+        event.respondWith(cacheFirst(request));
+    } else if (request.mode === 'navigate' && isPage(url)) {
+        event.respondWith(staleWhileRevalidate(event));
+    } else if (PRECACHE.indexOf(url.pathname) !== -1) {
+        event.respondWith(networkFirst(request));
+    }
+});
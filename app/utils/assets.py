@@ -0,0 +1,256 @@
+"""
+Content-hashed static assets.
+
+``flask assets build`` copies every file under ``app/static`` to
+``app/static/dist`` with a hash of its content in the name
+(``css/main.css`` becomes ``dist/css/main.3f2a9c1b7d04.css``), writes gzip and,
+if the ``brotli`` package is installed, brotli variants next to text assets,
+and records the mapping in ``dist/manifest.json``. Relative ``url()``
+references in CSS, such as ``@import url('main.css')``, are rewritten to the
+hashed names, so a changed file also changes the name of every stylesheet
+that imports it.
+
+Templates link assets with ``asset_url('css/main.css')``, which returns the
+hashed URL from the manifest, or the plain static URL when no build exists.
+WhiteNoise serves ``/static`` and picks the precompressed variant the
+browser accepts; hashed files never change, so they are sent with
+``Cache-Control: public, max-age=31536000, immutable`` and repeat visits make
+no asset requests at all.
+
+On Heroku the build runs in ``bin/post_compile``; WhiteNoise indexes the files
+when the app starts, so rebuild before starting the server.
+"""
+
+import gzip
+import hashlib
+import json
+import os
+import posixpath
+import re
+import shutil
+
+import click
+from flask import url_for
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+MANIFEST_NAME = 'manifest.json'
+HASH_LENGTH = 12
+COMPRESSIBLE = frozenset({'.css', '.js', '.svg', '.txt', '.json', '.html', '.xml', '.map'})
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+_CSS_URL_RE = re.compile(r'''url\(\s*(['"]?)([^'")]+)\1\s*\)''')
+_HASHED_NAME_RE = re.compile(r'\.[0-9a-f]{%d}\.[A-Za-z0-9]+$' % HASH_LENGTH)
+
+
+class AssetBuilder:
+    """
+    Fingerprints and compresses the files of a static folder.
+
+    Args:
+        static_dir (str): The static folder.
+        build_dir (str): Output folder inside ``static_dir``; it is skipped
+            when collecting sources.
+        compress_level (int, optional): gzip level. Defaults to 9.
+    """
+
+    def __init__(self, static_dir, build_dir, compress_level=9):
+        self.static_dir = static_dir
+        self.build_dir = build_dir
+        self.compress_level = compress_level
+        self.prefix = os.path.relpath(build_dir, static_dir).replace(os.sep, '/')
+        self.manifest = {}
+
+    def sources(self):
+        """Return the static file paths relative to ``static_dir``, with '/' separators."""
+        build_dir = os.path.abspath(self.build_dir)
+        paths = []
+        for directory, subdirs, filenames in os.walk(self.static_dir):
+            subdirs[:] = sorted(d for d in subdirs if os.path.abspath(os.path.join(directory, d)) != build_dir)
+            for filename in sorted(filenames):
+                if filename.startswith('.') or filename.endswith(('.gz', '.br')):
+                    continue
+                relative = os.path.relpath(os.path.join(directory, filename), self.static_dir)
+                paths.append(relative.replace(os.sep, '/'))
+        return paths
+
+    def build(self):
+        """
+        Write hashed copies, compressed variants and the manifest.
+
+        Returns:
+            dict: The manifest, source path to hashed path (both relative to
+            the static folder).
+        """
+        self.manifest = {}
+        sources = self.sources()
+        known = set(sources)
+        for path in sources:
+            self._fingerprint(path, known, ())
+
+        os.makedirs(self.build_dir, exist_ok=True)
+        manifest_path = os.path.join(self.build_dir, MANIFEST_NAME)
+        with open(manifest_path + '.tmp', 'w', encoding='utf-8') as file:
+            json.dump(self.manifest, file, indent=2, sort_keys=True)
+        os.replace(manifest_path + '.tmp', manifest_path)
+        return self.manifest
+
+    def _fingerprint(self, path, known, parents):
+        if path in self.manifest:
+            return self.manifest[path]
+        with open(os.path.join(self.static_dir, path), 'rb') as file:
+            content = file.read()
+
+        if path.endswith('.css') and path not in parents:
+            content = self._rewrite_css(path, content, known, parents + (path,))
+
+        digest = hashlib.sha256(content).hexdigest()[:HASH_LENGTH]
+        stem, ext = posixpath.splitext(path)
+        hashed = f'{self.prefix}/{stem}.{digest}{ext}'
+        target = os.path.join(self.static_dir, hashed)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        if not os.path.exists(target):
+            _write(target, content)
+            if ext.lower() in COMPRESSIBLE:
+                self._compress(target, content)
+        self.manifest[path] = hashed
+        return hashed
+
+    def _rewrite_css(self, path, content, known, parents):
+        directory = posixpath.dirname(path)
+        # The hashed stylesheet sits at the same depth below the build folder as its source
+        hashed_dir = posixpath.dirname(f'{self.prefix}/{path}')
+
+        def replace(match):
+            quote, reference = match.groups()
+            if re.match(r'^(?:[a-z]+:|/|#)', reference, re.IGNORECASE):
+                return match.group(0)
+            clean = reference.split('?')[0].split('#')[0]
+            target = posixpath.normpath(posixpath.join(directory, clean))
+            if target not in known or target in parents:
+                return match.group(0)
+            relative = posixpath.relpath(self._fingerprint(target, known, parents), hashed_dir)
+            return f'url({quote}{relative}{quote})'
+
+        return _CSS_URL_RE.sub(replace, content.decode('utf-8')).encode('utf-8')
+
+    def _compress(self, target, content):
+        compressed = gzip.compress(content, self.compress_level, mtime=0)
+        if len(compressed) < len(content):
+            _write(target + '.gz', compressed)
+        if brotli is not None:
+            compressed = brotli.compress(content, quality=11)
+            if len(compressed) < len(content):
+                _write(target + '.br', compressed)
+
+
+def _write(path, content):
+    with open(path + '.tmp', 'wb') as file:
+        file.write(content)
+    os.replace(path + '.tmp', path)
+
+
+class AssetManifest:
+    """
+    Resolves asset paths to their hashed names.
+
+    Args:
+        path (str): Location of ``manifest.json``.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """(Re)read the manifest; a missing manifest maps every asset to itself."""
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                self.entries = json.load(file)
+        except FileNotFoundError:
+            self.entries = {}
+
+    def resolve(self, filename):
+        """Return the hashed path of ``filename``, or ``filename`` if it was not built."""
+        return self.entries.get(filename, filename)
+
+
+def is_hashed(path, url):
+    """WhiteNoise ``immutable_file_test``: True for files written by ``AssetBuilder``."""
+    return _HASHED_NAME_RE.search(url) is not None
+
+
+def add_immutable_headers(headers, path, url):
+    """WhiteNoise ``add_headers_function``: cache hashed files for a year."""
+    if is_hashed(path, url):
+        headers['Cache-Control'] = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+
+
+def asset_url(filename):
+    """
+    Return the URL of a static asset, preferring its hashed build.
+
+    Args:
+        filename (str): Path below the static folder, e.g. 'css/main.css'.
+
+    Returns:
+        str: The URL.
+    """
+    from flask import current_app
+    return url_for('static', filename=current_app.extensions['assets'].resolve(filename))
+
+
+def init_app(app):
+    """
+    Load the asset manifest, add ``asset_url`` to templates and register ``flask assets``.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        AssetManifest: The manifest stored in ``app.extensions``.
+    """
+    build_dir = os.path.join(app.static_folder, app.config['ASSETS_BUILD_DIR'])
+    manifest = AssetManifest(os.path.join(build_dir, MANIFEST_NAME))
+    app.extensions['assets'] = manifest
+    app.add_template_global(asset_url)
+
+    @app.cli.group('assets')
+    def assets_group():
+        """Build fingerprinted static assets."""
+
+    @assets_group.command('build')
+    @click.option('--clean', is_flag=True, help='Delete earlier builds first.')
+    def build_command(clean):
+        """Hash, compress and index every file under the static folder."""
+        if clean and os.path.isdir(build_dir):
+            shutil.rmtree(build_dir)
+        builder = AssetBuilder(app.static_folder, build_dir, app.config['ASSETS_COMPRESS_LEVEL'])
+        entries = builder.build()
+        manifest.load()
+        for source, hashed in sorted(entries.items()):
+            click.echo(f'{source} -> {hashed}')
+        if brotli is None:
+            click.echo('brotli is not installed; only gzip variants were written.')
+
+    return manifest
+
+
+def get_asset_manifest(app=None):
+    """
+    Return the asset manifest of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        AssetManifest: The manifest loaded by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['assets']
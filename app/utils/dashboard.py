@@ -0,0 +1,130 @@
+"""
+Session overview for the physio dashboard.
+
+The sessions a physio creates with ``generate_qr`` are remembered in their
+signed session cookie, so the dashboard needs no accounts. The dashboard
+page refreshes the state of all of them with one batched status request,
+which reads every session record and result in a single ``get_many`` call,
+instead of one waiting page per patient polling on its own.
+
+A session is ``waiting`` until the patient submits, ``ready`` while the
+result waits to be opened (with a score summary computed from the stored
+responses, without consuming them) and ``closed`` once the result has been
+viewed or the session has expired. Closed sessions are dropped from the
+cookie.
+"""
+
+from flask import current_app, session as cookie, url_for
+
+from app.questionnaires_config import QUESTIONNAIRES
+from app.utils.metrics import timer
+from app.utils.result_store import get_store, result_key, session_key
+from app.utils.scoring import get_plan
+
+COOKIE_KEY = 'dashboard'
+
+WAITING = 'waiting'
+READY = 'ready'
+CLOSED = 'closed'
+
+
+def tracked_sessions():
+    """Return the session IDs on the current physio's dashboard, oldest first."""
+    return list(cookie.get(COOKIE_KEY, ()))
+
+
+def track_session(session_id):
+    """
+    Add a session to the current physio's dashboard.
+
+    Only the newest DASHBOARD_MAX_SESSIONS sessions are kept.
+
+    Args:
+        session_id (str): The new session.
+    """
+    session_ids = [other for other in tracked_sessions() if other != session_id]
+    session_ids.append(session_id)
+    cookie[COOKIE_KEY] = session_ids[-current_app.config['DASHBOARD_MAX_SESSIONS']:]
+
+
+def forget_sessions(session_ids):
+    """
+    Remove sessions from the current physio's dashboard.
+
+    Args:
+        session_ids (Iterable[str]): Sessions to remove.
+    """
+    forgotten = set(session_ids)
+    if forgotten:
+        cookie[COOKIE_KEY] = [session_id for session_id in tracked_sessions() if session_id not in forgotten]
+
+
+def summarize(result):
+    """
+    Reduce a scoring result to what the dashboard shows inline.
+
+    Args:
+        result (dict): Result of ``ScoringPlan.score``.
+
+    Returns:
+        dict: ``total_score``, ``interpretation`` and the ``sections`` with
+        their names and scores, rounded to one decimal.
+    """
+    total = result.get('total_score')
+    return {
+        'total_score': None if total is None else round(total, 1),
+        'interpretation': result.get('interpretation'),
+        'sections': [{'name': section['name'], 'score': round(section['score'], 1)}
+                     for section in result.get('sections', ())],
+    }
+
+
+def session_statuses(session_ids):
+    """
+    Look up the state of many sessions with one store query.
+
+    Args:
+        session_ids (list): Session IDs, in display order.
+
+    Returns:
+        list: One dict per session with ``session_id``, ``state`` and, unless
+        the session is closed, ``evaluation_form``, ``name``, ``created``,
+        ``result_url`` and ``qr_url``. Ready sessions also have a ``summary``
+        (None if their responses could not be scored).
+    """
+    with timer('dashboard_status'):
+        records = get_store().get_many([session_key(session_id) for session_id in session_ids]
+                                       + [result_key(session_id) for session_id in session_ids])
+        statuses = []
+        for session_id in session_ids:
+            session = records.get(session_key(session_id))
+            if session is None or session['f'] not in QUESTIONNAIRES:
+                statuses.append({'session_id': session_id, 'state': CLOSED})
+                continue
+            evaluation_form = session['f']
+            status = {
+                'session_id': session_id,
+                'state': WAITING,
+                'evaluation_form': evaluation_form,
+                'name': QUESTIONNAIRES[evaluation_form]['name'],
+                'created': session['c'],
+                'result_url': url_for('main.wait_for_result', session_id=session_id,
+                                      evaluation_form=evaluation_form),
+                'qr_url': url_for('main.qr_code', session_id=session_id, fmt='svg'),
+            }
+            responses = records.get(result_key(session_id))
+            if responses is not None:
+                status['state'] = READY
+                status['summary'] = _score_summary(session_id, evaluation_form, responses)
+            statuses.append(status)
+        return statuses
+
+
+def _score_summary(session_id, evaluation_form, responses):
+    try:
+        plan = get_plan(evaluation_form)
+        result = plan.score(responses) if plan is not None else None
+        return summarize(result) if result is not None else None
+    except Exception as e:
+        current_app.logger.error("Error scoring session %s for the dashboard: %s", session_id, e, exc_info=True)
+        return None
@@ -0,0 +1,337 @@
+"""
+Session funnel tracing from QR creation to result view.
+
+Routes record one event per stage a patient session reaches:
+
+1. ``qr_generated``: the session was created (``generate_qr`` or a QR sheet).
+2. ``form_opened``: the patient opened the questionnaire.
+3. ``form_submitted``: the answers were saved.
+4. ``result_scored``: the waiting page scored the answers.
+5. ``result_viewed``: the result page was rendered for the physio.
+
+Recording an event only appends a tuple to an in-memory ring buffer, so a
+hooked route pays a few microseconds. A daemon thread in each worker moves
+the buffered events to a shared SQLite database every
+``FUNNEL_FLUSH_INTERVAL`` seconds in one transaction, and once more when the
+process exits. If the database falls behind, the oldest buffered events are
+dropped rather than slowing requests down.
+
+``flask funnel report`` shows per questionnaire how many sessions reached
+each stage and the latency percentiles between stages; ``flask funnel
+prune`` removes old events.
+"""
+
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+
+import click
+
+logger = logging.getLogger(__name__)
+
+STAGES = ('qr_generated', 'form_opened', 'form_submitted', 'result_scored', 'result_viewed')
+PERCENTILES = (50, 90, 99)
+
+
+def percentile(ordered, p):
+    """Return the nearest-rank percentile ``p`` of a sorted, non-empty list."""
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+class FunnelTracer:
+    """
+    Buffers funnel events and writes them to SQLite in batches.
+
+    Attributes:
+        path (str): SQLite database shared by all workers.
+        capacity (int): Events buffered before the oldest are dropped.
+        flush_interval (float): Seconds between background flushes.
+        written (int): Events this process wrote to the database.
+        dropped (int): Events this process dropped because the buffer was full.
+    """
+
+    def __init__(self, path, capacity=10000, flush_interval=5.0):
+        self.path = path
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._buffer = deque(maxlen=capacity)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._local = threading.local()
+
+    def record(self, session_id, stage, questionnaire):
+        """
+        Buffer one event; safe to call from any thread.
+
+        Args:
+            session_id (str): The patient session.
+            stage (str): One of ``STAGES``.
+            questionnaire (str): Questionnaire slug.
+        """
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append((time.time(), session_id, stage, questionnaire))
+
+    def reset(self):
+        """Drop all buffered events, e.g. ones recorded while warming up or inherited from a master."""
+        self._buffer.clear()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS events ('
+                'ts REAL NOT NULL, session_id TEXT NOT NULL, stage TEXT NOT NULL, questionnaire TEXT NOT NULL)')
+            conn.execute('CREATE INDEX IF NOT EXISTS events_session ON events (session_id, stage, ts)')
+            conn.execute('CREATE INDEX IF NOT EXISTS events_ts ON events (ts)')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def flush(self):
+        """
+        Write all buffered events in one transaction.
+
+        Returns:
+            int: Number of events written.
+        """
+        with self._flush_lock:
+            rows = []
+            while True:
+                try:
+                    rows.append(self._buffer.popleft())
+                except IndexError:
+                    break
+            if not rows:
+                return 0
+            conn = self._connect()
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany('INSERT INTO events (ts, session_id, stage, questionnaire) VALUES (?, ?, ?, ?)',
+                                 rows)
+                conn.execute('COMMIT')
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                # Put back as much of the batch as newer events left room for
+                room = self.capacity - len(self._buffer)
+                if room > 0:
+                    self._buffer.extendleft(reversed(rows[-room:]))
+                self.dropped += max(len(rows) - room, 0)
+                raise
+            self.written += len(rows)
+            return len(rows)
+
+    def start(self):
+        """Start the background flush thread if it is not running."""
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='funnel', daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_quietly)
+
+    def stop(self):
+        """Ask the background flush thread to exit."""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Funnel flush failed: %s", e, exc_info=True)
+
+    def prune(self, before):
+        """
+        Delete events older than ``before``.
+
+        Args:
+            before (float): Unix time.
+
+        Returns:
+            int: Number of deleted events.
+        """
+        return self._connect().execute('DELETE FROM events WHERE ts < ?', (before,)).rowcount
+
+    def report(self, since=None, questionnaire=None):
+        """
+        Summarise the funnel of sessions that started after ``since``.
+
+        A session counts for a stage if it ever reached it; repeated events
+        of a stage, such as reopening the form, count from the first one.
+
+        Args:
+            since (float, optional): Only sessions whose first event is later
+                than this Unix time.
+            questionnaire (str, optional): Only this questionnaire.
+
+        Returns:
+            dict: Per questionnaire, ``sessions`` and ``stages``: per stage the
+            ``sessions`` that reached it, the ``conversion`` from the first
+            stage and the ``step_conversion`` from the previous stage, and
+            ``latency`` (seconds, from the previous stage) and ``total``
+            (from ``qr_generated``) percentiles.
+        """
+        query = ('SELECT session_id, questionnaire, stage, MIN(ts) FROM events '
+                 'WHERE session_id IN (SELECT session_id FROM events GROUP BY session_id HAVING MIN(ts) >= ?)')
+        params = [since or 0]
+        if questionnaire:
+            query += ' AND questionnaire = ?'
+            params.append(questionnaire)
+        query += ' GROUP BY session_id, questionnaire, stage'
+
+        sessions = {}
+        for session_id, slug, stage, ts in self._connect().execute(query, params):
+            sessions.setdefault(slug, {}).setdefault(session_id, {})[stage] = ts
+
+        report = {}
+        for slug, by_session in sorted(sessions.items()):
+            stages = []
+            previous_count = None
+            for index, stage in enumerate(STAGES):
+                reached = [times for times in by_session.values() if stage in times]
+                entry = {'stage': stage, 'sessions': len(reached)}
+                if index == 0:
+                    first_count = len(reached)
+                else:
+                    entry['conversion'] = len(reached) / first_count if first_count else None
+                    entry['step_conversion'] = len(reached) / previous_count if previous_count else None
+                    entry['latency'] = _percentiles(
+                        times[stage] - times[STAGES[index - 1]] for times in reached if STAGES[index - 1] in times)
+                    entry['total'] = _percentiles(
+                        times[stage] - times[STAGES[0]] for times in reached if STAGES[0] in times)
+                previous_count = len(reached)
+                stages.append(entry)
+            report[slug] = {'sessions': len(by_session), 'stages': stages}
+        return report
+
+
+def _percentiles(durations):
+    ordered = sorted(max(duration, 0.0) for duration in durations)
+    if not ordered:
+        return None
+    return {f'p{p}': percentile(ordered, p) for p in PERCENTILES}
+
+
+def _format_duration(seconds):
+    if seconds < 60:
+        return f'{seconds:.1f}s'
+    if seconds < 3600:
+        return f'{seconds / 60:.1f}m'
+    return f'{seconds / 3600:.1f}h'
+
+
+def _format_percentiles(values):
+    if values is None:
+        return '-'
+    return ' / '.join(_format_duration(values[f'p{p}']) for p in PERCENTILES)
+
+
+def trace(session_id, stage, questionnaire):
+    """
+    Record a funnel event for the current app if tracing is enabled.
+
+    Args:
+        session_id (str): The patient session.
+        stage (str): One of ``STAGES``.
+        questionnaire (str): Questionnaire slug.
+    """
+    from flask import current_app
+    tracer = current_app.extensions['funnel']
+    if tracer is not None:
+        tracer.record(session_id, stage, questionnaire)
+
+
+def init_app(app):
+    """
+    Create the funnel tracer for ``app`` and register ``flask funnel`` commands.
+
+    The flush thread is started on the first request, like the janitor, so it
+    runs in each gunicorn worker.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        FunnelTracer or None: The tracer stored in ``app.extensions``, or
+        None if FUNNEL_ENABLED is off.
+    """
+    if not app.config['FUNNEL_ENABLED']:
+        app.extensions['funnel'] = None
+        return None
+
+    tracer = FunnelTracer(app.config['FUNNEL_DB'], app.config['FUNNEL_BUFFER_SIZE'],
+                          app.config['FUNNEL_FLUSH_INTERVAL'])
+    app.extensions['funnel'] = tracer
+
+    @app.before_request
+    def start_funnel():
+        tracer.start()
+
+    @app.cli.group('funnel')
+    def funnel_group():
+        """Report on patient session funnels."""
+
+    @funnel_group.command('report')
+    @click.option('--days', type=float, default=30, show_default=True, help='Sessions started in the last N days.')
+    @click.option('--questionnaire', help='Only this questionnaire.')
+    def report_command(days, questionnaire):
+        """Show stage conversion and p50 / p90 / p99 latencies per questionnaire."""
+        report = tracer.report(since=time.time() - days * 86400, questionnaire=questionnaire)
+        if not report:
+            click.echo('No sessions recorded.')
+        for slug, summary in report.items():
+            click.echo(f"{slug}: {summary['sessions']} sessions")
+            click.echo(f"  {'stage':<16}{'sessions':>9}{'conv':>8}{'step':>8}  {'since previous':<24}since QR")
+            for entry in summary['stages']:
+                conversion = entry.get('conversion')
+                step = entry.get('step_conversion')
+                click.echo(f"  {entry['stage']:<16}{entry['sessions']:>9}"
+                           f"{'' if conversion is None else f'{conversion:.0%}':>8}"
+                           f"{'' if step is None else f'{step:.0%}':>8}  "
+                           f"{_format_percentiles(entry.get('latency')):<24}{_format_percentiles(entry.get('total'))}")
+
+    @funnel_group.command('prune')
+    @click.option('--days', type=float, default=app.config['FUNNEL_RETENTION_DAYS'], show_default=True,
+                  help='Delete events older than N days.')
+    def prune_command(days):
+        """Delete old funnel events."""
+        click.echo(f'Deleted {tracer.prune(time.time() - days * 86400)} events.')
+
+    return tracer
+
+
+def get_funnel(app=None):
+    """
+    Return the funnel tracer of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        FunnelTracer or None: The tracer, or None if tracing is disabled.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['funnel']
@@ -0,0 +1,191 @@
+"""
+Background expiry of abandoned sessions and leftover file artifacts.
+
+The janitor purges expired entries from the result store and deletes
+per-session files (QR images, result JSON) that are older than
+``ARTIFACT_TTL``. It runs every ``JANITOR_INTERVAL`` seconds on a daemon
+thread in each worker, or on demand with ``flask sweep`` from cron. A file
+lock makes sure only one process sweeps at a time, and the lock file's mtime
+records the last sweep so the other workers skip their turn.
+
+Per-session files are the QR images and result JSON files that earlier
+releases wrote directly into the swept directories, named after their
+session. Only those files are removed; subdirectories and other files are
+never touched, so directories that other writers are filling are left alone.
+"""
+
+import logging
+import os
+import re
+import threading
+import time
+
+import click
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from app.utils.result_store import get_store
+
+logger = logging.getLogger(__name__)
+
+# Only files named after a session ID are ever removed
+SESSION_FILE_RE = re.compile(r'^[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\.[a-z0-9.]+$')
+
+
+class Janitor:
+    """
+    Sweeps expired sessions and per-session files.
+
+    Attributes:
+        directories (list): Directories whose per-session files are swept.
+        artifact_ttl (float): Age in seconds after which a file is removed.
+        interval (float): Seconds between scheduled sweeps. Zero disables the
+            background thread.
+        lock_file (str): Path of the lock file shared by all workers.
+        stats (dict): Cumulative counters of what this process reclaimed.
+    """
+
+    def __init__(self, store, directories, artifact_ttl, interval, lock_file):
+        self.store = store
+        self.directories = list(directories)
+        self.artifact_ttl = artifact_ttl
+        self.interval = interval
+        self.lock_file = lock_file
+        self.stats = {
+            'sweeps': 0,
+            'skipped': 0,
+            'store_entries_purged': 0,
+            'files_removed': 0,
+            'bytes_reclaimed': 0,
+        }
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def sweep(self, force=False):
+        """
+        Run one sweep unless another process is sweeping or just did.
+
+        Args:
+            force (bool, optional): Ignore when the last sweep happened.
+                Defaults to False.
+
+        Returns:
+            dict or None: Counters for this sweep, or None if it was skipped.
+        """
+        directory = os.path.dirname(self.lock_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        if not os.path.exists(self.lock_file):
+            with open(self.lock_file, 'a'):
+                pass
+            # A new lock file means no sweep has happened yet
+            os.utime(self.lock_file, (0, 0))
+        with open(self.lock_file, 'a') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    self.stats['skipped'] += 1
+                    return None
+            last_sweep = os.fstat(lock.fileno()).st_mtime
+            if not force and self.interval and time.time() - last_sweep < self.interval * 0.9:
+                self.stats['skipped'] += 1
+                return None
+            result = self._sweep()
+            os.utime(self.lock_file)
+        for key, value in result.items():
+            self.stats[key] += value
+        self.stats['sweeps'] += 1
+        logger.info("Janitor sweep: %s", result)
+        return result
+
+    def _sweep(self):
+        result = {
+            'store_entries_purged': self.store.purge_expired(),
+            'files_removed': 0,
+            'bytes_reclaimed': 0,
+        }
+        cutoff = time.time() - self.artifact_ttl
+        for root in self.directories:
+            try:
+                entries = list(os.scandir(root))
+            except OSError:
+                continue
+            for entry in entries:
+                if not SESSION_FILE_RE.match(entry.name):
+                    continue
+                try:
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                    if stat.st_mtime < cutoff:
+                        os.remove(entry.path)
+                        result['files_removed'] += 1
+                        result['bytes_reclaimed'] += stat.st_size
+                except FileNotFoundError:
+                    continue
+        return result
+
+    def start(self):
+        """Start the background sweep thread if it is enabled and not running."""
+        if not self.interval or self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='janitor', daemon=True)
+                self._thread.start()
+
+    def stop(self):
+        """Ask the background sweep thread to exit."""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("Janitor sweep failed: %s", e, exc_info=True)
+
+
+def init_app(app):
+    """
+    Create the janitor for ``app`` and register the ``flask sweep`` command.
+
+    The background thread is started on the first request rather than here so
+    it runs in each gunicorn worker, not in a master process that forks.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        Janitor: The janitor stored in ``app.extensions``.
+    """
+    janitor = Janitor(
+        store=get_store(app),
+        directories=app.config['JANITOR_DIRECTORIES'],
+        artifact_ttl=app.config['ARTIFACT_TTL'],
+        interval=app.config['JANITOR_INTERVAL'],
+        lock_file=app.config['JANITOR_LOCK_FILE'],
+    )
+    app.extensions['janitor'] = janitor
+
+    @app.before_request
+    def start_janitor():
+        janitor.start()
+
+    @app.cli.command('sweep')
+    @click.option('--force', is_flag=True, help='Sweep even if another worker swept recently.')
+    def sweep_command(force):
+        """Remove expired sessions and per-session files."""
+        result = janitor.sweep(force=force)
+        if result is None:
+            click.echo('Skipped: another process is sweeping or swept recently.')
+        else:
+            for key, value in result.items():
+                click.echo(f'{key}: {value}')
+
+    return janitor
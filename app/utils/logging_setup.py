@@ -0,0 +1,243 @@
+"""
+Asynchronous, structured logging for the application.
+
+Request threads only put log records on a queue (``QueueHandler``). A
+``QueueListener`` thread does the expensive part: redacting patient data,
+formatting records as JSON and writing them to the rotating log file and
+the console. ``app.logger`` does not propagate to the root logger, so no
+record bypasses the queue and the redaction.
+
+Request bodies are no longer logged for every request. Each endpoint has a
+sample rate (``LOG_REQUEST_SAMPLE_RATES``), and sampled bodies are logged
+with every form value masked, so answers never reach the log files.
+"""
+
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from flask import request
+from flask.logging import default_handler
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime', 'taskName'}
+
+
+def _personnummer(match):
+    # Luhn check over YYMMDDNNNC, so other 10-digit numbers (timestamps) stay
+    digits = match.group(1) + match.group(2)
+    total = 0
+    for index, digit in enumerate(digits):
+        product = int(digit) * (2 if index % 2 == 0 else 1)
+        total += product - 9 if product > 9 else product
+    return '[personnummer]' if total % 10 == 0 else match.group(0)
+
+
+# Swedish personal identity (and coordination, day + 60) numbers with a
+# plausible date, e-mail addresses and answer fields
+_REDACTIONS = (
+    (re.compile(r'\b(?:19|20)?(\d{2}(?:0[1-9]|1[0-2])(?:0[1-9]|[12]\d|3[01]|6[1-9]|[78]\d|9[01]))[-+]?(\d{4})\b'),
+     _personnummer),
+    (re.compile(r'[\w.+-]+@[\w-]+\.[\w.-]+'), '[email]'),
+    (re.compile(r"""(['"]?question_\w+['"]?\s*[:=,]\s*)['"]?[^'",&)\s]*['"]?"""), r'\1*'),
+)
+
+_HIDDEN_HEADERS = {'cookie', 'authorization', 'proxy-authorization', 'idempotency-key'}
+
+
+def redact(text):
+    """
+    Mask patient data in a log message.
+
+    Args:
+        text (str): The formatted log message.
+
+    Returns:
+        str: The message with personal identity numbers, e-mail addresses and
+        answer values replaced.
+    """
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return redact(value)
+    if isinstance(value, dict):
+        return {key: '*' if str(key).startswith('question_') else _redact_value(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple, set)):
+        return [_redact_value(item) for item in value]
+    return value
+
+
+class RedactingFilter(logging.Filter):
+    """Redacts patient data from messages, tracebacks and ``extra`` values before they are written."""
+
+    def filter(self, record):
+        record.msg = redact(record.getMessage())
+        record.args = None
+        if record.exc_text:
+            record.exc_text = redact(record.exc_text)
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES:
+                setattr(record, key, _redact_value(value))
+        return True
+
+
+class JSONFormatter(logging.Formatter):
+    """Formats records as one JSON object per line."""
+
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+            'module': record.module,
+            'line': record.lineno,
+            'process': record.process,
+        }
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    A QueueHandler that leaves formatting to the listener thread.
+
+    The stock handler formats the full record in the calling thread. This one
+    only merges the message arguments, so mutable arguments are captured at
+    the time of the call, and keeps the traceback text for the listener.
+    Records go to the pipeline's current queue, which is replaced after a fork.
+    """
+
+    def __init__(self, pipeline):
+        super().__init__(pipeline.queue)
+        self.pipeline = pipeline
+
+    def enqueue(self, record):
+        self.pipeline.queue.put_nowait(record)
+
+    def prepare(self, record):
+        record = logging.makeLogRecord(vars(record))
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _build_formatter(fmt):
+    if fmt == 'json':
+        return JSONFormatter()
+    return logging.Formatter('%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]')
+
+
+class AsyncLogging:
+    """
+    Owns the log queue and the listener thread that drains it.
+
+    The listener is restarted in child processes after a fork, because
+    threads do not survive ``fork`` when gunicorn preloads the application.
+    """
+
+    def __init__(self, handlers):
+        self.queue = queue.SimpleQueue()
+        self.handlers = handlers
+        self.listener = None
+
+    def start(self):
+        self.listener = QueueListener(self.queue, *self.handlers, respect_handler_level=True)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None and self.listener._thread is not None:
+            self.listener.stop()
+
+    def _restart_after_fork(self):
+        self.queue = queue.SimpleQueue()
+        self.start()
+
+
+def init_app(app):
+    """
+    Route ``app.logger`` through a background listener thread.
+
+    In debug and testing mode Flask's default console logging is left alone.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        AsyncLogging or None: The logging pipeline, if one was installed.
+    """
+    level = logging.getLevelName(app.config['LOG_LEVEL'].upper())
+    app.logger.setLevel(level)
+    _register_request_logging(app)
+
+    if app.debug or app.testing:
+        return None
+
+    formatter = _build_formatter(app.config['LOG_FORMAT'])
+    handlers = []
+
+    log_dir = os.path.dirname(app.config['LOG_FILE'])
+    if log_dir and not os.path.exists(log_dir):
+        os.makedirs(log_dir)
+    file_handler = RotatingFileHandler(app.config['LOG_FILE'],
+                                       maxBytes=app.config['LOG_FILE_MAX_BYTES'],
+                                       backupCount=app.config['LOG_FILE_BACKUP_COUNT'])
+    handlers.append(file_handler)
+    handlers.append(logging.StreamHandler(sys.stderr))
+
+    redacting_filter = RedactingFilter()
+    for handler in handlers:
+        handler.setFormatter(formatter)
+        handler.addFilter(redacting_filter)
+
+    pipeline = AsyncLogging(handlers)
+    pipeline.start()
+    atexit.register(pipeline.stop)
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=pipeline._restart_after_fork)
+
+    queue_handler = DeferredQueueHandler(pipeline)
+    app.logger.removeHandler(default_handler)
+    app.logger.addHandler(queue_handler)
+    # Handlers on the root logger (e.g. from logging.basicConfig) would write
+    # every record again, synchronously and unredacted
+    app.logger.propagate = False
+    app.extensions['async_logging'] = pipeline
+    return pipeline
+
+
+def _register_request_logging(app):
+    sample_rates = app.config['LOG_REQUEST_SAMPLE_RATES']
+    default_rate = sample_rates.get('default', 0.0)
+    logger = app.logger
+
+    @app.before_request
+    def log_request_info():
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        rate = sample_rates.get(request.endpoint, default_rate)
+        if not rate or random.random() >= rate:
+            return
+        headers = {key: value for key, value in request.headers.items() if key.lower() not in _HIDDEN_HEADERS}
+        # Field names show the shape of the submission; values are never logged
+        fields = {key: '*' for key in request.form} if request.form else {}
+        logger.info('Sampled request %s %s', request.method, request.path,
+                    extra={'endpoint': request.endpoint, 'headers': headers,
+                           'form_fields': fields, 'content_length': request.content_length})
@@ -0,0 +1,352 @@
+"""
+Request and operation metrics exposed in the Prometheus text format.
+
+Every request is counted and timed per blueprint and endpoint, with an
+in-flight gauge and a status code counter. ``timer`` measures sub-operations
+such as QR encoding, template rendering, scoring and storage I/O.
+
+Each gunicorn worker keeps its metrics in memory and writes a snapshot to
+``METRICS_DIR/<pid>.json`` at most every ``METRICS_FLUSH_INTERVAL`` seconds.
+``/metrics`` merges the snapshots of all live workers. Snapshots of workers
+that have exited are deleted (by gunicorn's ``child_exit`` hook, or by the
+next merge that finds their PID gone), so restarts never leave stale values
+behind; Prometheus treats the drop in the totals as a counter reset.
+"""
+
+import glob
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import Response, abort, g, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+METRICS = {
+    'physioengine_requests_total': ('counter', 'Requests handled, by endpoint and status code.',
+                                    ('blueprint', 'endpoint', 'status')),
+    'physioengine_request_duration_seconds': ('histogram', 'Request latency, by endpoint.',
+                                              ('blueprint', 'endpoint')),
+    'physioengine_requests_in_flight': ('gauge', 'Requests currently being handled, by endpoint.',
+                                        ('blueprint', 'endpoint')),
+    'physioengine_operation_duration_seconds': ('histogram', 'Latency of internal operations.',
+                                                ('operation',)),
+}
+
+
+class MetricsRegistry:
+    """
+    Thread-safe in-process store of counters, gauges and histograms.
+
+    Values are kept per label tuple. Histograms store cumulative-ready bucket
+    counts for ``DEFAULT_BUCKETS`` plus the sum and count of observations.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = {name: {} for name in METRICS}
+
+    def define(self, name, kind, help_text, labelnames):
+        """
+        Register an additional metric.
+
+        Args:
+            name (str): Prometheus metric name.
+            kind (str): 'counter', 'gauge' or 'histogram'.
+            help_text (str): Description shown in the exposition.
+            labelnames (tuple): Names of the labels.
+        """
+        METRICS.setdefault(name, (kind, help_text, tuple(labelnames)))
+        with self._lock:
+            self._values.setdefault(name, {})
+
+    def inc(self, name, labels=(), value=1):
+        """Add ``value`` to a counter or gauge."""
+        with self._lock:
+            series = self._values[name]
+            series[labels] = series.get(labels, 0) + value
+
+    def dec(self, name, labels=(), value=1):
+        """Subtract ``value`` from a gauge."""
+        self.inc(name, labels, -value)
+
+    def observe(self, name, labels, value):
+        """Record one observation in a histogram."""
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values[name]
+            entry = series.get(labels)
+            if entry is None:
+                entry = series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def reset(self):
+        """Drop all values, e.g. in a worker forked from a master that recorded some."""
+        with self._lock:
+            self._values = {name: {} for name in self._values}
+
+    def snapshot(self):
+        """
+        Return a JSON-serialisable copy of all values.
+
+        Returns:
+            dict: Metric name to a list of ``[labels, value]`` pairs.
+        """
+        with self._lock:
+            return {name: [[list(labels), [list(value[0]), value[1], value[2]] if isinstance(value, list) else value]
+                           for labels, value in series.items()]
+                    for name, series in self._values.items()}
+
+
+REGISTRY = MetricsRegistry()
+
+
+@contextmanager
+def timer(operation):
+    """
+    Time a block of code as an internal operation.
+
+    Args:
+        operation (str): Operation name, e.g. 'qr_encode' or 'store_get_many'.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe('physioengine_operation_duration_seconds', (operation,), time.perf_counter() - start)
+
+
+def timed(operation):
+    """Decorator form of ``timer``."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(operation):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_methods(obj, methods, prefix):
+    """
+    Time selected methods of an object as ``<prefix>_<method>`` operations.
+
+    Args:
+        obj: The instance to instrument in place.
+        methods (iterable): Names of the methods to wrap.
+        prefix (str): Operation name prefix.
+
+    Returns:
+        The same instance.
+    """
+    for method in methods:
+        setattr(obj, method, timed(f'{prefix}_{method}')(getattr(obj, method)))
+    return obj
+
+
+class SnapshotWriter:
+    """Writes this worker's snapshot to the shared metrics directory."""
+
+    def __init__(self, registry, directory, interval):
+        self.registry = registry
+        self.directory = directory
+        self.interval = interval
+        self._next_flush = 0.0
+        self._lock = threading.Lock()
+
+    def path(self, pid=None):
+        return os.path.join(self.directory, f'{pid or os.getpid()}.json')
+
+    def maybe_flush(self):
+        """Flush if the flush interval has passed since the last flush."""
+        now = time.monotonic()
+        if now >= self._next_flush and self._lock.acquire(blocking=False):
+            try:
+                self._next_flush = now + self.interval
+                self.flush()
+            finally:
+                self._lock.release()
+
+    def flush(self):
+        """Atomically replace this worker's snapshot file."""
+        os.makedirs(self.directory, exist_ok=True)
+        tmp_path = self.path() + '.tmp'
+        with open(tmp_path, 'w') as file:
+            json.dump({'pid': os.getpid(), 'metrics': self.registry.snapshot()}, file, separators=(',', ':'))
+        os.replace(tmp_path, self.path())
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_snapshot(directory, pid):
+    """
+    Delete the snapshot of a worker that has exited.
+
+    Args:
+        directory (str): The shared metrics directory.
+        pid (int): The worker's process ID.
+    """
+    try:
+        os.remove(os.path.join(directory, f'{pid}.json'))
+    except OSError:
+        pass
+
+
+def merge_snapshots(directory):
+    """
+    Merge the snapshots of all live workers, deleting those of dead ones.
+
+    Args:
+        directory (str): The shared metrics directory.
+
+    Returns:
+        dict: Metric name to ``{labels: value}``.
+    """
+    merged = {name: {} for name in METRICS}
+    for path in glob.glob(os.path.join(directory, '*.json')):
+        try:
+            with open(path) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue
+        if not _pid_alive(snapshot['pid']):
+            remove_snapshot(directory, snapshot['pid'])
+            continue
+        for name, series in snapshot['metrics'].items():
+            if name not in METRICS:
+                continue
+            kind = METRICS[name][0]
+            target = merged[name]
+            for labels, value in series:
+                labels = tuple(labels)
+                if kind == 'histogram':
+                    entry = target.setdefault(labels, [[0] * len(value[0]), 0.0, 0])
+                    entry[0] = [a + b for a, b in zip(entry[0], value[0])]
+                    entry[1] += value[1]
+                    entry[2] += value[2]
+                else:
+                    target[labels] = target.get(labels, 0) + value
+    return merged
+
+
+def _format_labels(labelnames, labels, extra=()):
+    pairs = list(zip(labelnames, labels)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render_prometheus(merged, buckets=DEFAULT_BUCKETS):
+    """
+    Render merged metrics in the Prometheus text exposition format.
+
+    Args:
+        merged (dict): Output of ``merge_snapshots``.
+        buckets (tuple, optional): Histogram bucket upper bounds.
+
+    Returns:
+        str: The exposition text.
+    """
+    lines = []
+    for name, (kind, help_text, labelnames) in METRICS.items():
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(merged.get(name, {}).items()):
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(list(buckets) + ['+Inf'], value[0]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else repr(float(bound))
+                    lines.append(f'{name}_bucket{_format_labels(labelnames, labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labelnames, labels)} {value[1]}')
+                lines.append(f'{name}_count{_format_labels(labelnames, labels)} {value[2]}')
+            else:
+                lines.append(f'{name}{_format_labels(labelnames, labels)} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def init_app(app):
+    """
+    Instrument requests and template rendering and register ``/metrics``.
+
+    The endpoint is only registered if METRICS_TOKEN is set, like the API and
+    profiling endpoints; metrics are still recorded without it.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        SnapshotWriter: The writer stored in ``app.extensions``.
+    """
+    from flask import before_render_template, template_rendered
+
+    writer = SnapshotWriter(REGISTRY, app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    app.extensions['metrics'] = writer
+    local = threading.local()
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_labels = (request.blueprint or '', request.endpoint or '')
+        g.metrics_start = time.perf_counter()
+        REGISTRY.inc('physioengine_requests_in_flight', g.metrics_labels)
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def stop_request_timer(exc):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return
+        labels = g.metrics_labels
+        status = '500' if exc is not None else str(g.get('metrics_status', 500))
+        REGISTRY.observe('physioengine_request_duration_seconds', labels, time.perf_counter() - start)
+        REGISTRY.inc('physioengine_requests_total', labels + (status,))
+        REGISTRY.dec('physioengine_requests_in_flight', labels)
+        writer.maybe_flush()
+
+    def start_template_timer(sender, template, context, **extra):
+        local.template_start = time.perf_counter()
+
+    def stop_template_timer(sender, template, context, **extra):
+        start = getattr(local, 'template_start', None)
+        if start is not None:
+            REGISTRY.observe('physioengine_operation_duration_seconds', ('template_render',),
+                             time.perf_counter() - start)
+
+    before_render_template.connect(start_template_timer, app, weak=False)
+    template_rendered.connect(stop_template_timer, app, weak=False)
+
+    token = app.config.get('METRICS_TOKEN')
+    if not token:
+        return writer
+
+    def metrics_endpoint():
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                   f'Bearer {token}'.encode('utf-8')):
+            abort(401)
+        writer.flush()
+        body = render_prometheus(merge_snapshots(writer.directory), REGISTRY.buckets)
+        return Response(body, mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_endpoint)
+    return writer
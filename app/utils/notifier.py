@@ -0,0 +1,139 @@
+"""
+In-process publish/subscribe channel for "result ready" notifications.
+
+Waiting pages subscribe to their session ID and block on a threading.Event.
+``handle_form_submission`` publishes the session ID after the responses are
+saved, which wakes every waiter for that session in the same worker
+immediately. Waiters in other gunicorn workers are not reached by the event,
+so they also re-check result storage every poll interval as a fallback.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class ResultNotifier:
+    """
+    Wakes threads that are waiting for a session's result.
+
+    Only sessions with at least one active subscriber are tracked, so
+    publishing for a session nobody is waiting on costs a dict lookup.
+    """
+
+    def __init__(self, max_streams=None):
+        self._lock = threading.Lock()
+        self._channels = {}
+        self.max_streams = max_streams
+        self.streams = 0
+
+    @contextmanager
+    def stream_slot(self):
+        """
+        Claim one of the ``max_streams`` long-lived event streams of this process.
+
+        Yields:
+            bool: True if a slot was free and is held until the block exits,
+            False if the limit is reached.
+        """
+        with self._lock:
+            admitted = self.max_streams is None or self.streams < self.max_streams
+            if admitted:
+                self.streams += 1
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._lock:
+                    self.streams -= 1
+
+    @contextmanager
+    def subscribe(self, session_id):
+        """
+        Subscribe to notifications for a session.
+
+        Args:
+            session_id (str): Session to wait for.
+
+        Yields:
+            threading.Event: Set when a result is published for the session.
+        """
+        with self._lock:
+            channel = self._channels.get(session_id)
+            if channel is None:
+                channel = self._channels[session_id] = [threading.Event(), 0]
+            channel[1] += 1
+        try:
+            yield channel[0]
+        finally:
+            with self._lock:
+                channel[1] -= 1
+                if channel[1] == 0 and self._channels.get(session_id) is channel:
+                    del self._channels[session_id]
+
+    def publish(self, session_id):
+        """
+        Wake all subscribers of a session in this process.
+
+        Args:
+            session_id (str): Session whose result is now available.
+        """
+        with self._lock:
+            channel = self._channels.get(session_id)
+        if channel is not None:
+            channel[0].set()
+
+    def wait(self, session_id, is_ready, timeout, poll_interval):
+        """
+        Block until a session's result is ready or the timeout expires.
+
+        Args:
+            session_id (str): Session to wait for.
+            is_ready (callable): Returns True when the result exists in
+                storage. Used to notice results saved by other workers.
+            timeout (float): Maximum number of seconds to wait.
+            poll_interval (float): Seconds between ``is_ready`` checks.
+
+        Returns:
+            bool: True if the result is ready, False on timeout.
+        """
+        deadline = time.monotonic() + timeout
+        with self.subscribe(session_id) as event:
+            while True:
+                if event.is_set() or is_ready():
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                event.wait(min(poll_interval, remaining))
+
+
+def init_app(app):
+    """
+    Attach a ResultNotifier to ``app``.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        ResultNotifier: The notifier stored in ``app.extensions``.
+    """
+    notifier = ResultNotifier(app.config['RESULT_EVENTS_MAX_STREAMS'])
+    app.extensions['result_notifier'] = notifier
+    return notifier
+
+
+def get_notifier(app=None):
+    """
+    Return the result notifier of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        ResultNotifier: The notifier created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['result_notifier']
@@ -0,0 +1,672 @@
+"""
+Append-only, columnar archive of scored questionnaire submissions.
+
+Each questionnaire is stored under ``ARCHIVE_DIR/<slug>/<schema>/``, where
+``schema`` is a fingerprint of its scored question IDs and sections, so a
+change to ``QUESTIONNAIRES`` starts a new set of files instead of corrupting
+the old ones. A record is one fixed-size NumPy structured row: timestamp,
+clinic, pseudonymous patient key, per-item answers (-1 when unanswered),
+section scores and total score (NaN when not scored).
+
+Submissions are appended as raw rows to ``journal-<n>.bin`` under a file
+lock, which is safe across gunicorn workers. When the journal is large
+enough it is compacted: appends move on to ``journal-<n+1>.bin`` and the old
+journal becomes the immutable segment ``seg-<n>-<n>.npy``, which is read
+through a memory map. When there are too many segments they are merged into
+one covering their whole range.
+
+Running aggregates per clinic and per patient (count, mean, spread,
+histogram of total scores and per-section means) are snapshotted to
+``aggregates.json`` at every compaction. Each process loads the snapshot and
+folds in only the journal rows it has not seen yet, so dashboards never
+rescan the archive. ``export`` streams the raw rows as NDJSON or CSV.
+"""
+
+import csv
+import glob
+import hashlib
+import hmac
+import io
+import json
+import math
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import click
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from app.utils.scoring import PLANS, get_plan
+
+PSEUDONYM_BYTES = 16
+CLINIC_BYTES = 32
+HISTOGRAM_BINS = 10
+
+_JOURNAL_RE = re.compile(r'^journal-(\d+)\.bin$')
+_SEGMENT_RE = re.compile(r'^seg-(\d+)-(\d+)\.npy$')
+
+
+class PseudonymKeyMissing(ValueError):
+    """A patient identifier was given but ``ARCHIVE_PSEUDONYM_KEY`` is not set."""
+
+
+def pseudonymize(secret, clinic, patient):
+    """
+    Derive a stable pseudonymous key for a patient.
+
+    The key is an HMAC of the clinic and the clinic's own patient identifier,
+    so the archive never contains the identifier and keys cannot be reversed
+    without the secret.
+
+    Args:
+        secret (str): ``ARCHIVE_PSEUDONYM_KEY``.
+        clinic (str): Clinic identifier.
+        patient (str): The clinic's patient identifier.
+
+    Returns:
+        str: Hex key, or an empty string if no patient was given.
+
+    Raises:
+        PseudonymKeyMissing: If a patient is given but no secret is set.
+    """
+    if not patient:
+        return ''
+    if not secret:
+        raise PseudonymKeyMissing('patient identifiers are disabled without ARCHIVE_PSEUDONYM_KEY')
+    digest = hmac.new(secret.encode('utf-8'), f'{clinic}\x00{patient}'.encode('utf-8'), hashlib.sha256)
+    return digest.hexdigest()[:PSEUDONYM_BYTES * 2]
+
+
+class RunningStats:
+    """
+    Mergeable running statistics of total and section scores.
+
+    Attributes:
+        count (int): Number of scored submissions.
+        histogram (list): Totals per 10-point bin from 0 to 100.
+        sections (dict): Section name to ``[sum, count]``.
+        last (float): Timestamp of the latest submission.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.min = None
+        self.max = None
+        self.histogram = [0] * HISTOGRAM_BINS
+        self.sections = {}
+        self.last = 0.0
+
+    def add(self, total, section_scores, timestamp):
+        """Fold in one submission; NaN scores are skipped."""
+        if not math.isnan(total):
+            self.count += 1
+            self.total += total
+            self.total_sq += total * total
+            self.min = total if self.min is None else min(self.min, total)
+            self.max = total if self.max is None else max(self.max, total)
+            self.histogram[min(max(int(total // (100 / HISTOGRAM_BINS)), 0), HISTOGRAM_BINS - 1)] += 1
+        for name, score in section_scores:
+            if not math.isnan(score):
+                entry = self.sections.setdefault(name, [0.0, 0])
+                entry[0] += score
+                entry[1] += 1
+        self.last = max(self.last, timestamp)
+
+    def merge(self, other):
+        """Add another RunningStats to this one."""
+        self.count += other.count
+        self.total += other.total
+        self.total_sq += other.total_sq
+        for attr, pick in (('min', min), ('max', max)):
+            mine, theirs = getattr(self, attr), getattr(other, attr)
+            setattr(self, attr, theirs if mine is None else mine if theirs is None else pick(mine, theirs))
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        for name, (score_sum, count) in other.sections.items():
+            entry = self.sections.setdefault(name, [0.0, 0])
+            entry[0] += score_sum
+            entry[1] += count
+        self.last = max(self.last, other.last)
+
+    def summary(self):
+        """
+        Return the statistics for display.
+
+        Returns:
+            dict: ``count``, ``mean``, ``std``, ``min``, ``max``,
+            ``histogram``, per-section ``sections`` means and ``last``.
+        """
+        mean = self.total / self.count if self.count else None
+        std = math.sqrt(max(self.total_sq / self.count - mean * mean, 0.0)) if self.count else None
+        return {
+            'count': self.count,
+            'mean': mean,
+            'std': std,
+            'min': self.min,
+            'max': self.max,
+            'histogram': list(self.histogram),
+            'sections': {name: score_sum / count for name, (score_sum, count) in self.sections.items() if count},
+            'last': self.last,
+        }
+
+    def to_dict(self):
+        return {'count': self.count, 'total': self.total, 'total_sq': self.total_sq, 'min': self.min,
+                'max': self.max, 'histogram': self.histogram, 'sections': self.sections, 'last': self.last}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key, value in data.items():
+            setattr(stats, key, value)
+        return stats
+
+
+class ArchiveSchema:
+    """
+    One schema version of a questionnaire's archive on disk.
+
+    Attributes:
+        path (str): Directory of this schema version.
+        question_ids (tuple): Column order of the answers.
+        section_names (tuple): Column order of the section scores.
+        dtype (numpy.dtype): Structured record type.
+    """
+
+    def __init__(self, path, question_ids, section_names):
+        import numpy as np
+
+        self.path = path
+        self.question_ids = tuple(question_ids)
+        self.section_names = tuple(section_names)
+        self.dtype = np.dtype([
+            ('ts', '<f8'),
+            ('clinic', f'S{CLINIC_BYTES}'),
+            ('patient', 'u1', (PSEUDONYM_BYTES,)),
+            ('answers', 'i1', (len(self.question_ids),)),
+            ('scores', '<f4', (len(self.section_names),)),
+            ('total', '<f4'),
+        ])
+        self._lock_path = os.path.join(path, 'lock')
+        self._aggregates_path = os.path.join(path, 'aggregates.json')
+        # In-memory aggregates: snapshot plus the journal rows folded since
+        self._snapshot_mtime = None
+        self._generation = 0
+        self._offsets = {}
+        self._clinics = {}
+        self._patients = {}
+        self._state_lock = threading.Lock()
+
+    @classmethod
+    def open(cls, root, slug, question_ids, section_names):
+        """Open or create the schema directory for a questionnaire layout."""
+        layout = json.dumps({'question_ids': list(question_ids), 'section_names': list(section_names)},
+                            ensure_ascii=False)
+        fingerprint = hashlib.sha256(layout.encode('utf-8')).hexdigest()[:12]
+        path = os.path.join(root, slug, fingerprint)
+        schema_file = os.path.join(path, 'schema.json')
+        if not os.path.exists(schema_file):
+            os.makedirs(path, exist_ok=True)
+            tmp_path = f'{schema_file}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                file.write(layout)
+            os.replace(tmp_path, schema_file)
+        return cls(path, question_ids, section_names)
+
+    @classmethod
+    def load(cls, path):
+        """Open an existing schema directory from its ``schema.json``."""
+        with open(os.path.join(path, 'schema.json'), encoding='utf-8') as file:
+            layout = json.load(file)
+        return cls(path, layout['question_ids'], layout['section_names'])
+
+    @contextmanager
+    def lock(self, exclusive=True):
+        with open(self._lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield
+
+    def journals(self):
+        """Return ``(generation, path)`` of every journal, oldest first."""
+        found = []
+        for filename in os.listdir(self.path):
+            match = _JOURNAL_RE.match(filename)
+            if match:
+                found.append((int(match.group(1)), os.path.join(self.path, filename)))
+        return sorted(found)
+
+    def segments(self):
+        """Return ``(first, last, path)`` of the segments, skipping ones a merged segment replaced."""
+        found = []
+        for filename in os.listdir(self.path):
+            match = _SEGMENT_RE.match(filename)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2)), os.path.join(self.path, filename)))
+        found.sort(key=lambda item: (item[0], -item[1]))
+        segments = []
+        for first, last, path in found:
+            if segments and last <= segments[-1][1]:
+                continue
+            segments.append((first, last, path))
+        return segments
+
+    def append(self, record):
+        """
+        Append one record to the current journal.
+
+        Args:
+            record (numpy.ndarray): A one-element array of ``dtype``.
+
+        Returns:
+            int: Number of records in the journal after the append.
+        """
+        data = record.tobytes()
+        with self.lock():
+            journals = self.journals()
+            generation = journals[-1][0] if journals else self._last_segment_generation() + 1
+            path = os.path.join(self.path, f'journal-{generation}.bin')
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                os.write(fd, data)
+                return os.fstat(fd).st_size // self.dtype.itemsize
+            finally:
+                os.close(fd)
+
+    def _last_segment_generation(self):
+        segments = self.segments()
+        return segments[-1][1] if segments else 0
+
+    def _read_journal(self, path, offset=0):
+        import numpy as np
+
+        with open(path, 'rb') as file:
+            file.seek(offset * self.dtype.itemsize)
+            data = file.read()
+        # A partially written trailing record is left for the next read
+        count = len(data) // self.dtype.itemsize
+        return np.frombuffer(data, dtype=self.dtype, count=count)
+
+    def records(self, chunk_size=4096):
+        """
+        Iterate over all records, oldest first, in chunks.
+
+        Segments are memory mapped, so only the rows being exported are read.
+        They are all mapped under the lock: a merge may remove their files
+        while the export runs, but a mapping stays readable after the unlink.
+
+        Yields:
+            numpy.ndarray: Up to ``chunk_size`` records.
+        """
+        import numpy as np
+
+        with self.lock(exclusive=False):
+            segments = self.segments()
+            covered = segments[-1][1] if segments else 0
+            parts = [np.load(path, mmap_mode='r') for _, _, path in segments]
+            parts.extend(self._read_journal(path) for generation, path in self.journals() if generation > covered)
+        for rows in parts:
+            for start in range(0, len(rows), chunk_size):
+                yield rows[start:start + chunk_size]
+
+    def compact(self, max_segments):
+        """
+        Turn the journals into segments and merge segments if there are too many.
+
+        Returns:
+            int: Number of journal records moved into segments.
+        """
+        import numpy as np
+
+        moved = 0
+        with self.lock():
+            journals = self.journals()
+            if not journals:
+                return 0
+            # New appends go to a fresh journal from now on
+            current = journals[-1][0]
+            open(os.path.join(self.path, f'journal-{current + 1}.bin'), 'ab').close()
+
+            snapshot = self._read_snapshot()
+            clinics = {key: RunningStats.from_dict(value) for key, value in snapshot['clinics'].items()}
+            patients = {key: RunningStats.from_dict(value) for key, value in snapshot['patients'].items()}
+            existing = {(first, last) for first, last, _ in self.segments()}
+            for generation, path in journals:
+                if generation <= snapshot['generation']:
+                    os.remove(path)
+                    continue
+                rows = self._read_journal(path)
+                if (generation, generation) not in existing and len(rows):
+                    self._write_segment(rows, generation, generation)
+                self._fold(rows, clinics, patients)
+                moved += len(rows)
+
+            self._write_snapshot(current, clinics, patients)
+            for generation, path in journals:
+                if os.path.exists(path):
+                    os.remove(path)
+
+            segments = self.segments()
+            if len(segments) > max_segments:
+                merged = np.concatenate([np.load(path, mmap_mode='r') for _, _, path in segments])
+                self._write_segment(merged, segments[0][0], segments[-1][1])
+                for _, _, path in segments:
+                    os.remove(path)
+        return moved
+
+    def _write_segment(self, rows, first, last):
+        import numpy as np
+
+        path = os.path.join(self.path, f'seg-{first}-{last}.npy')
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'wb') as file:
+            np.save(file, np.ascontiguousarray(rows))
+        os.replace(tmp_path, path)
+
+    def _read_snapshot(self):
+        try:
+            with open(self._aggregates_path, encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {'generation': 0, 'clinics': {}, 'patients': {}}
+
+    def _write_snapshot(self, generation, clinics, patients):
+        data = {
+            'generation': generation,
+            'clinics': {key: stats.to_dict() for key, stats in clinics.items()},
+            'patients': {key: stats.to_dict() for key, stats in patients.items()},
+        }
+        tmp_path = f'{self._aggregates_path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump(data, file, ensure_ascii=False, separators=(',', ':'))
+        os.replace(tmp_path, self._aggregates_path)
+
+    def _fold(self, rows, clinics, patients):
+        names = self.section_names
+        for row in rows:
+            sections = list(zip(names, row['scores'].tolist()))
+            total = float(row['total'])
+            timestamp = float(row['ts'])
+            clinics.setdefault(row['clinic'].decode('utf-8', 'replace'), RunningStats()).add(total, sections, timestamp)
+            patient = _patient_key(row)
+            if patient:
+                patients.setdefault(patient, RunningStats()).add(total, sections, timestamp)
+
+    def aggregates(self):
+        """
+        Return the up-to-date running aggregates.
+
+        Only journal rows appended since the last call are read.
+
+        Returns:
+            tuple: ``(clinics, patients)`` dicts of RunningStats.
+        """
+        with self._state_lock, self.lock(exclusive=False):
+            try:
+                mtime = os.stat(self._aggregates_path).st_mtime_ns
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._snapshot_mtime:
+                snapshot = self._read_snapshot()
+                self._snapshot_mtime = mtime
+                self._generation = snapshot['generation']
+                self._offsets = {}
+                self._clinics = {key: RunningStats.from_dict(value) for key, value in snapshot['clinics'].items()}
+                self._patients = {key: RunningStats.from_dict(value) for key, value in snapshot['patients'].items()}
+            for generation, path in self.journals():
+                if generation <= self._generation:
+                    continue
+                offset = self._offsets.get(generation, 0)
+                rows = self._read_journal(path, offset)
+                if len(rows):
+                    self._fold(rows, self._clinics, self._patients)
+                    self._offsets[generation] = offset + len(rows)
+        return self._clinics, self._patients
+
+
+class OutcomeArchive:
+    """
+    Archive of scored submissions for all questionnaires.
+
+    Attributes:
+        directory (str): Root directory of the archive.
+        journal_max_records (int): Journal size that triggers a compaction.
+        max_segments (int): Segment count above which segments are merged.
+    """
+
+    def __init__(self, directory, secret, journal_max_records=1000, max_segments=16):
+        self.directory = directory
+        self.secret = secret
+        self.journal_max_records = journal_max_records
+        self.max_segments = max_segments
+        self._schemas = {}
+
+    def schema(self, slug):
+        """Return the current schema version of a questionnaire's archive."""
+        schema = self._schemas.get(slug)
+        if schema is None:
+            plan = get_plan(slug)
+            schema = ArchiveSchema.open(self.directory, slug, plan.question_ids,
+                                        [section for section, _, _ in plan.sections])
+            self._schemas[slug] = schema
+        return schema
+
+    def schemas(self, slug):
+        """Return every schema version stored for a questionnaire, current one last."""
+        current = self.schema(slug)
+        older = [ArchiveSchema.load(os.path.dirname(path))
+                 for path in sorted(glob.glob(os.path.join(self.directory, slug, '*', 'schema.json')))
+                 if os.path.dirname(path) != current.path]
+        return older + [current]
+
+    def pseudonymize(self, clinic, patient):
+        """Return the pseudonymous key of a clinic's patient identifier."""
+        return pseudonymize(self.secret, clinic, patient)
+
+    def append(self, slug, responses, result, clinic='', patient_key='', timestamp=None):
+        """
+        Archive one scored submission.
+
+        Args:
+            slug (str): Questionnaire slug.
+            responses (dict): Question ID to answer. Non-numeric answers are
+                not archived.
+            result (dict): The scoring result from ``ScoringPlan.score``.
+            clinic (str, optional): Clinic identifier.
+            patient_key (str, optional): Key from ``pseudonymize``.
+            timestamp (float, optional): Submission time. Defaults to now.
+        """
+        import numpy as np
+
+        schema = self.schema(slug)
+        record = np.zeros(1, dtype=schema.dtype)
+        record['ts'] = time.time() if timestamp is None else timestamp
+        record['clinic'] = clinic.encode('utf-8')[:CLINIC_BYTES]
+        if patient_key:
+            record['patient'] = np.frombuffer(bytes.fromhex(patient_key), dtype='u1')
+        record['answers'] = [value if value.__class__ is int and -128 <= value < 128 else -1
+                             for value in (responses.get(q) for q in schema.question_ids)]
+        scores = {section['name']: section['score'] for section in result['sections']}
+        record['scores'] = [scores.get(name, np.nan) for name in schema.section_names]
+        record['total'] = result['total_score'] if result['sections'] else np.nan
+
+        if schema.append(record) >= self.journal_max_records:
+            schema.compact(self.max_segments)
+
+    def compact(self, slug=None):
+        """
+        Compact the journals of one or all questionnaires.
+
+        Returns:
+            int: Number of records moved into segments.
+        """
+        slugs = [slug] if slug else list(PLANS)
+        return sum(schema.compact(self.max_segments) for s in slugs for schema in self.schemas(s))
+
+    def aggregates(self, slug, clinic=None, patient_key=None):
+        """
+        Return running aggregates of a questionnaire without scanning the archive.
+
+        Args:
+            slug (str): Questionnaire slug.
+            clinic (str, optional): Only this clinic. Defaults to all clinics.
+            patient_key (str, optional): Only this patient.
+
+        Returns:
+            dict: See ``RunningStats.summary``.
+        """
+        stats = RunningStats()
+        for schema in self.schemas(slug):
+            clinics, patients = schema.aggregates()
+            if patient_key is not None:
+                if patient_key in patients:
+                    stats.merge(patients[patient_key])
+            elif clinic is not None:
+                if clinic in clinics:
+                    stats.merge(clinics[clinic])
+            else:
+                for clinic_stats in clinics.values():
+                    stats.merge(clinic_stats)
+        return stats.summary()
+
+    def clinic_summaries(self, slug):
+        """Return ``{clinic: summary}`` for every clinic of a questionnaire."""
+        merged = {}
+        for schema in self.schemas(slug):
+            clinics, _ = schema.aggregates()
+            for clinic, clinic_stats in clinics.items():
+                merged.setdefault(clinic, RunningStats()).merge(clinic_stats)
+        return {clinic: stats.summary() for clinic, stats in merged.items()}
+
+    def export(self, slug, fmt='ndjson', clinic=None, since=None):
+        """
+        Stream the archived submissions of a questionnaire.
+
+        Args:
+            slug (str): Questionnaire slug.
+            fmt (str, optional): 'ndjson' or 'csv'. Defaults to 'ndjson'.
+            clinic (str, optional): Only rows of this clinic.
+            since (float, optional): Only rows at or after this timestamp.
+
+        Yields:
+            str: Lines of output, each ending with a newline.
+        """
+        schemas = self.schemas(slug)
+        if fmt == 'csv':
+            sections = list(dict.fromkeys(name for schema in schemas for name in schema.section_names))
+            questions = list(dict.fromkeys(q for schema in schemas for q in schema.question_ids))
+            buffer = io.StringIO()
+            writer = csv.DictWriter(buffer, ['questionnaire', 'time', 'clinic', 'patient', 'total']
+                                    + sections + questions, restval='')
+            writer.writeheader()
+
+        for schema in schemas:
+            for rows in schema.records():
+                if clinic is not None:
+                    rows = rows[rows['clinic'] == clinic.encode('utf-8')[:CLINIC_BYTES]]
+                if since is not None:
+                    rows = rows[rows['ts'] >= since]
+                if fmt != 'csv':
+                    for row in rows:
+                        yield json.dumps(_row_to_dict(schema, slug, row), ensure_ascii=False) + '\n'
+                    continue
+                for row in rows:
+                    entry = _row_to_dict(schema, slug, row)
+                    sections_and_answers = {**entry.pop('sections'), **entry.pop('answers')}
+                    writer.writerow({**entry, **sections_and_answers})
+                # One chunk per block of rows keeps memory flat for large exports
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if fmt == 'csv' and buffer.tell():
+            yield buffer.getvalue()
+
+
+def _patient_key(row):
+    key = row['patient'].tobytes()
+    return key.hex() if any(key) else ''
+
+
+def _row_to_dict(schema, slug, row):
+    total = float(row['total'])
+    return {
+        'questionnaire': slug,
+        'time': datetime.fromtimestamp(float(row['ts']), timezone.utc).isoformat(),
+        'clinic': row['clinic'].decode('utf-8', 'replace'),
+        'patient': _patient_key(row),
+        'total': None if math.isnan(total) else total,
+        'sections': {name: score for name, score in zip(schema.section_names, row['scores'].tolist())
+                     if not math.isnan(score)},
+        'answers': {q: value for q, value in zip(schema.question_ids, row['answers'].tolist()) if value >= 0},
+    }
+
+
+def init_app(app):
+    """
+    Create the outcome archive for ``app`` and register ``flask archive`` commands.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        OutcomeArchive: The archive stored in ``app.extensions``.
+    """
+    archive = OutcomeArchive(
+        directory=app.config['ARCHIVE_DIR'],
+        secret=app.config['ARCHIVE_PSEUDONYM_KEY'],
+        journal_max_records=app.config['ARCHIVE_JOURNAL_MAX_RECORDS'],
+        max_segments=app.config['ARCHIVE_MAX_SEGMENTS'],
+    )
+    app.extensions['outcome_archive'] = archive
+
+    @app.cli.group('archive')
+    def archive_group():
+        """Inspect, compact and export the outcome archive."""
+
+    @archive_group.command('compact')
+    @click.option('--questionnaire', help='Only compact this questionnaire.')
+    def compact_command(questionnaire):
+        """Move journal records into segments."""
+        click.echo(f'Compacted {archive.compact(questionnaire)} records.')
+
+    @archive_group.command('export')
+    @click.argument('questionnaire')
+    @click.option('--format', 'fmt', type=click.Choice(['ndjson', 'csv']), default='ndjson')
+    @click.option('--clinic', help='Only export this clinic.')
+    @click.option('--since', type=float, help='Only export submissions after this Unix time.')
+    def export_command(questionnaire, fmt, clinic, since):
+        """Stream a questionnaire's submissions to stdout."""
+        for chunk in archive.export(questionnaire, fmt, clinic, since):
+            click.echo(chunk, nl=False)
+
+    @archive_group.command('stats')
+    @click.argument('questionnaire')
+    def stats_command(questionnaire):
+        """Show the running aggregates per clinic."""
+        for clinic, summary in sorted(archive.clinic_summaries(questionnaire).items()):
+            click.echo(f"{clinic or '(no clinic)'}: {json.dumps(summary, ensure_ascii=False)}")
+
+    return archive
+
+
+def get_archive(app=None):
+    """
+    Return the outcome archive of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        OutcomeArchive: The archive created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['outcome_archive']
@@ -0,0 +1,366 @@
+"""
+Render-once cache for questionnaire pages.
+
+A questionnaire page is the same for every patient apart from the session ID
+in the form action. ``PageCache`` renders each page once per questionnaire,
+language, registry generation and template version, using a placeholder for
+the session ID, and splits the HTML at the placeholder. A request only joins
+the cached segments around its own session ID.
+
+Every static segment is also kept as an independently compressed, byte
+aligned raw deflate stream. Deflate streams flushed with ``Z_FULL_FLUSH`` can
+be concatenated, so a gzip body for a session is the precompressed segments
+with the few compressed bytes of the session ID between them, a gzip header
+and a trailer.
+
+When the ``brotli`` package is installed pages are also served brotli
+encoded. Brotli streams cannot be spliced like deflate, so pages without
+per-session parts are compressed once at the highest quality, and pages with
+a session ID are compressed whole the first time a session asks for them, at
+the faster ``brotli_quality``, and kept in a small per-page LRU for its
+reloads and submissions.
+
+Responses carry a strong ETag per encoding and ``Vary: Accept-Encoding``,
+and conditional requests are answered with 304. Concurrent misses for the
+same page are coalesced so only one thread renders it.
+
+Pages that are not cached, because the cache is disabled or the session ID
+cannot be injected verbatim, are streamed with ``stream_page`` when the
+cache is created with ``stream=True``.
+"""
+
+import hashlib
+import re
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+
+from flask import Response, current_app, render_template, request
+from jinja2 import meta
+
+from app.utils.metrics import timer
+from app.utils.questionnaire_registry import get_registry
+from app.utils.streaming import stream_page
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Stands in for the session ID while rendering. It survives URL quoting and
+# HTML escaping unchanged, so it can be found again in the output.
+SESSION_PLACEHOLDER = 'pagecachesessionplaceholder0'
+
+# Session IDs are only injected verbatim if URL quoting and HTML escaping
+# would leave them unchanged as well. Signed session tokens use '.' as their
+# separator and are longer than a UUID.
+_SAFE_SESSION_ID = re.compile(r'^[A-Za-z0-9_.-]{1,512}$')
+
+# gzip header: magic, deflate, no flags, no mtime, no extra flags, unknown OS
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+# A final, empty stored deflate block
+_DEFLATE_END = zlib.compressobj(wbits=-zlib.MAX_WBITS).flush(zlib.Z_FINISH)
+
+
+def _deflate(data, level):
+    """Compress ``data`` as a byte-aligned, non-final raw deflate stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FULL_FLUSH)
+
+
+def _accepted_encodings():
+    """Return the content codings the client accepts, best first."""
+    accept = request.accept_encodings
+    encodings = []
+    if brotli is not None and accept['br']:
+        encodings.append('br')
+    if accept['gzip']:
+        encodings.append('gzip')
+    return encodings
+
+
+class CachedPage:
+    """
+    A rendered page split around the session ID, with compressed variants.
+
+    Attributes:
+        segments (tuple): UTF-8 encoded HTML between session ID slots.
+        deflated (tuple): Each segment as a raw deflate stream.
+        brotli_quality (int): Brotli quality of the per-session variants.
+        brotli_sessions (int): Per-session brotli variants kept.
+        etag (str): Digest of the rendered template output.
+        uptodate (tuple): Jinja callables that report whether the page's
+            template sources are unchanged.
+    """
+
+    def __init__(self, html, level, uptodate=(), brotli_quality=5, brotli_sessions=256):
+        self.segments = tuple(part.encode('utf-8') for part in html.split(SESSION_PLACEHOLDER))
+        self.deflated = tuple(_deflate(segment, level) for segment in self.segments)
+        self.level = level
+        self.brotli_quality = brotli_quality
+        self.brotli_sessions = brotli_sessions
+        self._brotli_bodies = OrderedDict()
+        self._brotli_lock = threading.Lock()
+        if brotli is not None and len(self.segments) == 1:
+            self._brotli_bodies[None] = brotli.compress(self.segments[0], mode=brotli.MODE_TEXT)
+        self.etag = hashlib.sha256(html.encode('utf-8')).hexdigest()[:32]
+        self.uptodate = tuple(uptodate)
+
+    def is_current(self):
+        """Return True if none of the page's templates changed on disk."""
+        return all(check() for check in self.uptodate)
+
+    def body(self, session_id=None):
+        """Return the identity-encoded page for a session."""
+        if len(self.segments) == 1:
+            return self.segments[0]
+        return session_id.encode('ascii').join(self.segments)
+
+    def brotli_body(self, session_id=None):
+        """Return the brotli-encoded page for a session, compressing it on first use."""
+        if len(self.segments) == 1:
+            return self._brotli_bodies[None]
+        with self._brotli_lock:
+            body = self._brotli_bodies.get(session_id)
+            if body is not None:
+                self._brotli_bodies.move_to_end(session_id)
+                return body
+        with timer('page_compress_br'):
+            body = brotli.compress(self.body(session_id), quality=self.brotli_quality, mode=brotli.MODE_TEXT)
+        with self._brotli_lock:
+            self._brotli_bodies[session_id] = body
+            while len(self._brotli_bodies) > self.brotli_sessions:
+                self._brotli_bodies.popitem(last=False)
+        return body
+
+    def gzip_body(self, session_id=None):
+        """Return the gzip-encoded page for a session from the deflated segments."""
+        crc = 0
+        size = 0
+        parts = [_GZIP_HEADER]
+        slot = session_id.encode('ascii') if session_id else b''
+        slot_deflated = _deflate(slot, self.level) if slot else b''
+        for index, (segment, deflated) in enumerate(zip(self.segments, self.deflated)):
+            if index:
+                parts.append(slot_deflated)
+                crc = zlib.crc32(slot, crc)
+                size += len(slot)
+            parts.append(deflated)
+            crc = zlib.crc32(segment, crc)
+            size += len(segment)
+        parts.append(_DEFLATE_END)
+        parts.append(struct.pack('<II', crc, size & 0xffffffff))
+        return b''.join(parts)
+
+    def response(self, session_id=None):
+        """
+        Build the response for the current request.
+
+        The client's Accept-Encoding picks the variant. Each variant has its
+        own strong ETag, derived from the page digest and the session ID, so
+        a revalidation gets a 304 without building the body.
+
+        Args:
+            session_id (str, optional): Session ID to inject into the page.
+
+        Returns:
+            Response: The page, or an empty 304 response.
+        """
+        encodings = _accepted_encodings()
+        encoding = encodings[0] if encodings else None
+
+        etag = self.etag
+        if len(self.segments) > 1:
+            etag = hashlib.sha256(f'{etag}:{session_id}'.encode('ascii')).hexdigest()[:32]
+        if encoding:
+            etag = f'{etag}-{encoding}'
+
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            if encoding == 'br':
+                body = self.brotli_body(session_id)
+            elif encoding == 'gzip':
+                body = self.gzip_body(session_id)
+            else:
+                body = self.body(session_id)
+            response = Response(body, mimetype='text/html')
+            if encoding:
+                response.content_encoding = encoding
+        response.set_etag(etag)
+        response.vary.add('Accept-Encoding')
+        # Revalidate every time: a reload of the questionnaire data changes the page
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+        return response
+
+
+class PageCache:
+    """
+    LRU cache of rendered pages with single-flight rendering.
+
+    Attributes:
+        max_entries (int): Maximum number of cached pages.
+        compress_level (int): zlib compression level of the gzip variants.
+        brotli_quality (int): Brotli quality of pages compressed per session.
+        brotli_sessions (int): Per-session brotli variants kept per page.
+        enabled (bool): Render every request normally when False.
+        stream (bool): Stream pages that are not served from the cache.
+        hits (int): Requests served from the cache.
+        misses (int): Requests that had to render the page.
+    """
+
+    def __init__(self, max_entries=64, compress_level=6, enabled=True, stream=False,
+                 brotli_quality=5, brotli_sessions=256):
+        self.max_entries = max_entries
+        self.compress_level = compress_level
+        self.brotli_quality = brotli_quality
+        self.brotli_sessions = brotli_sessions
+        self.enabled = enabled
+        self.stream = stream
+        self.hits = 0
+        self.misses = 0
+        self._pages = OrderedDict()
+        self._rendering = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, build):
+        """
+        Return the cached page for ``key``, building it once if needed.
+
+        Threads that miss while another thread builds the same page wait for
+        that build instead of rendering the page again.
+
+        Args:
+            key (tuple): Cache key.
+            build (callable): Returns a new CachedPage.
+
+        Returns:
+            CachedPage: The page.
+        """
+        while True:
+            with self._lock:
+                page = self._pages.get(key)
+                if page is not None and page.is_current():
+                    self._pages.move_to_end(key)
+                    self.hits += 1
+                    return page
+                pending = self._rendering.get(key)
+                if pending is None:
+                    pending = self._rendering[key] = threading.Event()
+                    break
+            # Another thread is rendering; if it failed, try again ourselves
+            pending.wait()
+
+        try:
+            page = build()
+            with self._lock:
+                self.misses += 1
+                self._pages[key] = page
+                self._pages.move_to_end(key)
+                while len(self._pages) > self.max_entries:
+                    self._pages.popitem(last=False)
+            return page
+        finally:
+            with self._lock:
+                del self._rendering[key]
+            pending.set()
+
+    def render(self, template_name, make_context, key, session_id=None):
+        """
+        Respond with a page rendered from ``template_name``.
+
+        Args:
+            template_name (str): Template to render.
+            make_context (callable): Called with the session ID, or the
+                placeholder when the page is cached, and returns the template
+                context.
+            key (tuple): Identifies the page content apart from the session,
+                e.g. ``(endpoint, slug, language)``.
+            session_id (str, optional): Session ID of pages with
+                per-session parts.
+
+        Returns:
+            Response: The page for the current request.
+        """
+        if not self.enabled or (session_id is not None and not _SAFE_SESSION_ID.match(session_id)):
+            if self.stream:
+                return stream_page(template_name, **make_context(session_id))
+            return Response(render_template(template_name, **make_context(session_id)), mimetype='text/html')
+
+        def build():
+            placeholder = SESSION_PLACEHOLDER if session_id is not None else None
+            html = render_template(template_name, **make_context(placeholder))
+            env = current_app.jinja_env
+            uptodate = _template_uptodate(env, template_name) if env.auto_reload else ()
+            with timer('page_compress'):
+                return CachedPage(html, self.compress_level, uptodate, self.brotli_quality, self.brotli_sessions)
+
+        page = self.get(key + (template_name, get_registry().generation), build)
+        return page.response(session_id)
+
+
+def _template_uptodate(env, template_name):
+    """
+    Collect the up-to-date checks of a template and everything it extends or includes.
+
+    Args:
+        env (jinja2.Environment): The application's Jinja environment.
+        template_name (str): Name of the top-level template.
+
+    Returns:
+        list: Callables that return False once a template source changed.
+    """
+    checks = []
+    seen = set()
+    pending = [template_name]
+    while pending:
+        name = pending.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        source, _, uptodate = env.loader.get_source(env, name)
+        if uptodate is not None:
+            checks.append(uptodate)
+        pending.extend(ref for ref in meta.find_referenced_templates(env.parse(source)) if ref)
+    return checks
+
+
+def init_app(app):
+    """
+    Attach a PageCache configured for ``app``.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        PageCache: The cache stored in ``app.extensions``.
+    """
+    cache = PageCache(
+        max_entries=app.config['PAGE_CACHE_SIZE'],
+        compress_level=app.config['PAGE_CACHE_COMPRESS_LEVEL'],
+        enabled=app.config['PAGE_CACHE_ENABLED'],
+        stream=app.config['TEMPLATE_STREAMING'],
+        brotli_quality=app.config['PAGE_CACHE_BROTLI_QUALITY'],
+        brotli_sessions=app.config['PAGE_CACHE_BROTLI_SESSIONS'],
+    )
+    app.extensions['page_cache'] = cache
+    return cache
+
+
+def get_page_cache(app=None):
+    """
+    Return the page cache of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        PageCache: The cache created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['page_cache']
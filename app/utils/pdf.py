@@ -0,0 +1,276 @@
+"""
+Minimal PDF writer for text, lines, filled rectangles and QR codes.
+
+Only the standard Helvetica fonts are used. Every PDF viewer has them, so
+no font files are embedded and documents stay a few kilobytes. Text is
+encoded as WinAnsi (cp1252), which covers Swedish characters. Page
+coordinates are in points with the origin at the top left corner; y grows
+downwards, unlike native PDF coordinates.
+
+``Document`` keeps all pages until it is serialised. ``StreamWriter`` emits
+each page as soon as it is drawn, for documents too large to hold in memory.
+"""
+
+import time
+import unicodedata
+import zlib
+
+A4 = (595.28, 841.89)
+
+# Advance widths (1/1000 em) of the printable ASCII characters, from the Adobe AFM files
+_HELVETICA = (
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+)
+_HELVETICA_BOLD = (
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+)
+FONTS = {False: ('F1', 'Helvetica', _HELVETICA), True: ('F2', 'Helvetica-Bold', _HELVETICA_BOLD)}
+
+
+def _char_width(char, widths):
+    code = ord(char)
+    if 32 <= code <= 126:
+        return widths[code - 32]
+    # Accented letters are as wide as their base letter
+    base = unicodedata.normalize('NFD', char)[0]
+    if base != char and 32 <= ord(base) <= 126:
+        return widths[ord(base) - 32]
+    return 556
+
+
+def text_width(text, size, bold=False):
+    """Return the width of ``text`` in points."""
+    widths = FONTS[bold][2]
+    return sum(_char_width(char, widths) for char in text) * size / 1000
+
+
+def wrap(text, width, size, bold=False):
+    """
+    Break ``text`` into lines that fit ``width`` points.
+
+    Returns:
+        list: The lines; words longer than a line are kept whole.
+    """
+    lines = []
+    line = ''
+    for word in str(text).split():
+        candidate = f'{line} {word}' if line else word
+        if line and text_width(candidate, size, bold) > width:
+            lines.append(line)
+            line = word
+        else:
+            line = candidate
+    if line or not lines:
+        lines.append(line)
+    return lines
+
+
+def _escape(text):
+    encoded = str(text).encode('cp1252', 'replace')
+    return encoded.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def _color(rgb):
+    return ' '.join(f'{channel:.3f}' for channel in rgb).encode('ascii')
+
+
+class Page:
+    """Drawing operations of one page."""
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self._ops = []
+
+    def text(self, x, y, text, size=10, bold=False, color=(0, 0, 0)):
+        """Draw one line of text with its baseline at ``y``."""
+        font = FONTS[bold][0]
+        self._ops.append(b'BT %s rg /%s %.2f Tf %.2f %.2f Td (%s) Tj ET' % (
+            _color(color), font.encode('ascii'), size, x, self.height - y, _escape(text)))
+
+    def text_right(self, x, y, text, size=10, bold=False, color=(0, 0, 0)):
+        """Draw text that ends at ``x``."""
+        self.text(x - text_width(text, size, bold), y, text, size, bold, color)
+
+    def rect(self, x, y, width, height, fill=None, stroke=None, line_width=0.5):
+        """Draw a rectangle whose top left corner is at ``(x, y)``."""
+        op = b'%.2f %.2f %.2f %.2f re' % (x, self.height - y - height, width, height)
+        self._paint(op, fill, stroke, line_width)
+
+    def line(self, x1, y1, x2, y2, color=(0, 0, 0), line_width=0.5):
+        """Draw a straight line."""
+        op = b'%.2f %.2f m %.2f %.2f l' % (x1, self.height - y1, x2, self.height - y2)
+        self._paint(op, None, color, line_width)
+
+    def modules(self, x, y, matrix, module_size):
+        """
+        Draw a matrix of dark modules, such as a QR code, as filled squares.
+
+        Args:
+            x (float): Left edge.
+            y (float): Top edge.
+            matrix (list): Rows of booleans, True for dark modules.
+            module_size (float): Side of one module in points.
+        """
+        runs = []
+        for row_index, row in enumerate(matrix):
+            column = 0
+            while column < len(row):
+                if not row[column]:
+                    column += 1
+                    continue
+                start = column
+                while column < len(row) and row[column]:
+                    column += 1
+                runs.append(b'%.2f %.2f %.2f %.2f re' % (
+                    x + start * module_size, self.height - y - (row_index + 1) * module_size,
+                    (column - start) * module_size, module_size))
+        if runs:
+            self._ops.append(b'q 0 0 0 rg ' + b' '.join(runs) + b' f Q')
+
+    def _paint(self, path, fill, stroke, line_width):
+        ops = [b'q']
+        if fill is not None:
+            ops.append(_color(fill) + b' rg')
+        if stroke is not None:
+            ops.append(_color(stroke) + b' RG %.2f w' % line_width)
+        ops.append(path)
+        ops.append(b'B' if fill is not None and stroke is not None else b'f' if fill is not None else b'S')
+        ops.append(b'Q')
+        self._ops.append(b' '.join(ops))
+
+    def content(self):
+        return b'\n'.join(self._ops)
+
+
+class StreamWriter:
+    """
+    Serialises a PDF one page at a time.
+
+    Call ``begin``, then ``add_page`` for every page and finally ``finish``,
+    and write the returned chunks out in that order.
+
+    Args:
+        size (tuple, optional): Page width and height in points. Defaults to A4.
+        title (str, optional): Document title shown by viewers.
+    """
+
+    def __init__(self, size=A4, title=''):
+        self.width, self.height = size
+        self.title = title
+        self._next_number = 1
+        self._offsets = {}
+        self._position = 0
+        self._kids = []
+        self._catalog = self._reserve()
+        self._pages = self._reserve()
+        self._fonts = {name: self._reserve() for name, _, _ in FONTS.values()}
+
+    def _reserve(self):
+        number = self._next_number
+        self._next_number += 1
+        return number
+
+    def _object(self, number, body):
+        chunk = b'%d 0 obj\n%s\nendobj\n' % (number, body)
+        self._offsets[number] = self._position
+        self._position += len(chunk)
+        return chunk
+
+    def new_page(self):
+        """Return a blank page of this document's size."""
+        return Page(self.width, self.height)
+
+    def begin(self):
+        """Return the file header and shared resources."""
+        header = b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n'
+        self._position = len(header)
+        chunks = [header]
+        for name, base, _ in FONTS.values():
+            chunks.append(self._object(self._fonts[name], b'<< /Type /Font /Subtype /Type1 /BaseFont /%s '
+                                       b'/Encoding /WinAnsiEncoding >>' % base.encode('ascii')))
+        return b''.join(chunks)
+
+    def add_page(self, page):
+        """Return the serialised objects of one page."""
+        stream = zlib.compress(page.content(), 9)
+        content = self._reserve()
+        chunks = [self._object(content, b'<< /Length %d /Filter /FlateDecode >>\nstream\n%s\nendstream'
+                               % (len(stream), stream))]
+        fonts = b' '.join(b'/%s %d 0 R' % (name.encode('ascii'), number) for name, number in self._fonts.items())
+        kid = self._reserve()
+        chunks.append(self._object(kid, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] '
+                                   b'/Resources << /Font << %s >> >> /Contents %d 0 R >>'
+                                   % (self._pages, self.width, self.height, fonts, content)))
+        self._kids.append(kid)
+        return b''.join(chunks)
+
+    def finish(self, created=None):
+        """
+        Return the page tree, document info, cross-reference table and trailer.
+
+        Args:
+            created (float, optional): Creation time (Unix). Defaults to now.
+        """
+        created = time.gmtime(time.time() if created is None else created)
+        chunks = [
+            self._object(self._pages, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (
+                b' '.join(b'%d 0 R' % kid for kid in self._kids), len(self._kids))),
+            self._object(self._catalog, b'<< /Type /Catalog /Pages %d 0 R >>' % self._pages),
+        ]
+        info = self._reserve()
+        chunks.append(self._object(info, b'<< /Title (%s) /Producer (PhysioEngine) /CreationDate (D:%s) >>'
+                                   % (_escape(self.title), time.strftime('%Y%m%d%H%M%SZ', created).encode('ascii'))))
+        count = self._next_number
+        chunks.append(b'xref\n0 %d\n0000000000 65535 f \n' % count)
+        chunks.extend(b'%010d 00000 n \n' % self._offsets[number] for number in range(1, count))
+        chunks.append(b'trailer\n<< /Size %d /Root %d 0 R /Info %d 0 R >>\nstartxref\n%d\n%%%%EOF\n'
+                      % (count, self._catalog, info, self._position))
+        return b''.join(chunks)
+
+
+class Document:
+    """
+    A PDF document built page by page.
+
+    Args:
+        size (tuple, optional): Page width and height in points. Defaults to A4.
+        title (str, optional): Document title shown by viewers.
+    """
+
+    def __init__(self, size=A4, title=''):
+        self.width, self.height = size
+        self.title = title
+        self.pages = []
+
+    def add_page(self):
+        """Append and return a blank page."""
+        page = Page(self.width, self.height)
+        self.pages.append(page)
+        return page
+
+    def to_bytes(self, created=None):
+        """
+        Serialise the document.
+
+        Args:
+            created (float, optional): Creation time (Unix). Defaults to now.
+
+        Returns:
+            bytes: The PDF file.
+        """
+        writer = StreamWriter((self.width, self.height), self.title)
+        chunks = [writer.begin()]
+        chunks.extend(writer.add_page(page) for page in self.pages)
+        chunks.append(writer.finish(created))
+        return b''.join(chunks)
@@ -0,0 +1,437 @@
+"""
+On-demand CPU and memory profiling of a live worker.
+
+Set ``PROFILING_TOKEN`` to register the endpoints below; every request must
+send ``Authorization: Bearer <PROFILING_TOKEN>``. Without a token nothing is
+registered, not even a request hook, so the code can stay in production
+builds at no cost. Each endpoint profiles only the worker that serves it;
+the ``X-Profile-Worker`` response header names the process.
+
+CPU (one profile per worker at a time, 409 while another is running):
+
+* ``POST /_profile/cpu?seconds=T`` samples the stacks of all threads that
+  handle requests during the next T seconds.
+* ``POST /_profile/cpu?requests=N`` samples only the next N requests this
+  worker handles (waiting at most ``PROFILING_MAX_SECONDS``).
+
+Both return collapsed stacks (``frame;frame;frame count``) for
+``flamegraph.pl``, speedscope or inferno. The statistical sampler runs in the
+profiling request's own thread, so profiled requests are not slowed down by
+tracing. ``mode=cprofile`` instead traces the next N requests with cProfile
+and returns ``pstats`` output: text sorted by cumulative time, or
+``format=pstats`` for snakeviz and gprof2dot.
+
+Memory (``tracemalloc``, per worker):
+
+* ``POST /_profile/memory/start?frames=N`` starts tracing and takes the
+  baseline snapshot.
+* ``GET /_profile/memory/diff?limit=N&group=lineno`` compares a new snapshot
+  with the baseline (``reset=1`` makes it the new baseline).
+* ``POST /_profile/memory/stop`` stops tracing and drops the snapshots.
+
+Tracing allocations slows the worker down noticeably, so stop it when done.
+"""
+
+import cProfile
+import hmac
+import io
+import marshal
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from flask import Response, abort, current_app, g, request
+
+# Shortest sampling interval accepted, in seconds
+MIN_SAMPLE_INTERVAL = 0.001
+
+GROUPS = ('lineno', 'filename', 'traceback')
+
+# Requests to these endpoints are never profiled themselves
+ENDPOINTS = ('profile_cpu', 'profile_memory_start', 'profile_memory_diff', 'profile_memory_stop')
+
+
+class ProfileBusy(RuntimeError):
+    """Raised when a CPU profile is requested while another one is running."""
+
+
+class _Capture:
+    """One running CPU profile: which requests it covers and what it collected."""
+
+    def __init__(self, requests, use_cprofile):
+        self.remaining = requests
+        self.all_requests = requests is None
+        self.use_cprofile = use_cprofile
+        self.threads = {}
+        self.stats = None
+        self.profiled = 0
+        self.closed = False
+        self.done = threading.Event()
+
+
+class WorkerProfiler:
+    """
+    Profiles the requests of the current process on demand.
+
+    Attributes:
+        sample_interval (float): Seconds between stack samples.
+        max_seconds (float): Longest CPU profile.
+        max_requests (int): Most requests in one CPU profile.
+    """
+
+    def __init__(self, sample_interval=0.005, max_seconds=60.0, max_requests=1000):
+        self.sample_interval = sample_interval
+        self.max_seconds = max_seconds
+        self.max_requests = max_requests
+        self.capture = None
+        self.baseline = None
+        self.baseline_time = None
+        self._lock = threading.Lock()
+        self._run_lock = threading.Lock()
+        self._labels = {}
+
+    # Request hooks
+
+    def enter_request(self):
+        """
+        Start covering the current request if a CPU profile wants it.
+
+        Returns:
+            _Capture or None: The profile covering the request, to be passed
+            to ``exit_request`` when it ends.
+        """
+        capture = self.capture
+        if capture is None:
+            return None
+        ident = threading.get_ident()
+        with self._lock:
+            if capture.closed or (not capture.all_requests and capture.remaining <= 0):
+                return None
+            if not capture.all_requests:
+                capture.remaining -= 1
+            profile = None
+            if capture.use_cprofile:
+                profile = cProfile.Profile()
+            capture.threads[ident] = profile
+            capture.profiled += 1
+        if profile is not None:
+            try:
+                profile.enable()
+            except ValueError:
+                # Python 3.12+ allows only one cProfile at a time per process
+                with self._lock:
+                    capture.threads[ident] = None
+                    capture.profiled -= 1
+        return capture
+
+    def exit_request(self, capture):
+        """
+        Stop covering the current request.
+
+        Args:
+            capture (_Capture): The profile returned by ``enter_request``.
+        """
+        with self._lock:
+            profile = capture.threads.pop(threading.get_ident(), None)
+            finished = not capture.all_requests and capture.remaining <= 0 and not capture.threads
+        if profile is not None:
+            # Always disabled, even if the profile already ended
+            profile.disable()
+            with self._lock:
+                if not capture.closed:
+                    if capture.stats is None:
+                        capture.stats = pstats.Stats(profile)
+                    else:
+                        capture.stats.add(profile)
+        if finished:
+            capture.done.set()
+
+    # CPU
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            filename = code.co_filename
+            for path in sorted(sys.path, key=len, reverse=True):
+                if path and filename.startswith(path + os.sep):
+                    filename = filename[len(path) + 1:]
+                    break
+            label = self._labels[code] = f'{code.co_name} ({filename}:{code.co_firstlineno})'
+        return label
+
+    def _stack(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        labels.reverse()
+        return ';'.join(labels)
+
+    def sample(self, seconds=None, requests=None):
+        """
+        Sample the stacks of request threads.
+
+        Exactly one of ``seconds`` and ``requests`` should be given.
+
+        Args:
+            seconds (float, optional): Sample every request for this long.
+            requests (int, optional): Sample the next N requests.
+
+        Returns:
+            tuple: ``(stacks, samples, requests)`` where ``stacks`` is a
+            Counter of collapsed stacks.
+
+        Raises:
+            ProfileBusy: If another CPU profile is running in this worker.
+        """
+        capture = self._begin(requests, use_cprofile=False)
+        stacks = Counter()
+        samples = 0
+        own = threading.get_ident()
+        deadline = time.monotonic() + min(seconds if seconds is not None else self.max_seconds, self.max_seconds)
+        try:
+            while not capture.done.is_set():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                with self._lock:
+                    threads = [ident for ident in capture.threads if ident != own]
+                if threads:
+                    frames = sys._current_frames()
+                    for ident in threads:
+                        frame = frames.get(ident)
+                        if frame is not None:
+                            stacks[self._stack(frame)] += 1
+                            samples += 1
+                    del frames
+                time.sleep(min(self.sample_interval, remaining))
+        finally:
+            self._end()
+        return stacks, samples, capture.profiled
+
+    def trace(self, requests):
+        """
+        Trace the next N requests with cProfile.
+
+        Args:
+            requests (int): Number of requests.
+
+        Returns:
+            tuple: ``(stats, requests)`` where ``stats`` is a pstats.Stats, or
+            None if no request was traced.
+
+        Raises:
+            ProfileBusy: If another CPU profile is running in this worker.
+        """
+        capture = self._begin(requests, use_cprofile=True)
+        try:
+            capture.done.wait(self.max_seconds)
+        finally:
+            self._end()
+        return capture.stats, capture.profiled
+
+    def _begin(self, requests, use_cprofile):
+        if not self._run_lock.acquire(blocking=False):
+            raise ProfileBusy('A CPU profile is already running in this worker')
+        capture = _Capture(None if requests is None else min(requests, self.max_requests), use_cprofile)
+        self.capture = capture
+        return capture
+
+    def _end(self):
+        with self._lock:
+            # Requests still running stop their profilers when they finish;
+            # their results are not included
+            self.capture.closed = True
+            self.capture = None
+        self._run_lock.release()
+
+    # Memory
+
+    def start_memory(self, frames=1):
+        """
+        Start tracing allocations and take the baseline snapshot.
+
+        Args:
+            frames (int, optional): Stack frames recorded per allocation.
+        """
+        with self._lock:
+            if tracemalloc.is_tracing():
+                tracemalloc.stop()
+            tracemalloc.start(frames)
+            self.baseline = self._snapshot()
+            self.baseline_time = time.time()
+
+    def stop_memory(self):
+        """Stop tracing allocations and drop the snapshots."""
+        with self._lock:
+            tracemalloc.stop()
+            self.baseline = None
+            self.baseline_time = None
+
+    def memory_diff(self, group='lineno', limit=25, reset=False):
+        """
+        Compare a new snapshot with the baseline.
+
+        Args:
+            group (str, optional): 'lineno', 'filename' or 'traceback'.
+            limit (int, optional): Entries with the largest growth returned.
+            reset (bool, optional): Make the new snapshot the baseline.
+
+        Returns:
+            str: A plain-text report, largest growth first, or None if
+            tracing is not running.
+        """
+        with self._lock:
+            if self.baseline is None or not tracemalloc.is_tracing():
+                return None
+            snapshot = self._snapshot()
+            baseline, baseline_time = self.baseline, self.baseline_time
+            if reset:
+                self.baseline, self.baseline_time = snapshot, time.time()
+            current, peak = tracemalloc.get_traced_memory()
+        diff = snapshot.compare_to(baseline, group)
+        lines = [f'# worker {os.getpid()}: {current / 2**20:.1f} MiB traced (peak {peak / 2**20:.1f} MiB), '
+                 f'{sum(stat.size_diff for stat in diff) / 2**20:+.2f} MiB since baseline '
+                 f'{time.time() - baseline_time:.0f} s ago']
+        for stat in diff[:limit]:
+            lines.append(str(stat))
+            if group == 'traceback':
+                lines.extend('    ' + line for line in stat.traceback.format())
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _snapshot():
+        return tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+            tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+            tracemalloc.Filter(False, '<unknown>'),
+        ))
+
+
+def _text(body, status=200, requests=None, samples=None, mimetype='text/plain'):
+    response = Response(body, status=status, mimetype=mimetype)
+    response.headers['X-Profile-Worker'] = str(os.getpid())
+    if requests is not None:
+        response.headers['X-Profile-Requests'] = str(requests)
+    if samples is not None:
+        response.headers['X-Profile-Samples'] = str(samples)
+    response.cache_control.no_store = True
+    return response
+
+
+def init_app(app):
+    """
+    Register the profiling endpoints if PROFILING_TOKEN is set.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        WorkerProfiler or None: The profiler stored in ``app.extensions``, or
+        None if profiling is disabled.
+    """
+    token = app.config.get('PROFILING_TOKEN')
+    if not token:
+        app.extensions['profiler'] = None
+        return None
+
+    profiler = WorkerProfiler(max(app.config['PROFILING_SAMPLE_INTERVAL'], MIN_SAMPLE_INTERVAL),
+                              app.config['PROFILING_MAX_SECONDS'], app.config['PROFILING_MAX_REQUESTS'])
+    app.extensions['profiler'] = profiler
+
+    @app.before_request
+    def enter_profiled_request():
+        if profiler.capture is not None and request.endpoint not in ENDPOINTS:
+            g.profile_capture = profiler.enter_request()
+
+    @app.teardown_request
+    def exit_profiled_request(exc):
+        capture = g.pop('profile_capture', None)
+        if capture is not None:
+            profiler.exit_request(capture)
+
+    def require_token():
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode('utf-8'),
+                                   f'Bearer {token}'.encode('utf-8')):
+            abort(401)
+
+    def cpu_profile():
+        require_token()
+        seconds = request.args.get('seconds', type=float)
+        requests = request.args.get('requests', type=int)
+        mode = request.args.get('mode', 'sample')
+        if (seconds is None) == (requests is None) or (seconds or requests or 0) <= 0:
+            return _text("Pass either seconds or requests, greater than zero.\n", 400)
+        if mode not in ('sample', 'cprofile') or (mode == 'cprofile' and requests is None):
+            return _text("mode must be 'sample', or 'cprofile' together with requests.\n", 400)
+        current_app.logger.info("Profiling worker %d: %s", os.getpid(), request.query_string.decode('ascii', 'replace'))
+
+        try:
+            if mode == 'cprofile':
+                stats, profiled = profiler.trace(requests)
+                if stats is None:
+                    return _text("No requests were profiled.\n", requests=0)
+                if request.args.get('format') == 'pstats':
+                    return _text(marshal.dumps(stats.stats), requests=profiled, mimetype='application/octet-stream')
+                out = io.StringIO()
+                stats.stream = out
+                stats.sort_stats('cumulative').print_stats(request.args.get('limit', 60, type=int))
+                return _text(out.getvalue(), requests=profiled)
+
+            stacks, samples, profiled = profiler.sample(seconds=seconds, requests=requests)
+        except ProfileBusy as e:
+            return _text(f"{e}.\n", 409)
+        body = ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+        return _text(body, requests=profiled, samples=samples)
+
+    def memory_start():
+        require_token()
+        frames = max(1, min(request.args.get('frames', 1, type=int), 64))
+        profiler.start_memory(frames)
+        current_app.logger.info("Started tracemalloc in worker %d with %d frames", os.getpid(), frames)
+        return _text(f"Tracing allocations in worker {os.getpid()} with {frames} frame(s).\n")
+
+    def memory_diff():
+        require_token()
+        group = request.args.get('group', 'lineno')
+        if group not in GROUPS:
+            return _text(f"group must be one of {', '.join(GROUPS)}.\n", 400)
+        report = profiler.memory_diff(group, request.args.get('limit', 25, type=int),
+                                      request.args.get('reset') == '1')
+        if report is None:
+            return _text(f"Allocations are not traced in worker {os.getpid()}; "
+                         f"POST /_profile/memory/start first.\n", 409)
+        return _text(report)
+
+    def memory_stop():
+        require_token()
+        profiler.stop_memory()
+        current_app.logger.info("Stopped tracemalloc in worker %d", os.getpid())
+        return _text(f"Stopped tracing allocations in worker {os.getpid()}.\n")
+
+    app.add_url_rule('/_profile/cpu', 'profile_cpu', cpu_profile, methods=['POST'])
+    app.add_url_rule('/_profile/memory/start', 'profile_memory_start', memory_start, methods=['POST'])
+    app.add_url_rule('/_profile/memory/diff', 'profile_memory_diff', memory_diff)
+    app.add_url_rule('/_profile/memory/stop', 'profile_memory_stop', memory_stop, methods=['POST'])
+    return profiler
+
+
+def get_profiler(app=None):
+    """
+    Return the worker profiler of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        WorkerProfiler or None: The profiler, or None if profiling is disabled.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['profiler']
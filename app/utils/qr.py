@@ -0,0 +1,272 @@
+"""
+In-memory QR code rendering.
+
+QR codes are encoded once per URL and kept in a bounded LRU cache as ready
+to send PNG or SVG bytes. Nothing is written to disk. Both formats are
+produced directly from the QR module matrix: the PNG is a 1-bit grayscale
+image written with zlib and the SVG is a single path, so neither needs PIL.
+
+``QRRenderer.encode_many`` encodes batches, such as printed QR sheets, in a
+process pool so they use every core instead of one worker thread.
+"""
+
+import base64
+import hashlib
+import multiprocessing
+import os
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from itertools import repeat
+
+from app.utils.metrics import timer
+from app.utils.rate_limit import ConcurrencyGate
+
+MIMETYPES = {
+    'png': 'image/png',
+    'svg': 'image/svg+xml',
+}
+
+
+def qr_matrix(data, border=5):
+    """
+    Encode ``data`` as a QR code.
+
+    Args:
+        data (str): The text to encode, usually a URL.
+        border (int, optional): Quiet zone width in modules. Defaults to 5.
+
+    Returns:
+        list: Rows of booleans, True for dark modules, including the border.
+    """
+    # qrcode is imported lazily so it is only loaded by workers that render codes
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr.get_matrix()
+
+
+def _png_chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+def matrix_to_png(matrix, box_size=10):
+    """
+    Render a QR matrix as a 1-bit grayscale PNG.
+
+    Args:
+        matrix (list): Rows of booleans from ``qr_matrix``.
+        box_size (int, optional): Pixels per module. Defaults to 10.
+
+    Returns:
+        bytes: The PNG file.
+    """
+    size = len(matrix) * box_size
+    padding = '0' * (-size % 8)
+    scanlines = []
+    for row in matrix:
+        # 0 is black and 1 is white in a 1-bit grayscale image
+        bits = ''.join(('0' if dark else '1') * box_size for dark in row) + padding
+        scanline = b'\x00' + int(bits, 2).to_bytes(len(bits) // 8, 'big')
+        scanlines.append(scanline * box_size)
+    header = struct.pack('>IIBBBBB', size, size, 1, 0, 0, 0, 0)
+    return (b'\x89PNG\r\n\x1a\n'
+            + _png_chunk(b'IHDR', header)
+            + _png_chunk(b'IDAT', zlib.compress(b''.join(scanlines), 9))
+            + _png_chunk(b'IEND', b''))
+
+
+def matrix_to_svg(matrix, box_size=10):
+    """
+    Render a QR matrix as an SVG document with a single path.
+
+    Args:
+        matrix (list): Rows of booleans from ``qr_matrix``.
+        box_size (int, optional): Pixels per module for the default size.
+            Defaults to 10.
+
+    Returns:
+        bytes: The SVG file.
+    """
+    modules = len(matrix)
+    path = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < modules:
+            if row[x]:
+                start = x
+                while x < modules and row[x]:
+                    x += 1
+                path.append(f'M{start} {y}h{x - start}v1h-{x - start}z')
+            else:
+                x += 1
+    size = modules * box_size
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {modules} {modules}" shape-rendering="crispEdges">'
+        f'<rect width="100%" height="100%" fill="#fff"/>'
+        f'<path d="{"".join(path)}" fill="#000"/></svg>'
+    ).encode('ascii')
+
+
+RENDERERS = {
+    'png': matrix_to_png,
+    'svg': matrix_to_svg,
+}
+
+
+def encode(data, fmt, box_size=10):
+    """
+    Encode one QR code; runs in a pool process for ``encode_many``.
+
+    Args:
+        data (str): The text to encode.
+        fmt (str): 'png', 'svg' or 'matrix' for the raw module matrix.
+        box_size (int, optional): Pixels per module. Defaults to 10.
+
+    Returns:
+        bytes or list: The image, or the matrix for 'matrix'.
+    """
+    matrix = qr_matrix(data)
+    if fmt == 'matrix':
+        return matrix
+    return RENDERERS[fmt](matrix, box_size)
+
+
+class QRRenderer:
+    """
+    Renders QR codes and caches the encoded bytes in a bounded LRU cache.
+
+    Attributes:
+        box_size (int): Pixels per QR module.
+        max_entries (int): Maximum number of cached images.
+        hits (int): Number of renders served from the cache.
+        misses (int): Number of renders that had to encode a QR code.
+        gate (ConcurrencyGate or None): Bounds concurrent encodes in this worker.
+        workers (int): Processes used by ``encode_many``.
+    """
+
+    def __init__(self, box_size=10, max_entries=256, gate=None, workers=1):
+        self.box_size = box_size
+        self.max_entries = max_entries
+        self.gate = gate
+        self.workers = workers
+        self._executor = None
+        self._executor_pid = None
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def render(self, data, fmt='png'):
+        """
+        Return the encoded QR code for ``data`` and its ETag.
+
+        Args:
+            data (str): The text to encode.
+            fmt (str, optional): 'png' or 'svg'. Defaults to 'png'.
+
+        Returns:
+            tuple: ``(body, etag)`` where body is the image as bytes.
+
+        Raises:
+            ValueError: If the format is not supported.
+            ServiceUnavailable: If the encoding gate is full.
+        """
+        if fmt not in RENDERERS:
+            raise ValueError(f"Unsupported QR format: {fmt}")
+        key = (data, fmt)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                self._cache.move_to_end(key)
+                self.hits += 1
+                return entry
+
+        with self.gate.admit() if self.gate else nullcontext(), timer('qr_encode'):
+            body = RENDERERS[fmt](qr_matrix(data), self.box_size)
+        entry = (body, hashlib.sha256(body).hexdigest()[:32])
+        with self._lock:
+            self.misses += 1
+            self._cache[key] = entry
+            while len(self._cache) > self.max_entries:
+                self._cache.popitem(last=False)
+        return entry
+
+    def encode_many(self, data, fmt='png', chunksize=4):
+        """
+        Encode many QR codes in parallel, bypassing the cache.
+
+        Args:
+            data (list): Texts to encode.
+            fmt (str, optional): 'png', 'svg' or 'matrix'. Defaults to 'png'.
+            chunksize (int, optional): Codes sent to a pool process at a time.
+
+        Yields:
+            The encoded codes in the order of ``data``, each as soon as it and
+            all codes before it are done.
+        """
+        if self.workers <= 1 or len(data) <= chunksize:
+            for item in data:
+                yield encode(item, fmt, self.box_size)
+            return
+        if self._executor is None or self._executor_pid != os.getpid():
+            # spawn: never fork a worker that runs request and logging threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._executor_pid = os.getpid()
+        yield from self._executor.map(encode, data, repeat(fmt), repeat(self.box_size), chunksize=chunksize)
+
+    def data_uri(self, data, fmt='svg'):
+        """
+        Return the QR code for ``data`` as a ``data:`` URI for inline images.
+
+        Args:
+            data (str): The text to encode.
+            fmt (str, optional): 'png' or 'svg'. Defaults to 'svg'.
+
+        Returns:
+            str: The data URI.
+        """
+        body, _ = self.render(data, fmt)
+        return f"data:{MIMETYPES[fmt]};base64,{base64.b64encode(body).decode('ascii')}"
+
+
+def init_app(app):
+    """
+    Attach a QRRenderer configured for ``app``.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        QRRenderer: The renderer stored in ``app.extensions``.
+    """
+    gate = None
+    if app.config['QR_MAX_CONCURRENCY']:
+        gate = ConcurrencyGate('qr_encode', app.config['QR_MAX_CONCURRENCY'], app.config['QR_QUEUE_TIMEOUT'],
+                               app.config['QR_RETRY_AFTER'])
+    renderer = QRRenderer(box_size=app.config['QR_BOX_SIZE'], max_entries=app.config['QR_CACHE_SIZE'], gate=gate,
+                          workers=app.config['QR_SHEET_WORKERS'])
+    app.extensions['qr_renderer'] = renderer
+    return renderer
+
+
+def get_qr_renderer(app=None):
+    """
+    Return the QR renderer of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        QRRenderer: The renderer created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['qr_renderer']
@@ -0,0 +1,150 @@
+"""
+Printable sheets of many session QR codes.
+
+A sheet is streamed to the client while the codes are still being encoded:
+``pdf_sheet`` emits an A4 page as soon as its twelve codes are done, and
+``zip_sheet`` emits every PNG or SVG file as soon as it is encoded. Neither
+holds more than one page or file in memory.
+
+Each code on a PDF sheet is drawn as vector squares, so it prints sharp at
+any size, with the questionnaire name and the short session ID below it.
+The last pages list every session with the URL of its result page. ZIP
+archives contain the images and a ``sessions.csv`` with the same list.
+"""
+
+import csv
+import io
+import time
+import zipfile
+
+from app.utils.pdf import StreamWriter, wrap
+
+COLUMNS = 3
+ROWS = 4
+MARGIN = 36
+HEADER = 30
+CUT_LINE = (0.85, 0.85, 0.85)
+MUTED = (0.4, 0.4, 0.4)
+
+
+def pdf_sheet(entries, matrices, title):
+    """
+    Stream a PDF with one cell per session.
+
+    Args:
+        entries (list): Dicts with ``session_id``, ``name`` (questionnaire
+            name) and ``result_url`` per session.
+        matrices (iterable): QR matrices in the order of ``entries``, e.g.
+            from ``QRRenderer.encode_many(urls, 'matrix')``.
+        title (str): Heading printed on every page.
+
+    Yields:
+        bytes: Chunks of the PDF file.
+    """
+    writer = StreamWriter(title=title)
+    yield writer.begin()
+
+    cell_width = (writer.width - 2 * MARGIN) / COLUMNS
+    cell_height = (writer.height - 2 * MARGIN - HEADER) / ROWS
+    code_size = min(cell_width, cell_height) - 56
+    per_page = COLUMNS * ROWS
+    pages = -(-len(entries) // per_page)
+
+    page = None
+    for index, (entry, matrix) in enumerate(zip(entries, matrices)):
+        slot = index % per_page
+        if slot == 0:
+            page = writer.new_page()
+            page.text(MARGIN, MARGIN + 12, title, size=12, bold=True)
+            page.text_right(writer.width - MARGIN, MARGIN + 12, f'Sida {index // per_page + 1} av {pages}',
+                            size=8, color=MUTED)
+        x = MARGIN + (slot % COLUMNS) * cell_width
+        y = MARGIN + HEADER + (slot // COLUMNS) * cell_height
+        page.rect(x, y, cell_width, cell_height, stroke=CUT_LINE)
+        page.modules(x + (cell_width - code_size) / 2, y + 8, matrix, code_size / len(matrix))
+        caption_y = y + code_size + 22
+        for line in wrap(entry['name'], cell_width - 12, 8, bold=True)[:2]:
+            page.text(x + 6, caption_y, line, size=8, bold=True)
+            caption_y += 10
+        page.text(x + 6, caption_y, f"Nr {index + 1}  ·  {entry['session_id'][:8]}", size=8, color=MUTED)
+        if slot == per_page - 1:
+            yield writer.add_page(page)
+            page = None
+    if page is not None:
+        yield writer.add_page(page)
+
+    # Index of all sessions for the physio
+    line_height = 11
+    page = None
+    y = 0
+    for index, entry in enumerate(entries):
+        if page is None or y > writer.height - MARGIN:
+            if page is not None:
+                yield writer.add_page(page)
+            page = writer.new_page()
+            page.text(MARGIN, MARGIN + 12, f'{title}: sessioner', size=12, bold=True)
+            y = MARGIN + HEADER + 10
+        page.text(MARGIN, y, f"{index + 1}.", size=7)
+        page.text(MARGIN + 22, y, wrap(entry['name'], 150, 7)[0], size=7)
+        page.text(MARGIN + 180, y, entry['result_url'], size=7, color=MUTED)
+        y += line_height
+    if page is not None:
+        yield writer.add_page(page)
+
+    yield writer.finish()
+
+
+class _ChunkWriter:
+    """Unseekable file object that collects what ``zipfile`` writes."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def zip_sheet(entries, images, fmt):
+    """
+    Stream a ZIP archive of QR images plus ``sessions.csv``.
+
+    Args:
+        entries (list): Dicts with ``session_id``, ``evaluation_form``,
+            ``name``, ``form_url`` and ``result_url`` per session.
+        images (iterable): Encoded images in the order of ``entries``.
+        fmt (str): 'png' or 'svg'.
+
+    Yields:
+        bytes: Chunks of the ZIP file.
+    """
+    output = _ChunkWriter()
+    # PNGs are already compressed; SVG text compresses well
+    compression = zipfile.ZIP_STORED if fmt == 'png' else zipfile.ZIP_DEFLATED
+    timestamp = time.localtime()[:6]
+    filenames = []
+    with zipfile.ZipFile(output, 'w', compression) as archive:
+        for index, (entry, image) in enumerate(zip(entries, images)):
+            filename = f"{index + 1:03d}-{entry['evaluation_form']}-{entry['session_id'][:8]}.{fmt}"
+            archive.writestr(zipfile.ZipInfo(filename, timestamp), image, compress_type=compression)
+            filenames.append(filename)
+            yield output.take()
+
+        listing = io.StringIO()
+        columns = csv.writer(listing)
+        columns.writerow(['file', 'questionnaire', 'session_id', 'form_url', 'result_url'])
+        for filename, entry in zip(filenames, entries):
+            columns.writerow([filename, entry['evaluation_form'], entry['session_id'], entry['form_url'],
+                              entry['result_url']])
+        info = zipfile.ZipInfo('sessions.csv', timestamp)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        archive.writestr(info, listing.getvalue())
+    yield output.take()
@@ -0,0 +1,311 @@
+"""
+In-memory registry of compiled questionnaires.
+
+The registry parses every questionnaire data file in ``data/`` once, validates
+its question IDs against ``QUESTIONNAIRES`` and keeps an immutable compiled
+copy keyed by ``(slug, language)``. Routes read from the registry instead of
+opening and decoding JSON on every request.
+
+The registry can be reloaded without restarting the server, either because a
+data file's mtime changed or because the process received SIGHUP. A reload
+builds a complete new mapping and swaps it in with a single assignment, so
+readers always see either the old or the new set of questionnaires.
+"""
+
+import json
+import logging
+import os
+import signal
+import threading
+import time
+from types import MappingProxyType
+
+from app.questionnaires_config import QUESTIONNAIRES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_LANGUAGE = 'swedish'
+
+
+class QuestionnaireDataError(ValueError):
+    """Raised when a questionnaire data file is missing, malformed or inconsistent."""
+
+
+def _freeze(value):
+    """
+    Recursively convert dicts and lists into read-only equivalents.
+
+    Args:
+        value: A value decoded from JSON.
+
+    Returns:
+        The same value with dicts as MappingProxyType and lists as tuples.
+    """
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def questionnaire_sources(data_dir):
+    """
+    List the data files that belong to each configured questionnaire.
+
+    A questionnaire either names its file explicitly with the ``file`` key in
+    ``QUESTIONNAIRES`` or follows the ``<slug>_<language>.json`` convention.
+
+    Args:
+        data_dir (str): Directory containing the questionnaire JSON files.
+
+    Returns:
+        dict: Mapping of ``(slug, language)`` to the data file path.
+    """
+    try:
+        filenames = sorted(os.listdir(data_dir))
+    except FileNotFoundError:
+        filenames = []
+
+    sources = {}
+    for slug, config in QUESTIONNAIRES.items():
+        if 'file' in config:
+            sources[(slug, DEFAULT_LANGUAGE)] = os.path.join(data_dir, config['file'])
+            continue
+        prefix = f'{slug}_'
+        for filename in filenames:
+            if filename.startswith(prefix) and filename.endswith('.json'):
+                language = filename[len(prefix):-len('.json')]
+                sources[(slug, language)] = os.path.join(data_dir, filename)
+    return sources
+
+
+def compile_questionnaire(slug, language, filepath):
+    """
+    Parse, validate and freeze a single questionnaire data file.
+
+    Bare instruction entries inside a section are normalised to
+    ``{'type': 'instructions', 'text': ...}`` so templates can tell them apart
+    from questions.
+
+    Args:
+        slug (str): Questionnaire slug, a key of ``QUESTIONNAIRES``.
+        language (str): Language of the data file (e.g. 'swedish').
+        filepath (str): Path to the JSON data file.
+
+    Returns:
+        MappingProxyType: The compiled, read-only questionnaire.
+
+    Raises:
+        QuestionnaireDataError: If the file cannot be read or its question IDs
+            do not match the sections configured for ``slug``.
+    """
+    try:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            data = json.load(file)
+    except (OSError, json.JSONDecodeError) as e:
+        raise QuestionnaireDataError(f"Cannot load {filepath}: {e}") from e
+
+    # Handle case where data is a list (first item is used)
+    if isinstance(data, list):
+        data = data[0] if data else {}
+
+    sections = []
+    question_ids = []
+    for section in data.get('sections', []):
+        questions = []
+        for q in section.get('questions', []):
+            if isinstance(q, dict) and 'id' in q:
+                questions.append(q)
+                question_ids.append(q['id'])
+            else:
+                questions.append({'type': 'instructions', 'text': q['text']})
+        sections.append({**section, 'questions': questions})
+
+    if not sections:
+        raise QuestionnaireDataError(f"No sections found in {filepath}")
+
+    expected = [q for ids in QUESTIONNAIRES[slug]['sections'].values() for q in ids]
+    duplicates = sorted({q for q in question_ids if question_ids.count(q) > 1})
+    missing = sorted(set(expected) - set(question_ids))
+    unknown = sorted(set(question_ids) - set(expected))
+    if duplicates or missing or unknown:
+        raise QuestionnaireDataError(
+            f"Question IDs in {filepath} do not match QUESTIONNAIRES['{slug}']: "
+            f"duplicates={duplicates}, missing={missing}, unknown={unknown}")
+
+    return _freeze({
+        'slug': slug,
+        'language': language,
+        'title': data.get('title', QUESTIONNAIRES[slug]['name']),
+        'subtitle': data.get('subtitle', ''),
+        'instructions': data.get('instructions', 'Instruktioner saknas.'),
+        'sections': sections,
+        'question_ids': question_ids,
+    })
+
+
+class QuestionnaireRegistry:
+    """
+    Holds the compiled questionnaires and reloads them when their files change.
+
+    Attributes:
+        data_dir (str): Directory containing the questionnaire JSON files.
+        reload_interval (float): Minimum number of seconds between mtime
+            checks. Zero disables mtime polling; SIGHUP still works.
+        generation (int): Incremented every time a reload changes the registry.
+    """
+
+    def __init__(self, data_dir='data', reload_interval=0):
+        self.data_dir = data_dir
+        self.reload_interval = reload_interval
+        self.generation = 0
+        self._entries = MappingProxyType({})
+        self._mtimes = {}
+        self._next_check = 0.0
+        self._reload_requested = False
+        self._lock = threading.Lock()
+
+    def get(self, slug, language=DEFAULT_LANGUAGE):
+        """
+        Return a compiled questionnaire.
+
+        Args:
+            slug (str): Questionnaire slug.
+            language (str, optional): Language. Defaults to 'swedish'.
+
+        Returns:
+            MappingProxyType or None: The questionnaire, or None if unknown.
+        """
+        return self._entries.get((slug, language))
+
+    def keys(self):
+        """Return the ``(slug, language)`` pairs currently loaded."""
+        return self._entries.keys()
+
+    def load(self):
+        """
+        Compile every questionnaire source and swap in the new registry.
+
+        Sources that fail to compile are logged. On a reload they keep their
+        previously compiled version so a bad edit never takes a form offline.
+        """
+        sources = questionnaire_sources(self.data_dir)
+        entries = {}
+        mtimes = {}
+        for key, filepath in sources.items():
+            try:
+                mtimes[filepath] = os.stat(filepath).st_mtime_ns
+                entries[key] = compile_questionnaire(key[0], key[1], filepath)
+            except (OSError, QuestionnaireDataError) as e:
+                logger.error("Failed to compile questionnaire %s/%s: %s", key[0], key[1], e)
+                if key in self._entries:
+                    entries[key] = self._entries[key]
+
+        self._mtimes = mtimes
+        self._entries = MappingProxyType(entries)
+        self.generation += 1
+        logger.info("Loaded %d questionnaires (generation %d)", len(entries), self.generation)
+
+    def request_reload(self, *args):
+        """
+        Ask for a reload on the next ``maybe_reload`` call.
+
+        This is safe to use as a signal handler because it only sets a flag.
+        """
+        self._reload_requested = True
+
+    def maybe_reload(self):
+        """
+        Reload if SIGHUP was received or a data file changed on disk.
+
+        The mtime check runs at most once per ``reload_interval`` seconds and
+        only one thread performs a reload at a time.
+        """
+        if not self._reload_requested:
+            if not self.reload_interval:
+                return
+            now = time.monotonic()
+            if now < self._next_check:
+                return
+            self._next_check = now + self.reload_interval
+            if not self._sources_changed():
+                return
+
+        if not self._lock.acquire(blocking=False):
+            return
+        try:
+            self._reload_requested = False
+            self.load()
+        finally:
+            self._lock.release()
+
+    def _sources_changed(self):
+        sources = questionnaire_sources(self.data_dir)
+        if set(sources.values()) != set(self._mtimes):
+            return True
+        for filepath, mtime in self._mtimes.items():
+            try:
+                if os.stat(filepath).st_mtime_ns != mtime:
+                    return True
+            except OSError:
+                return True
+        return False
+
+    def install_signal_handler(self):
+        """
+        Reload the registry on SIGHUP.
+
+        Signal handlers can only be installed from the main thread; elsewhere
+        this is a no-op and mtime polling remains the reload trigger.
+        """
+        if not hasattr(signal, 'SIGHUP') or threading.current_thread() is not threading.main_thread():
+            return
+        previous = signal.getsignal(signal.SIGHUP)
+
+        def handle_sighup(signum, frame):
+            self.request_reload()
+            if callable(previous):
+                previous(signum, frame)
+
+        signal.signal(signal.SIGHUP, handle_sighup)
+
+
+def init_app(app):
+    """
+    Build the questionnaire registry for ``app`` and enable hot reloading.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        QuestionnaireRegistry: The registry stored in ``app.extensions``.
+    """
+    registry = QuestionnaireRegistry(
+        data_dir=app.config.get('QUESTIONNAIRE_DATA_DIR', 'data'),
+        reload_interval=app.config.get('QUESTIONNAIRE_RELOAD_INTERVAL', 0),
+    )
+    registry.load()
+    registry.install_signal_handler()
+    app.extensions['questionnaire_registry'] = registry
+
+    @app.before_request
+    def reload_questionnaires():
+        registry.maybe_reload()
+
+    return registry
+
+
+def get_registry(app=None):
+    """
+    Return the questionnaire registry of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        QuestionnaireRegistry: The registry created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['questionnaire_registry']
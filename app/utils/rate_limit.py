@@ -0,0 +1,295 @@
+"""
+Rate limiting and admission control shared by all workers.
+
+Requests are limited with token buckets per client IP and per rule. A rule
+names an endpoint, optionally restricted to one method (``'POST
+main.patient_form'``), and a rate such as ``'30/minute'``; the bucket holds
+as many tokens as the rate allows per period, so a client may burst up to
+that many requests and then continues at the average rate. Requests over the
+limit get ``429 Too Many Requests`` with a ``Retry-After`` header.
+
+Requests for one patient session (a ``token`` or ``session_id`` in the URL)
+are counted per session and client IP, so the patients of a clinic that
+share one NAT address do not share one bucket. Other requests are counted
+per client IP, which is taken from ``X-Forwarded-For`` (``PROXY_X_FOR``).
+
+The buckets live in a fixed-size table in a memory-mapped file, so every
+gunicorn worker on the host sees the same counts without a round trip to
+the result store. The table is split into groups of ``GROUP_SLOTS`` slots;
+a key always lands in the same group and a byte-range ``lockf`` on the group
+serialises updates between processes. When a group is full the least
+recently used bucket is evicted, which can only make a limit more lenient.
+
+``ConcurrencyGate`` bounds how many expensive operations (QR encoding) a
+worker runs at once. Requests that cannot get a slot within a short timeout
+fail fast with ``503 Service Unavailable`` and ``Retry-After`` instead of
+queueing until gunicorn kills the worker.
+"""
+
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import request
+from werkzeug.exceptions import ServiceUnavailable, TooManyRequests
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+from app.utils.metrics import REGISTRY
+
+# Key hash, tokens left, time of the last update
+SLOT = struct.Struct('<Qdd')
+GROUP_SLOTS = 8
+GROUP_BYTES = SLOT.size * GROUP_SLOTS
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+# URL arguments that identify a patient session; requests carrying one get a
+# bucket per session and client IP
+SESSION_ARGS = ('token', 'session_id')
+
+
+def parse_rate(rate):
+    """
+    Parse a rate such as ``'30/minute'`` or ``'5/10s'``.
+
+    Args:
+        rate (str): ``<requests>/<period>``; the period is a unit name or a
+            number of seconds followed by ``s``.
+
+    Returns:
+        tuple: ``(tokens_per_second, burst)``.
+
+    Raises:
+        ValueError: If the rate cannot be parsed.
+    """
+    count, _, period = rate.partition('/')
+    period = period.strip()
+    seconds = PERIODS.get(period)
+    if seconds is None:
+        seconds = float(period.rstrip('s'))
+    count = int(count)
+    if count <= 0 or seconds <= 0:
+        raise ValueError(f"Invalid rate: {rate!r}")
+    return count / seconds, count
+
+
+class TokenBucketTable:
+    """
+    Token buckets in a memory-mapped file shared between processes.
+
+    Args:
+        path (str): File backing the table; created if missing.
+        slots (int, optional): Number of buckets. Rounded up to whole groups.
+    """
+
+    def __init__(self, path, slots=4096):
+        self.path = path
+        self.groups = max(1, math.ceil(slots / GROUP_SLOTS))
+        size = self.groups * GROUP_BYTES
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size != size:
+            os.ftruncate(self._fd, size)
+        self._map = mmap.mmap(self._fd, size)
+        # lockf only excludes other processes; threads of this one share the lock
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _hash(key):
+        value = int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'little')
+        return value or 1
+
+    def take(self, key, rate, burst, cost=1, now=None):
+        """
+        Take ``cost`` tokens from the bucket of ``key`` if it has enough.
+
+        Args:
+            key (str): Bucket key, e.g. rule and client IP.
+            rate (float): Tokens added per second.
+            burst (int): Bucket capacity.
+            cost (int, optional): Tokens the request needs. Defaults to 1.
+            now (float, optional): Current Unix time. Defaults to ``time.time()``.
+
+        Returns:
+            tuple: ``(allowed, retry_after)`` where retry_after is the number
+            of seconds until enough tokens are available (0 if allowed).
+        """
+        key_hash = self._hash(key)
+        offset = (key_hash % self.groups) * GROUP_BYTES
+        now = time.time() if now is None else now
+        with self._lock, self._locked(offset):
+            slots = [SLOT.unpack_from(self._map, offset + index * SLOT.size) for index in range(GROUP_SLOTS)]
+            index = next((i for i, slot in enumerate(slots) if slot[0] == key_hash), None)
+            if index is None:
+                index = next((i for i, slot in enumerate(slots) if slot[0] == 0), None)
+                if index is None:
+                    index = min(range(GROUP_SLOTS), key=lambda i: slots[i][2])
+                tokens = float(burst)
+            else:
+                _, tokens, updated = slots[index]
+                tokens = min(float(burst), tokens + max(now - updated, 0.0) * rate)
+
+            if tokens >= cost:
+                tokens -= cost
+                retry_after = 0.0
+            else:
+                retry_after = (cost - tokens) / rate
+            SLOT.pack_into(self._map, offset + index * SLOT.size, key_hash, tokens, now)
+        return retry_after == 0.0, retry_after
+
+    @contextmanager
+    def _locked(self, offset):
+        if fcntl is None:
+            yield
+            return
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, GROUP_BYTES, offset, os.SEEK_SET)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, GROUP_BYTES, offset, os.SEEK_SET)
+
+    def clear(self):
+        """Reset every bucket."""
+        with self._lock, self._locked(0):
+            self._map[:] = bytes(len(self._map))
+
+
+class RateLimiter:
+    """
+    Applies the configured rules to incoming requests.
+
+    Args:
+        table (TokenBucketTable): Shared buckets.
+        rules (dict): ``'[METHOD ]endpoint'`` to a rate string.
+    """
+
+    def __init__(self, table, rules):
+        self.table = table
+        self.rules = {}
+        for name, rate in rules.items():
+            method, _, endpoint = name.rpartition(' ')
+            self.rules[(method.upper() or None, endpoint)] = (name, *parse_rate(rate))
+
+    def rule_for(self, method, endpoint):
+        """Return ``(name, rate, burst)`` of the rule for a request, or None."""
+        return self.rules.get((method, endpoint)) or self.rules.get((None, endpoint))
+
+    def check(self, method, endpoint, client, session=''):
+        """
+        Count a request against its rule.
+
+        Args:
+            method (str): HTTP method.
+            endpoint (str): Flask endpoint name.
+            client (str): Client address.
+            session (str, optional): Session token or ID the request is for.
+
+        Raises:
+            TooManyRequests: If the client is over the limit, with ``retry_after`` set.
+        """
+        rule = self.rule_for(method, endpoint)
+        if rule is None:
+            return
+        name, rate, burst = rule
+        key = f'{name}|{client}|{session}' if session else f'{name}|{client}'
+        allowed, retry_after = self.table.take(key, rate, burst)
+        if not allowed:
+            REGISTRY.inc('physioengine_rate_limited_total', (endpoint, 'rate'))
+            raise TooManyRequests(retry_after=max(1, math.ceil(retry_after)))
+
+
+class ConcurrencyGate:
+    """
+    Limits how many callers run a block at the same time in this process.
+
+    Args:
+        name (str): Gate name used in metrics.
+        limit (int): Maximum concurrent callers.
+        timeout (float): Seconds to wait for a slot before rejecting.
+        retry_after (int): Value of the ``Retry-After`` header on rejection.
+    """
+
+    def __init__(self, name, limit, timeout=1.0, retry_after=1):
+        self.name = name
+        self.limit = limit
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    @contextmanager
+    def admit(self):
+        """
+        Run the block once a slot is free.
+
+        Raises:
+            ServiceUnavailable: If no slot was free within the timeout.
+        """
+        if not self._semaphore.acquire(timeout=self.timeout):
+            REGISTRY.inc('physioengine_rate_limited_total', (self.name, 'concurrency'))
+            raise ServiceUnavailable(retry_after=self.retry_after)
+        REGISTRY.inc('physioengine_gate_in_use', (self.name,))
+        try:
+            yield
+        finally:
+            REGISTRY.dec('physioengine_gate_in_use', (self.name,))
+            self._semaphore.release()
+
+
+def init_app(app):
+    """
+    Install the rate limiter for ``app`` if RATE_LIMIT_ENABLED is set.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        RateLimiter or None: The limiter stored in ``app.extensions``.
+    """
+    REGISTRY.define('physioengine_rate_limited_total', 'counter',
+                    'Requests rejected by rate limits (rate) or concurrency gates (concurrency).',
+                    ('endpoint', 'reason'))
+    REGISTRY.define('physioengine_gate_in_use', 'gauge', 'Slots in use per concurrency gate.', ('gate',))
+
+    if not app.config['RATE_LIMIT_ENABLED']:
+        app.extensions['rate_limiter'] = None
+        return None
+
+    table = TokenBucketTable(app.config['RATE_LIMIT_FILE'], app.config['RATE_LIMIT_SLOTS'])
+    limiter = RateLimiter(table, app.config['RATE_LIMITS'])
+    app.extensions['rate_limiter'] = limiter
+
+    @app.before_request
+    def apply_rate_limit():
+        if request.endpoint:
+            view_args = request.view_args or {}
+            session = next((view_args[name] for name in SESSION_ARGS if name in view_args), '')
+            limiter.check(request.method, request.endpoint, request.remote_addr or '', session)
+
+    return limiter
+
+
+def get_rate_limiter(app=None):
+    """
+    Return the rate limiter of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        RateLimiter or None: The limiter, or None if rate limiting is disabled.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['rate_limiter']
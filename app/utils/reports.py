@@ -0,0 +1,484 @@
+"""
+Printable PDF reports of scored results, rendered in a process pool.
+
+When a result is shown, ``request_report`` only saves the report's content
+(``<id>.json`` in ``REPORT_DIR``) and the page links to it; most reports are
+never downloaded. The PDF is rendered on the first download, in a
+``ProcessPoolExecutor`` so drawing it never blocks a request thread. A job's
+ID is a hash of the report content, so viewing the same result again, or
+from another worker, reuses the existing job or file instead of rendering it
+twice.
+
+Finished reports are written to ``REPORT_DIR`` (shared by the workers on a
+host) and kept in a small per-worker LRU cache; both expire after
+``REPORT_TTL`` seconds. A ``.pending`` marker file lets every worker report
+the status of a job that another worker is rendering.
+
+Reports contain the scores, a profile chart of the section scores and the
+answers with their question texts. They are drawn with ``app.utils.pdf``,
+which needs no fonts or other files.
+"""
+
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+
+from app.utils.metrics import REGISTRY
+from app.utils.pdf import Document, text_width, wrap
+
+logger = logging.getLogger(__name__)
+
+JOB_ID_RE = re.compile(r'^[0-9a-f]{32}$')
+
+REQUESTED = 'requested'
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+MARGIN = 50
+BAR_COLOR = (0.16, 0.42, 0.75)
+GRID_COLOR = (0.8, 0.8, 0.8)
+MUTED = (0.4, 0.4, 0.4)
+
+
+def report_payload(slug, responses, result, questionnaire=None):
+    """
+    Collect everything a report shows.
+
+    Args:
+        slug (str): Questionnaire slug.
+        responses (dict): Question ID to answer value.
+        result (dict): The scoring result.
+        questionnaire (Mapping, optional): Registry entry used for question
+            and answer texts; answers are listed by ID without it.
+
+    Returns:
+        dict: JSON-serialisable report content.
+    """
+    answers = []
+    if questionnaire is not None:
+        for section in questionnaire['sections']:
+            for question in section['questions']:
+                question_id = question.get('id')
+                if question_id is None or question_id not in responses:
+                    continue
+                value = responses[question_id]
+                label = next((option['text'] for option in question.get('options', ())
+                              if option['value'] == value), value)
+                answers.append([question_id, question.get('text', ''), str(label)])
+    else:
+        answers = [[question_id, '', str(value)] for question_id, value in responses.items()]
+    return {'slug': slug, 'result': result, 'answers': answers}
+
+
+def job_id(payload):
+    """Return the content hash that identifies a report."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()[:32]
+
+
+def render_report(payload, created):
+    """
+    Draw a report as a PDF. Runs in a pool process.
+
+    Args:
+        payload (dict): Output of ``report_payload``.
+        created (float): Unix time printed on the report.
+
+    Returns:
+        bytes: The PDF file.
+    """
+    result = payload['result']
+    title = f"{result['questionnaire_name']} Resultat"
+    document = Document(title=title)
+    width = document.width - 2 * MARGIN
+
+    page = document.add_page()
+    y = MARGIN + 20
+    for line in wrap(title, width, 18, bold=True):
+        page.text(MARGIN, y, line, size=18, bold=True)
+        y += 22
+    y -= 4
+    page.text(MARGIN, y, f"Skapad {time.strftime('%Y-%m-%d %H:%M', time.localtime(created))}", size=9, color=MUTED)
+    y += 30
+
+    page.text(MARGIN, y, f"Total poäng: {float(result['total_score']):.2f}", size=13, bold=True)
+    y += 18
+    for line in wrap(f"Övergripande tolkning: {result['interpretation']}", width, 11):
+        page.text(MARGIN, y, line, size=11)
+        y += 15
+    y += 20
+
+    # Profile chart: one bar per section on a 0-100 scale
+    sections = result['sections']
+    label_width = 170
+    chart_x = MARGIN + label_width
+    chart_width = width - label_width - 40
+    page.text(MARGIN, y, 'Profil', size=13, bold=True)
+    y += 14
+    chart_top = y
+    chart_height = max(len(sections), 1) * 24
+    for tick in range(0, 101, 25):
+        x = chart_x + chart_width * tick / 100
+        page.line(x, chart_top, x, chart_top + chart_height, color=GRID_COLOR)
+        page.text(x - text_width(str(tick), 8) / 2, chart_top + chart_height + 11, str(tick), size=8, color=MUTED)
+    for index, section in enumerate(sections):
+        bar_y = chart_top + index * 24 + 5
+        score = min(max(float(section['score']), 0.0), 100.0)
+        page.text(MARGIN, bar_y + 11, wrap(section['name'], label_width - 10, 9)[0], size=9)
+        page.rect(chart_x, bar_y, chart_width * score / 100, 14, fill=BAR_COLOR)
+        page.text(chart_x + chart_width * score / 100 + 4, bar_y + 11, f'{score:.1f}', size=9)
+    y = chart_top + chart_height + 40
+
+    # Section table
+    page.text(MARGIN, y, 'Sektion', size=10, bold=True)
+    page.text_right(MARGIN + 300, y, 'Poäng', size=10, bold=True)
+    page.text(MARGIN + 320, y, 'Tolkning', size=10, bold=True)
+    y += 5
+    page.line(MARGIN, y, MARGIN + width, y)
+    y += 14
+    for section in sections:
+        interpretation = wrap(section['interpretation'], width - 320, 10)
+        page.text(MARGIN, y, section['name'], size=10)
+        page.text_right(MARGIN + 300, y, f"{float(section['score']):.2f}", size=10)
+        for line in interpretation:
+            page.text(MARGIN + 320, y, line, size=10)
+            y += 13
+        y += 3
+
+    # Answers, continued on as many pages as needed
+    answers = payload['answers']
+    if answers:
+        y += 20
+        if y > document.height - MARGIN - 60:
+            page = document.add_page()
+            y = MARGIN + 20
+        page.text(MARGIN, y, 'Svar', size=13, bold=True)
+        y += 20
+        answer_x = MARGIN + width * 0.68
+        for question_id, text, label in answers:
+            question_lines = wrap(f'{question_id}. {text}' if text else question_id, answer_x - MARGIN - 10, 9)
+            answer_lines = wrap(label, MARGIN + width - answer_x, 9, bold=True)
+            height = max(len(question_lines), len(answer_lines)) * 12 + 4
+            if y + height > document.height - MARGIN:
+                page = document.add_page()
+                y = MARGIN + 20
+            for offset, line in enumerate(question_lines):
+                page.text(MARGIN, y + offset * 12, line, size=9)
+            for offset, line in enumerate(answer_lines):
+                page.text(answer_x, y + offset * 12, line, size=9, bold=True)
+            y += height
+
+    for number, page in enumerate(document.pages, 1):
+        page.text_right(MARGIN + width, document.height - MARGIN / 2, f'Sida {number} av {len(document.pages)}',
+                        size=8, color=MUTED)
+    return document.to_bytes(created)
+
+
+class ReportService:
+    """
+    Queues report jobs and serves finished PDFs.
+
+    The process pool is created on first use in each process, so a gunicorn
+    master that preloads the app never forks with a running pool.
+
+    Args:
+        directory (str): Where finished reports are written.
+        workers (int, optional): Pool processes per worker. Defaults to 1.
+        cache_size (int, optional): Reports kept in memory. Defaults to 32.
+        ttl (float, optional): Seconds a report is kept. Defaults to 3600.
+        timeout (float, optional): Seconds after which a pending job of
+            another worker is considered lost. Defaults to 60.
+    """
+
+    def __init__(self, directory, workers=1, cache_size=32, ttl=3600, timeout=60):
+        self.directory = directory
+        self.workers = workers
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.timeout = timeout
+        self._executor = None
+        self._executor_pid = None
+        self._jobs = {}
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._next_sweep = 0.0
+
+    def path(self, report_id, suffix='.pdf'):
+        return os.path.join(self.directory, f'{report_id}{suffix}')
+
+    def _pool(self):
+        if self._executor is None or self._executor_pid != os.getpid():
+            # spawn: never fork a worker that runs request and logging threads
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            self._executor_pid = os.getpid()
+        return self._executor
+
+    def shutdown(self):
+        """Wait for running reports and stop the pool processes of this process."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None and self._executor_pid == os.getpid():
+            executor.shutdown(wait=True)
+
+    def register(self, payload):
+        """
+        Save a report's content so it can be rendered on its first download.
+
+        Args:
+            payload (dict): Output of ``report_payload``.
+
+        Returns:
+            str: The report ID.
+        """
+        report_id = job_id(payload)
+        path = self.path(report_id, '.json')
+        if not (self._fresh(path) or self._fresh(self.path(report_id))):
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = self.path(report_id, f'.{os.getpid()}.{threading.get_ident()}.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as file:
+                json.dump(payload, file, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        self.sweep()
+        return report_id
+
+    def render(self, report_id):
+        """
+        Start rendering a registered report unless it is rendered or rendering.
+
+        Args:
+            report_id (str): The report ID.
+
+        Returns:
+            str or None: The report's status afterwards, as for ``status``.
+        """
+        status = self.status(report_id)
+        if status != REQUESTED:
+            return status
+        try:
+            with open(self.path(report_id, '.json'), encoding='utf-8') as file:
+                payload = json.load(file)
+        except (OSError, ValueError):
+            return None
+        self.submit(payload)
+        return self.status(report_id)
+
+    def submit(self, payload):
+        """
+        Queue a report unless an identical one exists or is being rendered.
+
+        Args:
+            payload (dict): Output of ``report_payload``.
+
+        Returns:
+            str: The report ID.
+        """
+        report_id = job_id(payload)
+        with self._lock:
+            existing = self._jobs.get(report_id)
+            if existing is not None and not (existing.done() and existing.exception() is not None):
+                return report_id
+            if self._cached(report_id) is not None:
+                return report_id
+            if self._fresh(self.path(report_id)) or self._fresh(self.path(report_id, '.pending'), self.timeout):
+                return report_id
+            os.makedirs(self.directory, exist_ok=True)
+            with open(self.path(report_id, '.pending'), 'w'):
+                pass
+            try:
+                future = self._pool().submit(render_report, payload, time.time())
+            except BrokenExecutor:
+                # A pool process died; start a new pool
+                self._executor = None
+                future = self._pool().submit(render_report, payload, time.time())
+            self._jobs[report_id] = future
+        start = time.perf_counter()
+        future.add_done_callback(lambda done: self._finished(report_id, start, done))
+        self.sweep()
+        return report_id
+
+    def _finished(self, report_id, start, future):
+        REGISTRY.observe('physioengine_operation_duration_seconds', ('report_render',), time.perf_counter() - start)
+        try:
+            body = future.result()
+            tmp_path = self.path(report_id, '.tmp')
+            with open(tmp_path, 'wb') as file:
+                file.write(body)
+            os.replace(tmp_path, self.path(report_id))
+        except Exception as e:
+            logger.error("Report %s failed: %s", report_id, e, exc_info=True)
+            body = None
+        finally:
+            try:
+                os.remove(self.path(report_id, '.pending'))
+            except OSError:
+                pass
+        with self._lock:
+            if body is not None:
+                self._store(report_id, body)
+                del self._jobs[report_id]
+
+    def _cached(self, report_id):
+        entry = self._cache.get(report_id)
+        if entry is None:
+            return None
+        body, stored = entry
+        if time.monotonic() - stored > self.ttl:
+            del self._cache[report_id]
+            return None
+        self._cache.move_to_end(report_id)
+        return body
+
+    def _store(self, report_id, body):
+        self._cache[report_id] = (body, time.monotonic())
+        self._cache.move_to_end(report_id)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _fresh(self, path, max_age=None):
+        try:
+            return time.time() - os.stat(path).st_mtime < (self.ttl if max_age is None else max_age)
+        except OSError:
+            return False
+
+    def status(self, report_id):
+        """
+        Return the state of a report job.
+
+        Args:
+            report_id (str): The report ID.
+
+        Returns:
+            str or None: 'requested' (not rendered yet), 'pending', 'done',
+            'failed', or None if unknown.
+        """
+        with self._lock:
+            future = self._jobs.get(report_id)
+            if future is not None:
+                if not future.done():
+                    return PENDING
+                return FAILED if future.exception() is not None else PENDING
+            if self._cached(report_id) is not None:
+                return DONE
+        if self._fresh(self.path(report_id)):
+            return DONE
+        if self._fresh(self.path(report_id, '.pending'), self.timeout):
+            return PENDING
+        if self._fresh(self.path(report_id, '.json')):
+            return REQUESTED
+        return None
+
+    def get(self, report_id):
+        """
+        Return a finished report.
+
+        Args:
+            report_id (str): The report ID.
+
+        Returns:
+            bytes or None: The PDF, or None if it is not ready or has expired.
+        """
+        with self._lock:
+            body = self._cached(report_id)
+        if body is not None:
+            return body
+        if not self._fresh(self.path(report_id)):
+            return None
+        try:
+            with open(self.path(report_id), 'rb') as file:
+                body = file.read()
+        except OSError:
+            return None
+        with self._lock:
+            self._store(report_id, body)
+        return body
+
+    def sweep(self):
+        """Delete expired reports and stale markers, at most once a minute."""
+        now = time.monotonic()
+        if now < self._next_sweep:
+            return
+        self._next_sweep = now + 60
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        cutoff = time.time() - self.ttl
+        for entry in entries:
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+
+def request_report(slug, responses, result):
+    """
+    Register the report of a result shown in the current request.
+
+    The PDF is only rendered when it is downloaded.
+
+    Failures are logged and never prevent the result from being shown.
+
+    Args:
+        slug (str): Questionnaire slug.
+        responses (dict): The submitted responses.
+        result (dict): The scoring result.
+
+    Returns:
+        str or None: The report ID, or None if reports are disabled or failed.
+    """
+    from flask import current_app
+    from app.utils.questionnaire_registry import get_registry
+
+    service = current_app.extensions.get('reports')
+    if service is None:
+        return None
+    try:
+        payload = report_payload(slug, responses, result, get_registry().get(slug))
+        return service.register(payload)
+    except Exception as e:
+        current_app.logger.error("Error saving report for %s: %s", slug, e, exc_info=True)
+        return None
+
+
+def init_app(app):
+    """
+    Attach a ReportService configured for ``app`` if REPORTS_ENABLED is set.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        ReportService or None: The service stored in ``app.extensions``.
+    """
+    service = None
+    if app.config['REPORTS_ENABLED']:
+        service = ReportService(app.config['REPORT_DIR'], workers=app.config['REPORT_WORKERS'],
+                                cache_size=app.config['REPORT_CACHE_SIZE'], ttl=app.config['REPORT_TTL'],
+                                timeout=app.config['REPORT_TIMEOUT'])
+    app.extensions['reports'] = service
+    return service
+
+
+def get_report_service(app=None):
+    """
+    Return the report service of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        ReportService or None: The service, or None if reports are disabled.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['reports']
@@ -0,0 +1,545 @@
+"""
+Pluggable key/value storage for sessions and submitted responses.
+
+Every backend stores JSON-serialisable values under string keys with an
+optional time-to-live and supports atomic ``consume`` (read and delete in one
+step), so two workers can never both process the same submission.
+
+Backends are selected with ``RESULT_STORE_URL``:
+
+* ``memory://`` keeps everything in the current process. Useful for
+  development and single-worker setups.
+* ``sqlite:///path/to/file.sqlite3`` shares one WAL-mode database file between
+  all workers on a host.
+* ``redis://[:password@]host:port/db`` (or ``rediss://``) shares data between
+  dynos through any server speaking the Redis protocol.
+"""
+
+import json
+import os
+import socket
+import sqlite3
+import ssl
+import threading
+import time
+from abc import ABC, abstractmethod
+from urllib.parse import urlparse, parse_qs, unquote
+
+from app.utils.metrics import instrument_methods
+
+
+def session_key(session_id):
+    """Key of the session record created when a QR code is generated."""
+    return f's:{session_id}'
+
+
+def result_key(session_id):
+    """Key of the responses submitted for a session."""
+    return f'r:{session_id}'
+
+
+def idempotency_key(session_id, key):
+    """Key marking a submission's idempotency key as used for a session."""
+    return f'i:{session_id}:{key}'
+
+
+def _encode(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+
+def _decode(data):
+    return None if data is None else json.loads(data)
+
+
+class ResultStore(ABC):
+    """
+    Interface shared by all storage backends.
+
+    Backends must implement the abstract methods; the others are built on
+    them and may be overridden with faster versions.
+
+    Attributes:
+        default_ttl (float or None): TTL in seconds applied when ``put`` is
+            called without one. None keeps values until they are deleted.
+    """
+
+    def __init__(self, default_ttl=None):
+        self.default_ttl = default_ttl
+
+    def _expires_at(self, ttl):
+        ttl = self.default_ttl if ttl is None else ttl
+        return time.time() + ttl if ttl else None
+
+    def put(self, key, value, ttl=None):
+        """
+        Store ``value`` under ``key``, replacing any previous value.
+
+        Args:
+            key (str): Key to write.
+            value: JSON-serialisable value.
+            ttl (float, optional): Seconds until the value expires.
+                Defaults to ``default_ttl``.
+        """
+        self.put_many({key: value}, ttl)
+
+    @abstractmethod
+    def put_many(self, items, ttl=None):
+        """
+        Store several values in one operation.
+
+        Args:
+            items (dict): Mapping of keys to JSON-serialisable values.
+            ttl (float, optional): Seconds until the values expire.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, key, value, ttl=None):
+        """
+        Store ``value`` under ``key`` only if the key holds no live value.
+
+        Args:
+            key (str): Key to write.
+            value: JSON-serialisable value.
+            ttl (float, optional): Seconds until the value expires.
+                Defaults to ``default_ttl``.
+
+        Returns:
+            bool: True if the value was stored, False if the key was taken.
+        """
+        raise NotImplementedError
+
+    def get(self, key):
+        """
+        Return the value stored under ``key``.
+
+        Args:
+            key (str): Key to read.
+
+        Returns:
+            The stored value, or None if it is missing or expired.
+        """
+        return self.get_many([key]).get(key)
+
+    @abstractmethod
+    def get_many(self, keys):
+        """
+        Read several keys in one operation.
+
+        Args:
+            keys (iterable): Keys to read.
+
+        Returns:
+            dict: Mapping of the keys that exist to their values.
+        """
+        raise NotImplementedError
+
+    def exists(self, key):
+        """Return True if ``key`` holds a value that has not expired."""
+        return self.get(key) is not None
+
+    @abstractmethod
+    def consume(self, key):
+        """
+        Atomically read and delete the value stored under ``key``.
+
+        Args:
+            key (str): Key to consume.
+
+        Returns:
+            The stored value, or None if it is missing or expired.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, key):
+        """Delete ``key`` if it exists."""
+        raise NotImplementedError
+
+    def purge_expired(self):
+        """
+        Remove expired values.
+
+        Returns:
+            int: Number of values removed.
+        """
+        return 0
+
+
+class MemoryResultStore(ResultStore):
+    """Stores values in a dict local to the current process."""
+
+    def __init__(self, default_ttl=None):
+        super().__init__(default_ttl)
+        self._lock = threading.Lock()
+        self._data = {}
+
+    def _live(self, key, now):
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        if entry[0] is not None and entry[0] <= now:
+            del self._data[key]
+            return None
+        return entry[1]
+
+    def put_many(self, items, ttl=None):
+        expires_at = self._expires_at(ttl)
+        encoded = {key: (expires_at, _encode(value)) for key, value in items.items()}
+        with self._lock:
+            self._data.update(encoded)
+
+    def add(self, key, value, ttl=None):
+        entry = (self._expires_at(ttl), _encode(value))
+        with self._lock:
+            if self._live(key, time.time()) is not None:
+                return False
+            self._data[key] = entry
+        return True
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+            found = {key: self._live(key, now) for key in keys}
+        return {key: _decode(data) for key, data in found.items() if data is not None}
+
+    def exists(self, key):
+        with self._lock:
+            return self._live(key, time.time()) is not None
+
+    def consume(self, key):
+        with self._lock:
+            data = self._live(key, time.time())
+            self._data.pop(key, None)
+        return _decode(data)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def purge_expired(self):
+        now = time.time()
+        with self._lock:
+            expired = [key for key, (expires_at, _) in self._data.items()
+                       if expires_at is not None and expires_at <= now]
+            for key in expired:
+                del self._data[key]
+        return len(expired)
+
+
+class SQLiteResultStore(ResultStore):
+    """
+    Stores values in a SQLite database in WAL mode.
+
+    Each thread gets its own connection, and connections are reopened after a
+    fork so gunicorn workers never share a handle with the master.
+    """
+
+    # SQLite limits the number of bound parameters per statement
+    MAX_VARIABLES = 500
+
+    def __init__(self, path, default_ttl=None):
+        super().__init__(default_ttl)
+        self.path = path
+        self._local = threading.local()
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS kv ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL'
+                ') WITHOUT ROWID')
+            conn.execute('CREATE INDEX IF NOT EXISTS kv_expires_at ON kv (expires_at)')
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def put_many(self, items, ttl=None):
+        expires_at = self._expires_at(ttl)
+        rows = [(key, _encode(value), expires_at) for key, value in items.items()]
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany('INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)', rows)
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+
+    def add(self, key, value, ttl=None):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute('DELETE FROM kv WHERE key = ? AND expires_at <= ?', (key, time.time()))
+            cursor = conn.execute('INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)',
+                                  (key, _encode(value), self._expires_at(ttl)))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return cursor.rowcount == 1
+
+    def get_many(self, keys):
+        keys = list(keys)
+        conn = self._connect()
+        now = time.time()
+        found = {}
+        for start in range(0, len(keys), self.MAX_VARIABLES):
+            chunk = keys[start:start + self.MAX_VARIABLES]
+            placeholders = ','.join('?' * len(chunk))
+            rows = conn.execute(
+                f'SELECT key, value FROM kv WHERE key IN ({placeholders}) '
+                'AND (expires_at IS NULL OR expires_at > ?)', (*chunk, now))
+            found.update((key, _decode(value)) for key, value in rows)
+        return found
+
+    def exists(self, key):
+        row = self._connect().execute(
+            'SELECT 1 FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+            (key, time.time())).fetchone()
+        return row is not None
+
+    def consume(self, key):
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute(
+                'SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)',
+                (key, time.time())).fetchone()
+            conn.execute('DELETE FROM kv WHERE key = ?', (key,))
+            conn.execute('COMMIT')
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        return _decode(row[0]) if row else None
+
+    def delete(self, key):
+        self._connect().execute('DELETE FROM kv WHERE key = ?', (key,))
+
+    def purge_expired(self):
+        cursor = self._connect().execute('DELETE FROM kv WHERE expires_at <= ?', (time.time(),))
+        return cursor.rowcount
+
+
+class RedisError(Exception):
+    """Raised when a Redis-protocol server returns an error reply."""
+
+
+class RedisResultStore(ResultStore):
+    """
+    Stores values in a server speaking the Redis protocol (RESP).
+
+    This is a small client covering only the commands the store needs, so it
+    works against Redis, its forks and any local stand-in implementing
+    SET (with NX)/MGET/EXISTS/DEL/MULTI/EXEC. Expiry is delegated to the server.
+    """
+
+    def __init__(self, url, default_ttl=None, prefix='physioengine:', socket_timeout=5):
+        super().__init__(default_ttl)
+        parsed = urlparse(url)
+        options = parse_qs(parsed.query)
+        self.host = parsed.hostname or 'localhost'
+        self.port = parsed.port or 6379
+        self.username = unquote(parsed.username) if parsed.username else None
+        self.password = unquote(parsed.password) if parsed.password else None
+        self.db = int(parsed.path.lstrip('/') or 0)
+        self.use_ssl = parsed.scheme == 'rediss'
+        self.verify_ssl = options.get('ssl_cert_reqs', ['required'])[0].lower() != 'none'
+        self.prefix = prefix
+        self.socket_timeout = socket_timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            sock = socket.create_connection((self.host, self.port), timeout=self.socket_timeout)
+            conn = None
+            try:
+                if self.use_ssl:
+                    context = ssl.create_default_context()
+                    if not self.verify_ssl:
+                        context.check_hostname = False
+                        context.verify_mode = ssl.CERT_NONE
+                    sock = context.wrap_socket(sock, server_hostname=self.host)
+                conn = (sock, sock.makefile('rb'))
+                handshake = []
+                if self.password:
+                    handshake.append(('AUTH', self.username, self.password) if self.username
+                                     else ('AUTH', self.password))
+                if self.db:
+                    handshake.append(('SELECT', self.db))
+                if handshake:
+                    self._round_trip(conn, handshake)
+            except BaseException:
+                self._close(conn or (sock, None))
+                raise
+            # Only cache connections that completed the handshake
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        sock, reader = conn
+        for handle in (reader, sock):
+            if handle is not None:
+                try:
+                    handle.close()
+                except OSError:
+                    pass
+
+    @staticmethod
+    def _pack(args):
+        parts = [b'*%d\r\n' % len(args)]
+        for arg in args:
+            if not isinstance(arg, bytes):
+                arg = str(arg).encode('utf-8')
+            parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+        return b''.join(parts)
+
+    def _read_reply(self, reader):
+        line = reader.readline()
+        if not line:
+            raise ConnectionError('Connection closed by Redis server')
+        kind, payload = line[:1], line[1:-2]
+        if kind == b'+':
+            return payload
+        if kind == b'-':
+            # Returned, not raised, so the rest of a pipeline is still read
+            return RedisError(payload.decode('utf-8', 'replace'))
+        if kind == b':':
+            return int(payload)
+        if kind == b'$':
+            length = int(payload)
+            if length < 0:
+                return None
+            data = reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('Connection closed by Redis server')
+            return data[:-2]
+        if kind == b'*':
+            length = int(payload)
+            if length < 0:
+                return None
+            return [self._read_reply(reader) for _ in range(length)]
+        raise ConnectionError(f'Unexpected reply from Redis server: {line!r}')
+
+    def _round_trip(self, conn, commands):
+        sock, reader = conn
+        sock.sendall(b''.join(self._pack(command) for command in commands))
+        replies = [self._read_reply(reader) for _ in commands]
+        for reply in replies:
+            for error in (reply if isinstance(reply, list) else (reply,)):
+                if isinstance(error, RedisError):
+                    raise error
+        return replies
+
+    def _execute(self, commands):
+        """
+        Send a pipeline of commands and return their replies in order.
+
+        Error replies are raised as RedisError once every reply has been read.
+        After any failure the connection is closed and dropped, because it may
+        hold unread replies or an open transaction; the next call reconnects.
+        """
+        conn = self._connection()
+        try:
+            return self._round_trip(conn, commands)
+        except BaseException:
+            self._local.conn = None
+            self._close(conn)
+            raise
+
+    def put_many(self, items, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expiry = ('PX', int(ttl * 1000)) if ttl else ()
+        self._execute([('SET', self.prefix + key, _encode(value), *expiry) for key, value in items.items()])
+
+    def add(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expiry = ('PX', int(ttl * 1000)) if ttl else ()
+        return self._execute([('SET', self.prefix + key, _encode(value), 'NX', *expiry)])[0] is not None
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        values = self._execute([('MGET', *(self.prefix + key for key in keys))])[0]
+        return {key: _decode(value) for key, value in zip(keys, values) if value is not None}
+
+    def exists(self, key):
+        return self._execute([('EXISTS', self.prefix + key)])[0] > 0
+
+    def consume(self, key):
+        replies = self._execute([('MULTI',), ('GET', self.prefix + key), ('DEL', self.prefix + key), ('EXEC',)])
+        return _decode(replies[-1][0])
+
+    def delete(self, key):
+        self._execute([('DEL', self.prefix + key)])
+
+
+def create_store(url, default_ttl=None):
+    """
+    Create a store from a ``RESULT_STORE_URL``.
+
+    Args:
+        url (str): Store URL, e.g. ``memory://``, ``sqlite:///results/sessions.sqlite3``
+            or ``redis://localhost:6379/0``.
+        default_ttl (float, optional): TTL in seconds for values written
+            without an explicit one.
+
+    Returns:
+        ResultStore: The configured backend.
+
+    Raises:
+        ValueError: If the URL scheme is not supported.
+    """
+    scheme = url.split('://', 1)[0]
+    if scheme == 'memory':
+        return MemoryResultStore(default_ttl)
+    if scheme == 'sqlite':
+        return SQLiteResultStore(url[len('sqlite:///'):], default_ttl)
+    if scheme in ('redis', 'rediss'):
+        return RedisResultStore(url, default_ttl)
+    raise ValueError(f"Unsupported RESULT_STORE_URL scheme: {scheme}")
+
+
+def init_app(app):
+    """
+    Create the result store configured for ``app``.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        ResultStore: The store stored in ``app.extensions``.
+    """
+    store = create_store(app.config['RESULT_STORE_URL'], app.config['SESSION_TTL'])
+    instrument_methods(store, ('put_many', 'add', 'get_many', 'exists', 'consume', 'delete', 'purge_expired'),
+                       'store')
+    app.extensions['result_store'] = store
+    return store
+
+
+def get_store(app=None):
+    """
+    Return the result store of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        ResultStore: The store created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['result_store']
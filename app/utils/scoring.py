@@ -0,0 +1,244 @@
+"""
+Compiled scoring engine for every questionnaire in ``QUESTIONNAIRES``.
+
+Each questionnaire is compiled once, at import, into a ``ScoringPlan``: the
+scored question IDs in a fixed column order, the column indices of every
+section, the answer scale and a sorted table of interpretation lower bounds
+that is searched with ``bisect``. Interpretation ranges are treated as
+contiguous, so a score between two configured ranges (e.g. 25.5) belongs to
+the lower one instead of being uninterpretable.
+
+``score`` handles one response dict. ``score_batch`` scores an N x Q matrix
+of responses with NumPy in one pass; NumPy is only imported when it is used.
+
+A section score is the mean answer of the section rescaled to 0-100, and is
+inverted for questionnaires where the lowest answer is the best outcome
+(KOOS, HOOS). Unanswered questions are left out and sections without any
+answer get no score. The total is the mean of the section scores, or for
+``'total': 'items'`` the rescaled mean of all answers in the total sections.
+"""
+
+from bisect import bisect_right
+
+from app.questionnaires_config import QUESTIONNAIRES
+
+NO_RESPONSES = 'No valid responses received'
+
+
+class ScoringPlan:
+    """
+    Precompiled scoring rules of one questionnaire.
+
+    Attributes:
+        slug (str): Questionnaire slug.
+        name (str): Display name used in results.
+        question_ids (tuple): Scored question IDs; the column order of batch matrices.
+        sections (tuple): ``(name, question_ids, column_indices)`` per section.
+        total_sections (frozenset): Positions in ``sections`` that make up the total.
+        optional_sections (frozenset): Sections patients may leave unanswered.
+    """
+
+    def __init__(self, slug, config):
+        scoring = config.get('scoring', {})
+        unscored = set(scoring.get('unscored', ()))
+        self.slug = slug
+        self.name = config['name']
+        self.min_value = scoring.get('min', 0)
+        self.max_value = scoring.get('max', 4)
+        self.inverted = scoring.get('inverted', True)
+        self.total_method = scoring.get('total', 'sections')
+
+        question_ids = []
+        sections = []
+        for section, questions in config['sections'].items():
+            scored = tuple(q for q in questions if q not in unscored)
+            start = len(question_ids)
+            question_ids.extend(scored)
+            sections.append((section, scored, tuple(range(start, len(question_ids)))))
+        self.question_ids = tuple(question_ids)
+        self.column = {question_id: index for index, question_id in enumerate(self.question_ids)}
+        self.sections = tuple(sections)
+
+        total_names = scoring.get('total_sections')
+        self.total_sections = frozenset(index for index, (section, _, _) in enumerate(self.sections)
+                                    if total_names is None or section in total_names)
+        self.total_questions = tuple(q for index in sorted(self.total_sections) for q in self.sections[index][1])
+        self.optional_sections = frozenset(scoring.get('optional_sections', ()))
+
+        ranges = sorted(config['interpretation'].items())
+        self._lower_bounds = tuple(low for (low, _), _ in ranges)
+        self._labels = tuple(label for _, label in ranges)
+        self._scale = 100 / (self.max_value - self.min_value)
+        self._weights = None
+
+    def rescale(self, mean):
+        """Convert a mean answer to the 0-100 score of this questionnaire."""
+        score = (mean - self.min_value) * self._scale
+        return 100 - score if self.inverted else score
+
+    def interpret(self, score):
+        """Return the interpretation label of a 0-100 score."""
+        return self._labels[max(bisect_right(self._lower_bounds, score) - 1, 0)]
+
+    def _mean_score(self, responses, question_ids):
+        total = 0
+        count = 0
+        for question_id in question_ids:
+            value = responses.get(question_id)
+            # Yes/no and free-text answers, and anything else non-numeric, are not scored
+            if value.__class__ is int or value.__class__ is float:
+                total += value
+                count += 1
+        return self.rescale(total / count) if count else None
+
+    def score(self, responses):
+        """
+        Score one set of responses.
+
+        Args:
+            responses (dict): Question ID to answer value.
+
+        Returns:
+            dict: ``questionnaire_name``, ``sections`` (name, score and
+            interpretation of every answered section), ``total_score`` and
+            ``interpretation``.
+        """
+        section_scores = []
+        total_scores = []
+        for index, (section, question_ids, _) in enumerate(self.sections):
+            score = self._mean_score(responses, question_ids)
+            if score is None:
+                continue
+            section_scores.append({'name': section, 'score': score, 'interpretation': self.interpret(score)})
+            if index in self.total_sections:
+                total_scores.append(score)
+
+        if self.total_method == 'items':
+            total_score = self._mean_score(responses, self.total_questions)
+        else:
+            total_score = sum(total_scores) / len(total_scores) if total_scores else None
+
+        if total_score is None:
+            return {
+                'questionnaire_name': self.name,
+                'sections': section_scores,
+                'total_score': 0,
+                'interpretation': NO_RESPONSES,
+            }
+        return {
+            'questionnaire_name': self.name,
+            'sections': section_scores,
+            'total_score': total_score,
+            'interpretation': self.interpret(total_score),
+        }
+
+    def to_matrix(self, responses_list):
+        """
+        Arrange response dicts as an N x Q float matrix with NaN for missing answers.
+
+        Args:
+            responses_list (iterable): Response dicts.
+
+        Returns:
+            numpy.ndarray: Columns in ``question_ids`` order.
+        """
+        import numpy as np
+
+        responses_list = list(responses_list)
+        matrix = np.full((len(responses_list), len(self.question_ids)), np.nan)
+        column = self.column
+        for row, responses in enumerate(responses_list):
+            for question_id, value in responses.items():
+                index = column.get(question_id)
+                if index is not None and (value.__class__ is int or value.__class__ is float):
+                    matrix[row, index] = value
+        return matrix
+
+    def score_batch(self, matrix):
+        """
+        Score an N x Q matrix of answers in one vectorized pass.
+
+        Args:
+            matrix (array-like): Answers in ``question_ids`` column order, NaN
+                where a question was not answered (see ``to_matrix``).
+
+        Returns:
+            dict: ``sections`` (N x S section scores), ``total`` (N totals)
+            and ``section_names``. Unscorable entries are NaN.
+        """
+        import numpy as np
+
+        matrix = np.asarray(matrix, dtype=float)
+        answered = ~np.isnan(matrix)
+        values = np.where(answered, matrix, 0.0)
+
+        weights = self._weights
+        if weights is None:
+            # One row per section selecting its columns, plus the item-level total
+            weights = np.zeros((len(self.sections) + 1, len(self.question_ids)))
+            for row, (_, _, columns) in enumerate(self.sections):
+                weights[row, list(columns)] = 1.0
+            weights[-1, [self.column[q] for q in self.total_questions]] = 1.0
+            self._weights = weights
+
+        sums = values @ weights.T
+        counts = answered.astype(float) @ weights.T
+        with np.errstate(invalid='ignore', divide='ignore'):
+            scores = (sums / counts - self.min_value) * self._scale
+        if self.inverted:
+            scores = 100 - scores
+
+        section_scores = scores[:, :-1]
+        if self.total_method == 'items':
+            total = scores[:, -1]
+        else:
+            selected = section_scores[:, sorted(self.total_sections)]
+            scored = ~np.isnan(selected)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                total = np.where(scored, selected, 0.0).sum(axis=1) / scored.sum(axis=1)
+        return {
+            'section_names': [section for section, _, _ in self.sections],
+            'sections': section_scores,
+            'total': total,
+        }
+
+    def interpret_batch(self, scores):
+        """Return the interpretation label of every score in an array (None for NaN)."""
+        import numpy as np
+
+        scores = np.asarray(scores, dtype=float)
+        indices = np.maximum(np.searchsorted(self._lower_bounds, scores, side='right') - 1, 0)
+        return [None if np.isnan(score) else self._labels[index] for score, index in zip(scores, indices)]
+
+
+PLANS = {slug: ScoringPlan(slug, config) for slug, config in QUESTIONNAIRES.items()}
+
+
+def get_plan(slug):
+    """
+    Return the scoring plan of a questionnaire.
+
+    Args:
+        slug (str): Questionnaire slug.
+
+    Returns:
+        ScoringPlan or None: The plan, or None if the slug is unknown.
+    """
+    return PLANS.get(slug)
+
+
+def score_responses(slug, responses):
+    """
+    Score one set of responses for a questionnaire.
+
+    Args:
+        slug (str): Questionnaire slug.
+        responses (dict): Question ID to answer value.
+
+    Returns:
+        dict: The result, see ``ScoringPlan.score``.
+
+    Raises:
+        KeyError: If the questionnaire is unknown.
+    """
+    return PLANS[slug].score(responses)
@@ -0,0 +1,155 @@
+"""
+Signed, expiring patient session tokens.
+
+The patient form URL (``/f/<token>``) carries everything the form needs: the
+session ID, questionnaire slug, language, clinic and expiry time, signed
+with ``itsdangerous`` (HMAC, compared in constant time). ``patient_form``
+verifies the token and renders the page without reading the result store or
+the filesystem, and rejects forged links with 404 and expired ones with 410.
+
+Verified tokens are kept in a bounded per-worker LRU cache, so a repeat hit
+(reload, submission, offline retry) costs one dict lookup and an expiry
+check. Only tokens with a valid signature are cached, so forged tokens cannot
+push real ones out.
+
+Tokens are deterministic: minting the same session twice gives the same
+token, so QR codes and their ETags stay stable.
+"""
+
+import threading
+import time
+import uuid
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from collections import OrderedDict, namedtuple
+
+from itsdangerous import BadData, URLSafeSerializer
+
+# Longer tokens are rejected before their signature is checked
+MAX_TOKEN_LENGTH = 512
+
+SessionToken = namedtuple('SessionToken', 'session_id evaluation_form language clinic expires')
+
+
+class TokenError(ValueError):
+    """Raised for tokens that are malformed or carry a bad signature."""
+
+
+class TokenExpired(TokenError):
+    """Raised for genuine tokens whose expiry time has passed."""
+
+
+def _pack_id(session_id):
+    return urlsafe_b64encode(uuid.UUID(session_id).bytes).rstrip(b'=').decode('ascii')
+
+
+def _unpack_id(packed):
+    return str(uuid.UUID(bytes=urlsafe_b64decode(packed + '==')))
+
+
+class SessionTokens:
+    """
+    Mints and verifies session tokens.
+
+    Args:
+        secret_key (str): Signing key.
+        max_entries (int, optional): Verified tokens cached per worker.
+    """
+
+    SALT = 'physioengine.patient-form'
+
+    def __init__(self, secret_key, max_entries=4096):
+        self.serializer = URLSafeSerializer(secret_key, salt=self.SALT)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def mint(self, session_id, evaluation_form, expires, language='swedish', clinic=''):
+        """
+        Return the token of a session.
+
+        Args:
+            session_id (str): The session's UUID.
+            evaluation_form (str): Questionnaire slug.
+            expires (int): Unix time after which the token is rejected.
+            language (str, optional): Questionnaire language.
+            clinic (str, optional): Clinic tag.
+
+        Returns:
+            str: A URL-safe token.
+        """
+        return self.serializer.dumps([_pack_id(session_id), evaluation_form, language, clinic, int(expires)])
+
+    def verify(self, token, now=None):
+        """
+        Return the session a token was minted for.
+
+        Args:
+            token (str): Token from the patient form URL.
+            now (float, optional): Current Unix time. Defaults to ``time.time()``.
+
+        Returns:
+            SessionToken: The decoded session.
+
+        Raises:
+            TokenExpired: If the token is genuine but has expired.
+            TokenError: If the token is malformed or forged.
+        """
+        with self._lock:
+            session = self._cache.get(token)
+            if session is not None:
+                self._cache.move_to_end(token)
+                self.hits += 1
+        if session is None:
+            session = self._decode(token)
+            with self._lock:
+                self.misses += 1
+                self._cache[token] = session
+                while len(self._cache) > self.max_entries:
+                    self._cache.popitem(last=False)
+        if session.expires < (time.time() if now is None else now):
+            raise TokenExpired('Session token has expired')
+        return session
+
+    def _decode(self, token):
+        if len(token) > MAX_TOKEN_LENGTH:
+            raise TokenError('Session token is too long')
+        try:
+            packed, evaluation_form, language, clinic, expires = self.serializer.loads(token)
+            return SessionToken(_unpack_id(packed), str(evaluation_form), str(language), str(clinic), int(expires))
+        except BadData as e:
+            raise TokenError('Session token signature does not match') from e
+        except (TypeError, ValueError) as e:
+            raise TokenError('Session token is malformed') from e
+
+
+def init_app(app):
+    """
+    Create the session token service for ``app``.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        SessionTokens: The service stored in ``app.extensions``.
+    """
+    tokens = SessionTokens(app.config['SESSION_TOKEN_KEY'], app.config['SESSION_TOKEN_CACHE_SIZE'])
+    app.extensions['session_tokens'] = tokens
+    return tokens
+
+
+def get_session_tokens(app=None):
+    """
+    Return the session token service of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        SessionTokens: The service created by ``init_app``.
+    """
+    if app is None:
+        from flask import current_app
+        app = current_app
+    return app.extensions['session_tokens']
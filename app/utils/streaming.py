@@ -0,0 +1,74 @@
+"""
+Streamed template responses.
+
+``stream_page`` sends a page while Jinja is still rendering it, so a phone on
+a slow connection can fetch the stylesheets and paint the first questions
+before the last section is rendered. Output is sent in chunks: the document
+head as soon as ``</head>`` is rendered, then after every closing
+``</section>`` tag or once a chunk reaches ``TEMPLATE_STREAM_CHUNK_SIZE``
+bytes.
+
+Clients that accept gzip get a single gzip stream that is sync-flushed at
+every chunk boundary, so each chunk can be decompressed and parsed as soon
+as it arrives. Headers are sent before the body, so ``after_request`` hooks
+such as Talisman and ``add_security_headers`` apply unchanged.
+
+Once the first chunk is sent the status can no longer change; callers load
+and check everything the template needs before streaming.
+"""
+
+import zlib
+
+from flask import Response, current_app, request, stream_template
+
+# Markers after which buffered output is sent right away
+FLUSH_AFTER = ('</head>', '</section>')
+
+
+def _chunks(pieces, chunk_size):
+    """Group rendered template pieces into encoded chunks."""
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_size or any(marker in piece for marker in FLUSH_AFTER):
+            yield ''.join(buffer).encode('utf-8')
+            buffer = []
+            size = 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def _gzip_chunks(chunks, level):
+    """Compress chunks into one gzip stream, flushing after each chunk."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+    yield compressor.flush(zlib.Z_FINISH)
+
+
+def stream_page(template_name, **context):
+    """
+    Respond with ``template_name`` rendered and sent section by section.
+
+    Args:
+        template_name (str): Template to render.
+        **context: Template context.
+
+    Returns:
+        Response: A streamed HTML response, gzip-encoded if the client accepts it.
+    """
+    chunks = _chunks(stream_template(template_name, **context), current_app.config['TEMPLATE_STREAM_CHUNK_SIZE'])
+    gzip = request.accept_encodings['gzip'] > 0
+    if gzip:
+        chunks = _gzip_chunks(chunks, current_app.config['TEMPLATE_STREAM_COMPRESS_LEVEL'])
+    response = Response(chunks, mimetype='text/html')
+    if gzip:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    # Ask buffering proxies such as nginx to pass chunks through as they come
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
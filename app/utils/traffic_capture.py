@@ -0,0 +1,300 @@
+"""
+Redacted capture of incoming requests for replay (``benchmarks.replay``).
+
+With ``TRAFFIC_CAPTURE_ENABLED`` every request routed by Flask is appended to
+``TRAFFIC_CAPTURE_PATH`` as one compact JSON line::
+
+    {"t": 1792318804.123, "m": "GET", "e": "main.wait_for_result",
+     "p": "/wait_for_result/<session_id>/<evaluation_form>",
+     "v": {"session_id": "~3f9c0a1be2d4", "evaluation_form": "koos"},
+     "a": {}, "f": {}, "h": ["gzip"], "s": "3f9c0a1be2d4", "q": "koos",
+     "st": 200, "ms": 2.41}
+
+``t`` is the arrival time, ``p`` the URL rule, ``st`` the status and ``ms`` the
+time Flask spent on the request. Nothing that identifies a patient is kept:
+
+* Session IDs, session tokens and other path identifiers are replaced by a
+  keyed hash (``~`` followed by 12 hex digits). The same session gets the
+  same pseudonym in every request and worker, so replay can follow it. ``s``
+  is the pseudonym of the request's session, also for session tokens and
+  for redirects to a session URL, and ``q`` its questionnaire.
+* Query arguments and form fields (``a``, ``f``) keep their names but only
+  the shape of their values ('int' or 'str'), except for the arguments in
+  ``TRAFFIC_CAPTURE_KEEP_ARGS`` and questionnaire slugs (counts on QR sheets).
+* Of the headers only the ones that change how a request is served are noted
+  in ``h``: gzip support and an Idempotency-Key.
+
+``TRAFFIC_CAPTURE_SAMPLE_RATE`` keeps a fraction of the sessions, with all of
+their requests, and the same fraction of requests without a session.
+
+Lines are buffered in memory and appended by a background thread every
+``TRAFFIC_CAPTURE_FLUSH_INTERVAL`` seconds with a single ``write`` per batch,
+so workers can share the file.
+"""
+
+import atexit
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+
+from flask import current_app, g, request
+
+from app.questionnaires_config import QUESTIONNAIRES
+from app.utils.profiling import ENDPOINTS as PROFILING_ENDPOINTS
+
+logger = logging.getLogger(__name__)
+
+# Path arguments that name a questionnaire or format rather than a patient
+SAFE_VIEW_ARGS = ('evaluation_form', 'questionnaire', 'fmt', 'slug')
+
+
+def value_shape(value):
+    """Return the recorded shape of a redacted argument or form value."""
+    return 'int' if value.isdigit() else 'str'
+
+
+class TrafficCapture:
+    """
+    Buffers redacted request records and appends them to a JSONL file.
+
+    Attributes:
+        path (str): The JSONL file shared by all workers.
+        sample_rate (float): Fraction of sessions and requests kept.
+        keep_args (frozenset): Query arguments whose values are kept.
+        written (int): Records this process wrote.
+        dropped (int): Records this process dropped because the buffer was full.
+    """
+
+    def __init__(self, path, key, sample_rate=1.0, keep_args=(), capacity=10000, flush_interval=2.0):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.keep_args = frozenset(keep_args) | frozenset(QUESTIONNAIRES)
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self.written = 0
+        self.dropped = 0
+        self._key = key.encode('utf-8') if isinstance(key, str) else key
+        self._buffer = deque(maxlen=capacity)
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def pseudonym(self, value):
+        """Return the keyed hash that stands in for an identifier."""
+        return hmac.new(self._key, value.encode('utf-8'), hashlib.sha256).hexdigest()[:12]
+
+    def keeps(self, pseudonym):
+        """Return True if the session with this pseudonym is sampled."""
+        return self.sample_rate >= 1 or int(pseudonym[:8], 16) < self.sample_rate * 0x100000000
+
+    def record(self, entry):
+        """
+        Buffer one record; safe to call from any thread.
+
+        Args:
+            entry (dict): The redacted request.
+        """
+        if len(self._buffer) == self.capacity:
+            self.dropped += 1
+        self._buffer.append(entry)
+
+    def flush(self):
+        """
+        Append all buffered records to the file with one write.
+
+        Returns:
+            int: Number of records written.
+        """
+        with self._flush_lock:
+            entries = []
+            while True:
+                try:
+                    entries.append(self._buffer.popleft())
+                except IndexError:
+                    break
+            if not entries:
+                return 0
+            data = ''.join(json.dumps(entry, separators=(',', ':')) + '\n' for entry in entries).encode('utf-8')
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+            try:
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(fd, view):]
+            finally:
+                os.close(fd)
+            self.written += len(entries)
+            return len(entries)
+
+    def start(self):
+        """Start the background flush thread if it is not running."""
+        if self._thread is not None:
+            return
+        with self._thread_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='traffic-capture', daemon=True)
+                self._thread.start()
+                atexit.register(self._flush_quietly)
+
+    def stop(self):
+        """Ask the background flush thread to exit."""
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            self._flush_quietly()
+
+    def _flush_quietly(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Traffic capture flush failed: %s", e, exc_info=True)
+
+    def _session_from_token(self, token):
+        from app.utils.session_tokens import TokenError, get_session_tokens
+        try:
+            # Expired tokens still name their session
+            session = get_session_tokens().verify(token, now=0)
+        except TokenError:
+            return None, None
+        return session.session_id, session.evaluation_form
+
+    def redact(self, response, duration):
+        """
+        Build the record of the current request.
+
+        Args:
+            response (Response): The response being sent.
+            duration (float): Seconds spent on the request so far.
+
+        Returns:
+            dict or None: The record, or None if the request is not sampled.
+        """
+        session = questionnaire = None
+        view_args = {}
+        for name, value in (request.view_args or {}).items():
+            value = str(value)
+            if name in SAFE_VIEW_ARGS:
+                view_args[name] = value
+                if name in ('evaluation_form', 'questionnaire'):
+                    questionnaire = value
+                continue
+            if name == 'token':
+                session_id, questionnaire = self._session_from_token(value)
+                session = self.pseudonym(session_id or value)
+                view_args[name] = '~' + session
+            else:
+                view_args[name] = '~' + self.pseudonym(value)
+                if name == 'session_id':
+                    session = view_args[name][1:]
+
+        if session is None and response.location:
+            # Redirects into a session, e.g. generate_qr to wait_for_result
+            try:
+                endpoint, target_args = current_app.url_map.bind('').match(urlsplit(response.location).path)
+            except Exception:
+                target_args = {}
+            if 'session_id' in target_args:
+                session = self.pseudonym(target_args['session_id'])
+                questionnaire = target_args.get('evaluation_form', questionnaire)
+
+        if session is not None:
+            if not self.keeps(session):
+                return None
+        elif self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return None
+
+        args = {name: value if name in self.keep_args else value_shape(value)
+                for name, value in request.args.items()}
+        if questionnaire is None:
+            questionnaire = args.get('evaluation_form') if args.get('evaluation_form') in QUESTIONNAIRES else None
+        headers = []
+        if 'gzip' in request.headers.get('Accept-Encoding', ''):
+            headers.append('gzip')
+        if 'Idempotency-Key' in request.headers:
+            headers.append('idem')
+        return {
+            't': round(g.capture_time, 3),
+            'm': request.method,
+            'e': request.endpoint,
+            'p': request.url_rule.rule,
+            'v': view_args,
+            'a': args,
+            'f': {name: value_shape(value) for name, value in request.form.items()} if request.form else {},
+            'h': headers,
+            's': session,
+            'q': questionnaire,
+            'st': response.status_code,
+            'ms': round(duration * 1000, 2),
+        }
+
+
+def init_app(app):
+    """
+    Install the traffic capture for ``app`` if TRAFFIC_CAPTURE_ENABLED is set.
+
+    Requests that do not match a route (404s, static files served by
+    WhiteNoise) and profiling requests are not captured.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        TrafficCapture or None: The capture stored in ``app.extensions``, or
+        None if it is disabled.
+    """
+    if not app.config['TRAFFIC_CAPTURE_ENABLED']:
+        app.extensions['traffic_capture'] = None
+        return None
+
+    capture = TrafficCapture(app.config['TRAFFIC_CAPTURE_PATH'], app.config['TRAFFIC_CAPTURE_KEY'],
+                             app.config['TRAFFIC_CAPTURE_SAMPLE_RATE'], app.config['TRAFFIC_CAPTURE_KEEP_ARGS'],
+                             app.config['TRAFFIC_CAPTURE_BUFFER_SIZE'], app.config['TRAFFIC_CAPTURE_FLUSH_INTERVAL'])
+    app.extensions['traffic_capture'] = capture
+
+    @app.before_request
+    def start_capture():
+        capture.start()
+        g.capture_time = time.time()
+        g.capture_start = time.perf_counter()
+
+    @app.after_request
+    def capture_request(response):
+        start = g.pop('capture_start', None)
+        if start is not None and request.url_rule is not None and request.endpoint not in PROFILING_ENDPOINTS:
+            try:
+                entry = capture.redact(response, time.perf_counter() - start)
+            except Exception as e:
+                logger.warning("Could not capture %s: %s", request.endpoint, e)
+            else:
+                if entry is not None:
+                    capture.record(entry)
+        return response
+
+    logger.info("Capturing traffic to %s (sample rate %.2f)", capture.path, capture.sample_rate)
+    return capture
+
+
+def get_traffic_capture(app=None):
+    """
+    Return the traffic capture of ``app`` or of the current app.
+
+    Args:
+        app (Flask, optional): Application to look up. Defaults to current_app.
+
+    Returns:
+        TrafficCapture or None: The capture, or None if it is disabled.
+    """
+    if app is None:
+        app = current_app
+    return app.extensions['traffic_capture']
@@ -0,0 +1,150 @@
+"""
+Validation of submitted answers against the questionnaire data.
+
+A ``ResponseSchema`` is compiled once from a registry entry: the allowed
+option values of every choice question, the free-text questions and the
+questions that must be answered (every choice question outside the optional
+sections of the scoring plan). Schemas are cached per registry entry, so a
+questionnaire reload compiles a new schema on first use.
+"""
+
+import threading
+
+from app.utils.questionnaire_registry import DEFAULT_LANGUAGE, get_registry
+from app.utils.scoring import get_plan
+
+MAX_TEXT_LENGTH = 200
+
+
+class ValidationError(ValueError):
+    """
+    Raised when submitted answers do not match the questionnaire.
+
+    Attributes:
+        errors (list): One ``{'question': id, 'error': message}`` per problem.
+    """
+
+    def __init__(self, errors):
+        super().__init__('; '.join(f"{error['question']}: {error['error']}" for error in errors))
+        self.errors = errors
+
+
+class ResponseSchema:
+    """
+    Precompiled answer rules of one questionnaire.
+
+    Attributes:
+        slug (str): Questionnaire slug.
+        choices (dict): Question ID to the allowed answer values.
+        text (frozenset): IDs of free-text questions.
+        required (tuple): IDs of questions that must be answered.
+    """
+
+    def __init__(self, questionnaire):
+        plan = get_plan(questionnaire['slug'])
+        optional_sections = plan.optional_sections if plan else frozenset()
+        self.slug = questionnaire['slug']
+        self.choices = {}
+        text = set()
+        required = []
+        for section in questionnaire['sections']:
+            optional = section.get('title') in optional_sections
+            for question in section['questions']:
+                if 'id' not in question:
+                    continue
+                if question.get('type') == 'text':
+                    text.add(question['id'])
+                    continue
+                # Option values are ints or strings such as 'yes'; both may arrive as strings
+                allowed = {}
+                for option in question.get('options', ()):
+                    allowed[option['value']] = option['value']
+                    allowed[str(option['value'])] = option['value']
+                self.choices[question['id']] = allowed
+                if not optional:
+                    required.append(question['id'])
+        self.text = frozenset(text)
+        self.required = tuple(required)
+
+    def unknown(self, answers):
+        """Return the IDs in ``answers`` that are not questions of this questionnaire."""
+        return sorted(question_id for question_id in answers
+                      if question_id not in self.choices and question_id not in self.text)
+
+    def validate(self, answers, require_all=True, ignore_unknown=False):
+        """
+        Check and normalise submitted answers.
+
+        Args:
+            answers (Mapping): Question ID to answer, as decoded from JSON or
+                extracted from a form.
+            require_all (bool, optional): Report unanswered required questions.
+                Defaults to True.
+            ignore_unknown (bool, optional): Drop answers to questions that are
+                not in the questionnaire instead of reporting them, e.g. for
+                forms served before a questionnaire reload. Defaults to False.
+
+        Returns:
+            dict: Question ID to answer, with choice answers converted to the
+            option's value type.
+
+        Raises:
+            ValidationError: If any answer is unknown, out of range or missing.
+        """
+        if not hasattr(answers, 'items'):
+            raise ValidationError([{'question': None, 'error': 'answers must be an object'}])
+
+        responses = {}
+        errors = []
+        for question_id, value in answers.items():
+            allowed = self.choices.get(question_id)
+            if allowed is not None:
+                if value.__class__ is bool or value.__class__ not in (int, str) or value not in allowed:
+                    errors.append({'question': question_id, 'error': f'invalid value {value!r}'})
+                else:
+                    responses[question_id] = allowed[value]
+            elif question_id in self.text:
+                if not isinstance(value, str) or len(value) > MAX_TEXT_LENGTH:
+                    errors.append({'question': question_id,
+                                   'error': f'must be text of at most {MAX_TEXT_LENGTH} characters'})
+                elif value:
+                    responses[question_id] = value
+            elif not ignore_unknown:
+                errors.append({'question': question_id, 'error': 'unknown question'})
+
+        if require_all:
+            errors.extend({'question': question_id, 'error': 'missing answer'}
+                          for question_id in self.required
+                          if question_id not in responses and question_id not in answers)
+        if errors:
+            raise ValidationError(errors)
+        return responses
+
+
+_schemas = {}
+_lock = threading.Lock()
+
+
+def get_schema(slug, language=DEFAULT_LANGUAGE):
+    """
+    Return the response schema of a questionnaire, compiling it if needed.
+
+    Args:
+        slug (str): Questionnaire slug.
+        language (str, optional): Language. Defaults to 'swedish'.
+
+    Returns:
+        ResponseSchema or None: The schema, or None if the questionnaire is
+        not in the registry.
+    """
+    questionnaire = get_registry().get(slug, language)
+    if questionnaire is None:
+        return None
+    key = (slug, language)
+    cached = _schemas.get(key)
+    if cached is not None and cached[0] is questionnaire:
+        return cached[1]
+    schema = ResponseSchema(questionnaire)
+    with _lock:
+        _schemas[key] = (questionnaire, schema)
+    return schema
@@ -0,0 +1,144 @@
+"""
+Cold start helpers: template bytecode cache, warmup and a startup report.
+
+``warm_up`` does the work that would otherwise slow down the first requests
+of every worker: compiling all templates, rendering the questionnaire pages
+into the page cache and loading the QR encoder. ``gunicorn.conf.py`` runs it
+once in the master with ``preload_app`` so forked workers share the result
+copy-on-write.
+
+Compiled templates are also kept in a Jinja bytecode cache on disk, so even a
+fresh process skips parsing the templates again.
+
+``flask startup-report`` measures import time, ``create_app``, warmup and
+the first requests in a fresh interpreter.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+import uuid
+
+import click
+from jinja2 import FileSystemBytecodeCache
+
+# Run in a fresh interpreter by ``flask startup-report``; prints one JSON line
+_REPORT_SCRIPT = '''
+import json, time, uuid
+start = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+from app.utils.warmup import warm_up
+steps = warm_up(app) if {warm!r} else {{}}
+warmed = time.perf_counter()
+client = app.test_client()
+first = {{}}
+with app.app_context():
+    from app.routes.main import session_token
+    token = session_token(str(uuid.uuid4()), {{'f': 'koos', 'c': int(time.time())}})
+for path in ('/', '/f/%s' % token, '/generate_qr?evaluation_form=koos'):
+    request_start = time.perf_counter()
+    client.get(path, base_url='https://localhost')
+    first[path.split('?')[0].split('/')[1] or '/'] = time.perf_counter() - request_start
+print(json.dumps({{'import': imported - start, 'create_app': created - imported, 'warm_up': warmed - created,
+                   'warm_up_steps': steps, 'first_requests': first}}))
+'''
+
+
+def warm_up(app):
+    """
+    Prepare everything the first requests would otherwise do lazily.
+
+    Hooks and background threads are not run, so this is safe to call in a
+    process that forks workers afterwards.
+
+    Args:
+        app (Flask): The application instance.
+
+    Returns:
+        dict: Seconds spent on each step.
+    """
+    from app.routes.main import questionnaire_template, render_questionnaire, session_token
+    from app.routes.user import fill_questionnaire
+    from app.utils.funnel import get_funnel
+    from app.utils.qr import qr_matrix
+    from app.utils.questionnaire_registry import get_registry
+    from app.utils.session_tokens import get_session_tokens
+
+    timings = {}
+
+    start = time.perf_counter()
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        app.jinja_env.get_template(name)
+    timings['templates'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    templates = set(app.jinja_env.list_templates())
+    with app.test_request_context('/', base_url=app.config['BASE_URL']):
+        for slug, language in get_registry(app).keys():
+            if language != 'swedish' or questionnaire_template(slug) not in templates:
+                continue
+            # A real token for a session that is never stored, as patient_form verifies it
+            token = session_token(str(uuid.uuid4()), {'f': slug, 'c': int(time.time())})
+            render_questionnaire(token, get_session_tokens(app).verify(token))
+            fill_questionnaire(slug)
+    # The pages above were opened by no patient
+    tracer = get_funnel(app)
+    if tracer is not None:
+        tracer.reset()
+    timings['pages'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    qr_matrix(app.config['BASE_URL'])
+    timings['qr'] = time.perf_counter() - start
+
+    app.logger.info("Warmed up in %.3fs: %s", sum(timings.values()), timings)
+    return timings
+
+
+def init_app(app):
+    """
+    Enable the template bytecode cache and register ``flask startup-report``.
+
+    Args:
+        app (Flask): The application instance.
+    """
+    cache_dir = app.config['TEMPLATE_CACHE_DIR']
+    if cache_dir:
+        os.makedirs(cache_dir, exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cache_dir)
+
+    @app.cli.command('startup-report')
+    @click.option('--top', default=15, show_default=True, help='Number of slowest imports to list.')
+    @click.option('--no-warm-up', is_flag=True, help='Measure first requests without warming up.')
+    def startup_report_command(top, no_warm_up):
+        """Measure import, startup and first-request time in a fresh process."""
+        result = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', _REPORT_SCRIPT.format(warm=not no_warm_up)],
+            capture_output=True, text=True, cwd=os.getcwd())
+        if result.returncode:
+            raise click.ClickException(result.stderr[-2000:])
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+
+        click.echo(f"import app:      {report['import'] * 1000:8.1f} ms")
+        click.echo(f"create_app():    {report['create_app'] * 1000:8.1f} ms")
+        click.echo(f"warm_up():       {report['warm_up'] * 1000:8.1f} ms")
+        for step, seconds in report['warm_up_steps'].items():
+            click.echo(f"  {step:<14} {seconds * 1000:8.1f} ms")
+        click.echo('first requests:')
+        for path, seconds in report['first_requests'].items():
+            click.echo(f"  {path:<14} {seconds * 1000:8.1f} ms")
+
+        # -X importtime lines: "import time: self [us] | cumulative | imported package"
+        imports = []
+        for line in result.stderr.splitlines():
+            if line.startswith('import time:') and not line.endswith('imported package'):
+                self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+                imports.append((int(cumulative_us), int(self_us), name.strip()))
+        click.echo('slowest imports (cumulative, self):')
+        for cumulative_us, self_us, name in sorted(imports, reverse=True)[:top]:
+            click.echo(f"  {name:<40} {cumulative_us / 1000:8.1f} ms {self_us / 1000:8.1f} ms")
@@ -0,0 +1,18 @@
+"""
+Offline benchmarks for PhysioEngine.
+
+Microbenchmarks cover scoring, questionnaire loading, questionnaire template
+rendering and QR code generation. Macrobenchmarks drive the clinic flow
+(generate_qr, patient form submission, wait_for_result) through the Flask
+test client. Nothing needs network access or external services.
+
+Usage (from the repository root)::
+
+    python -m benchmarks run                       # print results
+    python -m benchmarks run --save baseline       # store benchmarks/baselines/baseline.json
+    python -m benchmarks compare baseline          # re-run and fail on regressions
+    python -m benchmarks compare old.json new.json # compare two stored runs
+
+``python -m benchmarks.loadgen`` simulates concurrent clinic traffic for
+capacity planning; see ``benchmarks/loadgen.py``.
+"""
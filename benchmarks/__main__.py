@@ -0,0 +1,85 @@
+"""
+Command line entry point: ``python -m benchmarks``.
+"""
+
+import argparse
+import fnmatch
+import sys
+
+from benchmarks import macro, micro  # noqa: F401  (registers the benchmarks)
+from benchmarks.env import benchmark_app
+from benchmarks.harness import (BENCHMARKS, compare_results, environment, format_comparison,
+                                format_results, load_results, measure, save_results)
+
+
+def run_benchmarks(pattern='*', group=None, repeat=5, min_time=0.2):
+    """
+    Run the registered benchmarks matching ``pattern``.
+
+    Args:
+        pattern (str, optional): Shell-style filter on benchmark names.
+        group (str, optional): Only run 'micro' or 'macro' benchmarks.
+        repeat (int, optional): Timed rounds per benchmark.
+        min_time (float, optional): Minimum seconds per round.
+
+    Returns:
+        dict: ``{'environment': ..., 'benchmarks': {name: stats}}``.
+    """
+    results = {}
+    with benchmark_app() as app:
+        for name, (bench_group, setup) in BENCHMARKS.items():
+            if not fnmatch.fnmatch(name, pattern) or (group and bench_group != group):
+                continue
+            func, items = setup(app)
+            stats = measure(func, repeat=repeat, min_time=min_time)
+            stats['per_item'] = stats['median'] / items
+            stats['group'] = bench_group
+            results[name] = stats
+            print(f'  {name}: {stats["median"]:.1f} us', file=sys.stderr)
+    return {'environment': environment(), 'benchmarks': results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_run_options(subparser):
+        subparser.add_argument('-k', '--filter', default='*', help='Shell-style pattern of benchmarks to run.')
+        subparser.add_argument('--group', choices=('micro', 'macro'), help='Only run one group.')
+        subparser.add_argument('--repeat', type=int, default=5, help='Timed rounds per benchmark.')
+        subparser.add_argument('--min-time', type=float, default=0.2, help='Minimum seconds per round.')
+
+    run_parser = subparsers.add_parser('run', help='Run benchmarks and print the results.')
+    add_run_options(run_parser)
+    run_parser.add_argument('--save', metavar='NAME', help='Store the results as a JSON baseline.')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='Compare against a baseline; exits with status 1 on a regression.')
+    compare_parser.add_argument('baseline', help='Baseline name or JSON path.')
+    compare_parser.add_argument('current', nargs='?', help='Stored run to check instead of running now.')
+    compare_parser.add_argument('--threshold', type=float, default=0.25,
+                                help='Allowed relative slowdown (default 0.25 = 25%%).')
+    compare_parser.add_argument('--metric', choices=('min', 'median'), default='median')
+    add_run_options(compare_parser)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        results = run_benchmarks(args.filter, args.group, args.repeat, args.min_time)
+        print(format_results(results))
+        if args.save:
+            print(f'Saved {save_results(results, args.save)}')
+        return 0
+
+    baseline = load_results(args.baseline)
+    if args.current:
+        current = load_results(args.current)
+    else:
+        current = run_benchmarks(args.filter, args.group, args.repeat, args.min_time)
+    rows = compare_results(baseline, current, args.threshold, args.metric)
+    print(format_comparison(rows, args.threshold))
+    return 1 if any(row[-1] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
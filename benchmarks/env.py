@@ -0,0 +1,113 @@
+"""
+Application setup and test data for benchmarks.
+"""
+
+import os
+import random
+import re
+import tempfile
+from contextlib import contextmanager
+
+from config import Config
+
+
+class BenchmarkConfig(Config):
+    """
+    Isolated, quiet configuration that needs no external services.
+
+    ``benchmark_app`` points the archive, reports and funnel database at a
+    temporary directory that lives as long as the app.
+    """
+
+    TESTING = True
+    LOG_LEVEL = 'WARNING'
+    RESULT_STORE_URL = 'memory://'
+    METRICS_DIR = os.path.join(tempfile.gettempdir(), 'physioengine_benchmark_metrics')
+    JANITOR_INTERVAL = 0
+    QUESTIONNAIRE_RELOAD_INTERVAL = 0
+    # All simulated clients share one address
+    RATE_LIMIT_ENABLED = False
+    # Replayed traffic must not be appended to the trace being replayed
+    TRAFFIC_CAPTURE_ENABLED = False
+
+
+# Requests must look like HTTPS or Talisman redirects them
+BASE_URL = 'https://localhost'
+
+_FORM_LINK_RE = re.compile(rb'id="patient-form-link" href="([^"]+)"')
+
+
+@contextmanager
+def benchmark_app(config_class=BenchmarkConfig):
+    """
+    Create the application for benchmarking and remove its files afterwards.
+
+    Args:
+        config_class (type, optional): Configuration to use.
+
+    Yields:
+        Flask: The application.
+    """
+    from app import create_app
+    from app.utils.funnel import get_funnel
+    from app.utils.reports import get_report_service
+
+    with tempfile.TemporaryDirectory(prefix='physioengine_benchmark_') as directory:
+        class IsolatedConfig(config_class):
+            ARCHIVE_DIR = os.path.join(directory, 'archive')
+            REPORT_DIR = os.path.join(directory, 'reports')
+            FUNNEL_DB = os.path.join(directory, 'funnel.sqlite3')
+
+        app = create_app(IsolatedConfig)
+        try:
+            yield app
+        finally:
+            # Nothing may write into the directory once it is removed
+            funnel = get_funnel(app)
+            if funnel is not None:
+                funnel.stop()
+                funnel.flush()
+            reports = get_report_service(app)
+            if reports is not None:
+                reports.shutdown()
+
+
+def random_responses(questionnaire, rng=random):
+    """
+    Build a random, valid set of answers for a compiled questionnaire.
+
+    Args:
+        questionnaire (Mapping): A questionnaire from the registry.
+        rng (random.Random, optional): Random number generator.
+
+    Returns:
+        dict: Question ID to the chosen option value.
+    """
+    responses = {}
+    for section in questionnaire['sections']:
+        for question in section['questions']:
+            options = question.get('options')
+            if options:
+                responses[question['id']] = rng.choice(options)['value']
+    return responses
+
+
+def form_data(responses):
+    """Convert answers to the form fields the questionnaire pages submit."""
+    return {f'question_{question_id}': str(value) for question_id, value in responses.items()}
+
+
+def patient_form_path(wait_html):
+    """
+    Return the signed patient form path linked from a waiting page.
+
+    Args:
+        wait_html (bytes): Body of ``wait_for_result``.
+
+    Returns:
+        str: The ``/f/<token>`` path.
+    """
+    match = _FORM_LINK_RE.search(wait_html)
+    if match is None:
+        raise ValueError('No patient form link on the waiting page')
+    return match.group(1).decode('ascii')
@@ -0,0 +1,158 @@
+"""
+Timing, storage and comparison helpers shared by all benchmarks.
+"""
+
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+from datetime import datetime, timezone
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), 'baselines')
+
+# Every registered benchmark: name -> (group, setup function)
+BENCHMARKS = {}
+
+
+def benchmark(name, group):
+    """
+    Register a benchmark.
+
+    The decorated function receives the benchmark app and returns a
+    zero-argument callable that performs one iteration, plus the number of
+    items each iteration processes (used to report per-item time for batches).
+
+    Args:
+        name (str): Unique benchmark name.
+        group (str): 'micro' or 'macro'.
+    """
+    def decorator(setup):
+        BENCHMARKS[name] = (group, setup)
+        return setup
+    return decorator
+
+
+def measure(func, repeat=5, min_time=0.2):
+    """
+    Time ``func`` like ``timeit`` with automatic loop calibration.
+
+    Args:
+        func (callable): Zero-argument function to time.
+        repeat (int, optional): Number of timed rounds. Defaults to 5.
+        min_time (float, optional): Minimum duration of one round in seconds.
+
+    Returns:
+        dict: Per-call ``min``, ``median`` and ``max`` in microseconds and the
+        number of ``loops`` per round.
+    """
+    func()  # warm up caches and lazy imports
+    loops = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 10 if elapsed < min_time / 10 else 2
+
+    rounds = [elapsed / loops]
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        for _ in range(loops):
+            func()
+        rounds.append((time.perf_counter() - start) / loops)
+    return {
+        'min': min(rounds) * 1e6,
+        'median': statistics.median(rounds) * 1e6,
+        'max': max(rounds) * 1e6,
+        'loops': loops,
+    }
+
+
+def environment():
+    """Describe the machine and interpreter a run was made on."""
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+    }
+
+
+def baseline_path(name):
+    """Resolve a baseline name or path to a JSON file path."""
+    if name.endswith('.json') or os.sep in name:
+        return name
+    return os.path.join(BASELINE_DIR, f'{name}.json')
+
+
+def save_results(results, name):
+    """
+    Store a run as a JSON baseline.
+
+    Args:
+        results (dict): Output of ``run_benchmarks``.
+        name (str): Baseline name or path.
+
+    Returns:
+        str: The file written.
+    """
+    path = baseline_path(name)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=2, sort_keys=True)
+        file.write('\n')
+    return path
+
+
+def load_results(name):
+    """Load a stored run by baseline name or path."""
+    with open(baseline_path(name)) as file:
+        return json.load(file)
+
+
+def compare_results(baseline, current, threshold, metric='median'):
+    """
+    Compare two runs benchmark by benchmark.
+
+    Args:
+        baseline (dict): The reference run.
+        current (dict): The run to check.
+        threshold (float): Allowed relative slowdown, e.g. 0.25 for 25 %.
+        metric (str, optional): Statistic to compare. Defaults to 'median'.
+
+    Returns:
+        list: ``(name, baseline_us, current_us, change, regressed)`` rows for
+        benchmarks present in both runs.
+    """
+    rows = []
+    for name, result in sorted(current['benchmarks'].items()):
+        reference = baseline['benchmarks'].get(name)
+        if reference is None:
+            continue
+        change = result[metric] / reference[metric] - 1
+        rows.append((name, reference[metric], result[metric], change, change > threshold))
+    return rows
+
+
+def format_results(results):
+    """Format a run as a text table."""
+    lines = [f"{'benchmark':<40} {'min (us)':>12} {'median (us)':>12} {'per item (us)':>14}"]
+    for name, result in sorted(results['benchmarks'].items()):
+        lines.append(f"{name:<40} {result['min']:>12.1f} {result['median']:>12.1f} {result['per_item']:>14.2f}")
+    return '\n'.join(lines)
+
+
+def format_comparison(rows, threshold):
+    """Format the output of ``compare_results`` as a text table."""
+    lines = [f"{'benchmark':<40} {'baseline':>12} {'current':>12} {'change':>9}"]
+    for name, reference, value, change, regressed in rows:
+        flag = '  REGRESSION' if regressed else ''
+        lines.append(f"{name:<40} {reference:>12.1f} {value:>12.1f} {change:>+8.1%}{flag}")
+    lines.append(f"threshold: +{threshold:.0%}")
+    return '\n'.join(lines)
@@ -0,0 +1,335 @@
+"""
+Load generator that simulates a busy clinic day.
+
+Each virtual physio runs clinic visits in a loop: ``/generate_qr`` for a
+questionnaire picked from the mix, the waiting page and its QR code, then the
+patient opens the form, thinks, submits randomized valid answers, and the
+waiting page polls ``wait_for_result`` until the result is shown. Latency
+percentiles, error rates and throughput are reported per endpoint.
+
+Traffic goes to the WSGI app in-process (the default) or to a running
+instance over HTTP::
+
+    python -m benchmarks.loadgen --users 30 --ramp-up 10 --duration 60
+    python -m benchmarks.loadgen --url http://127.0.0.1:8000 --users 50 --mix koos=3,hoos=1
+    python -m benchmarks.loadgen --think 0 --poll-interval 0 --json results.json
+
+All virtual users come from one address, so start a target instance with
+``RATE_LIMIT_ENABLED=0``; the in-process app has rate limits disabled.
+
+Answers are taken from the radio buttons of the served form, so the tool
+needs no access to the questionnaire data.
+"""
+
+import argparse
+import contextlib
+import gzip
+import http.client
+import json
+import random
+import re
+import ssl
+import sys
+import threading
+import time
+from collections import defaultdict
+from urllib.parse import urlencode, urlsplit
+
+from benchmarks.env import BASE_URL, benchmark_app, patient_form_path
+
+_RADIO_RE = re.compile(rb'name="(question_\w+)"[^>]*?value="([^"]*)"')
+_WAITING_MARKER = b'id="result-status"'
+
+
+class InProcessClient:
+    """Sends requests to the WSGI app through a Flask test client per thread."""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, data=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, data=data, base_url=BASE_URL)
+        return response.status_code, response.headers, response.get_data()
+
+
+class HTTPClient:
+    """Sends requests to a running instance over one keep-alive connection per thread."""
+
+    def __init__(self, url, insecure=False, timeout=30):
+        parts = urlsplit(url)
+        self.https = parts.scheme == 'https'
+        self.host = parts.netloc
+        self.timeout = timeout
+        self.context = ssl._create_unverified_context() if insecure else None
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            if self.https:
+                connection = http.client.HTTPSConnection(self.host, timeout=self.timeout, context=self.context)
+            else:
+                connection = http.client.HTTPConnection(self.host, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def request(self, method, path, data=None):
+        # A plain HTTP target is treated as sitting behind a TLS-terminating proxy,
+        # otherwise Talisman redirects every request to HTTPS
+        headers = {'X-Forwarded-Proto': 'https', 'Accept-Encoding': 'gzip'}
+        body = None
+        if data is not None:
+            body = urlencode(data)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        for attempt in (0, 1):
+            connection = self._connection()
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                payload = response.read()
+                if response.getheader('Content-Encoding') == 'gzip':
+                    payload = gzip.decompress(payload)
+                return response.status, response.headers, payload
+            except (http.client.HTTPException, ConnectionError):
+                # The server closed an idle keep-alive connection; reconnect once
+                connection.close()
+                self._local.connection = None
+                if attempt:
+                    raise
+
+
+class Recorder:
+    """Collects latencies and errors per endpoint from all virtual users."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.visits = 0
+        self.failed_visits = 0
+        self.start = None
+        self.end = None
+
+    def record(self, endpoint, seconds, ok):
+        with self._lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def visit_done(self, ok):
+        with self._lock:
+            self.visits += 1
+            if not ok:
+                self.failed_visits += 1
+
+    def report(self):
+        """
+        Summarize the run.
+
+        Returns:
+            dict: Overall counts and, per endpoint, request count, error rate,
+            throughput and latency percentiles in milliseconds.
+        """
+        elapsed = (self.end or time.monotonic()) - self.start
+        endpoints = {}
+        for endpoint, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+            endpoints[endpoint] = {
+                'requests': len(ordered),
+                'errors': self.errors[endpoint],
+                'error_rate': self.errors[endpoint] / len(ordered),
+                'throughput': len(ordered) / elapsed,
+                **{f'p{p}': percentile(ordered, p) * 1000 for p in (50, 90, 95, 99)},
+                'max': ordered[-1] * 1000,
+            }
+        return {
+            'elapsed': elapsed,
+            'visits': self.visits,
+            'failed_visits': self.failed_visits,
+            'requests': sum(stats['requests'] for stats in endpoints.values()),
+            'endpoints': endpoints,
+        }
+
+
+def percentile(ordered, p):
+    """Return the nearest-rank percentile ``p`` of a sorted, non-empty list."""
+    index = max(0, min(len(ordered) - 1, int(round(p / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def parse_mix(text):
+    """
+    Parse a questionnaire mix such as ``koos=3,hoos=1``.
+
+    Returns:
+        tuple: ``(slugs, weights)`` for ``random.choices``.
+    """
+    slugs, weights = [], []
+    for item in text.split(','):
+        slug, _, weight = item.partition('=')
+        slugs.append(slug.strip())
+        weights.append(float(weight or 1))
+    return slugs, weights
+
+
+def random_answers(form_html, rng):
+    """Pick one value for every radio group in a questionnaire form."""
+    options = defaultdict(list)
+    for name, value in _RADIO_RE.findall(form_html):
+        options[name.decode()].append(value.decode())
+    return {name: rng.choice(values) for name, values in options.items()}
+
+
+class VirtualPhysio:
+    """
+    Runs clinic visits back to back until the deadline.
+
+    Args:
+        client: ``InProcessClient`` or ``HTTPClient``.
+        recorder (Recorder): Shared statistics.
+        mix (tuple): ``(slugs, weights)`` of questionnaires to generate.
+        think (float): Mean patient think time in seconds before submitting.
+        poll_interval (float): Seconds between ``wait_for_result`` polls.
+        max_polls (int): Give up on a visit after this many polls.
+        seed (int): Seed of this user's random generator.
+    """
+
+    def __init__(self, client, recorder, mix, think, poll_interval, max_polls, seed):
+        self.client = client
+        self.recorder = recorder
+        self.mix = mix
+        self.think = think
+        self.poll_interval = poll_interval
+        self.max_polls = max_polls
+        self.rng = random.Random(seed)
+
+    def call(self, endpoint, method, path, data=None, expect=(200,)):
+        start = time.perf_counter()
+        try:
+            status, headers, body = self.client.request(method, path, data)
+        except Exception:
+            self.recorder.record(endpoint, time.perf_counter() - start, False)
+            raise
+        ok = status in expect
+        self.recorder.record(endpoint, time.perf_counter() - start, ok)
+        if not ok:
+            raise RuntimeError(f'{method} {path} returned {status}')
+        return headers, body
+
+    def pause(self, mean):
+        if mean > 0:
+            time.sleep(self.rng.expovariate(1 / mean))
+
+    def visit(self):
+        slug = self.rng.choices(*self.mix)[0]
+        headers, _ = self.call('generate_qr', 'GET', f'/generate_qr?evaluation_form={slug}', expect=(302,))
+        wait_path = urlsplit(headers['Location']).path
+        session_id = wait_path.split('/')[2]
+        _, wait_html = self.call('wait_for_result', 'GET', wait_path)
+        self.call('qr_code', 'GET', f'/qr/{session_id}.svg')
+
+        form_path = patient_form_path(wait_html)
+        _, form_html = self.call('patient_form GET', 'GET', form_path)
+        self.pause(self.think)
+        self.call('patient_form POST', 'POST', form_path, random_answers(form_html, self.rng), expect=(302,))
+
+        for _ in range(self.max_polls):
+            _, body = self.call('wait_for_result', 'GET', wait_path)
+            if _WAITING_MARKER not in body:
+                return
+            self.pause(self.poll_interval)
+        raise RuntimeError(f'No result for session {session_id}')
+
+    def run(self, deadline, max_visits=None):
+        done = 0
+        while time.monotonic() < deadline and (max_visits is None or done < max_visits):
+            try:
+                self.visit()
+                self.recorder.visit_done(True)
+            except Exception:
+                self.recorder.visit_done(False)
+            done += 1
+
+
+def run_load(client, users=10, ramp_up=0.0, duration=30.0, mix=(('koos', 'hoos'), (1, 1)), think=5.0,
+             poll_interval=2.0, max_polls=60, visits=None, seed=0):
+    """
+    Drive ``client`` with ``users`` concurrent virtual physios.
+
+    Users start evenly spread over ``ramp_up`` seconds and stop starting new
+    visits after ``duration`` seconds (or after ``visits`` visits each).
+
+    Returns:
+        dict: The report from ``Recorder.report``.
+    """
+    recorder = Recorder()
+    recorder.start = time.monotonic()
+    deadline = recorder.start + duration
+    threads = []
+    for index in range(users):
+        physio = VirtualPhysio(client, recorder, mix, think, poll_interval, max_polls, seed + index)
+        thread = threading.Thread(target=physio.run, args=(deadline, visits), name=f'physio-{index}', daemon=True)
+        threads.append(thread)
+        thread.start()
+        if ramp_up and index < users - 1:
+            time.sleep(ramp_up / users)
+    for thread in threads:
+        thread.join()
+    recorder.end = time.monotonic()
+    return recorder.report()
+
+
+def format_report(report):
+    """Format a load report as a table."""
+    lines = [
+        f"{report['visits']} visits ({report['failed_visits']} failed), "
+        f"{report['requests']} requests in {report['elapsed']:.1f}s "
+        f"({report['requests'] / report['elapsed']:.1f} req/s)",
+        f"{'endpoint':<20} {'requests':>9} {'errors':>7} {'req/s':>8} "
+        f"{'p50 ms':>8} {'p90 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+    ]
+    for endpoint, stats in report['endpoints'].items():
+        lines.append(
+            f"{endpoint:<20} {stats['requests']:>9} {stats['error_rate']:>7.1%} {stats['throughput']:>8.1f} "
+            f"{stats['p50']:>8.1f} {stats['p90']:>8.1f} {stats['p95']:>8.1f} {stats['p99']:>8.1f} {stats['max']:>8.1f}")
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.loadgen', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='Base URL of a running instance. Defaults to the app in-process.')
+    parser.add_argument('--insecure', action='store_true', help='Do not verify HTTPS certificates.')
+    parser.add_argument('--users', type=int, default=10, help='Concurrent virtual physios.')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='Seconds over which users are started.')
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds during which new visits start.')
+    parser.add_argument('--visits', type=int, help='Stop each user after this many visits.')
+    parser.add_argument('--mix', default='koos=1,hoos=1', help='Questionnaire weights, e.g. koos=3,hoos=1.')
+    parser.add_argument('--think', type=float, default=5.0, help='Mean patient think time in seconds.')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between result polls.')
+    parser.add_argument('--max-polls', type=int, default=60, help='Polls before a visit counts as failed.')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed.')
+    parser.add_argument('--json', metavar='PATH', help='Also write the report as JSON.')
+    args = parser.parse_args(argv)
+
+    with contextlib.ExitStack() as stack:
+        if args.url:
+            client = HTTPClient(args.url, args.insecure)
+        else:
+            client = InProcessClient(stack.enter_context(benchmark_app()))
+        report = run_load(client, users=args.users, ramp_up=args.ramp_up, duration=args.duration,
+                          mix=parse_mix(args.mix), think=args.think, poll_interval=args.poll_interval,
+                          max_polls=args.max_polls, visits=args.visits, seed=args.seed)
+    print(format_report(report))
+    if args.json:
+        with open(args.json, 'w') as file:
+            json.dump(report, file, indent=2)
+    return 1 if report['failed_visits'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
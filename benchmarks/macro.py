@@ -0,0 +1,46 @@
+"""
+End-to-end benchmarks of the clinic flow through the Flask test client.
+"""
+
+import random
+
+from benchmarks.env import BASE_URL, form_data, patient_form_path, random_responses
+from benchmarks.harness import benchmark
+
+
+def _clinic_flow(app, slug):
+    from app.utils.questionnaire_registry import get_registry
+
+    client = app.test_client()
+    rng = random.Random(slug)
+    questionnaire = get_registry(app).get(slug)
+
+    def run():
+        response = client.get(f'/generate_qr?evaluation_form={slug}', base_url=BASE_URL)
+        wait_url = response.location
+        form_url = patient_form_path(client.get(wait_url, base_url=BASE_URL).data)
+        client.get(form_url, base_url=BASE_URL)
+        client.post(form_url, data=form_data(random_responses(questionnaire, rng)), base_url=BASE_URL)
+        response = client.get(wait_url, base_url=BASE_URL)
+        assert response.status_code == 200, response.status_code
+    return run, 1
+
+
+@benchmark('flow_koos', 'macro')
+def flow_koos(app):
+    return _clinic_flow(app, 'koos')
+
+
+@benchmark('flow_hoos', 'macro')
+def flow_hoos(app):
+    return _clinic_flow(app, 'hoos')
+
+
+@benchmark('wait_for_result_poll', 'macro')
+def wait_for_result_poll(app):
+    client = app.test_client()
+    wait_url = client.get('/generate_qr?evaluation_form=koos', base_url=BASE_URL).location
+
+    def run():
+        client.get(wait_url, base_url=BASE_URL)
+    return run, 1
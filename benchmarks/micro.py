@@ -0,0 +1,154 @@
+"""
+Microbenchmarks of the individual building blocks of a clinic visit.
+"""
+
+import io
+import random
+import time
+
+from flask import render_template
+
+from benchmarks.env import random_responses
+from benchmarks.harness import benchmark
+
+BATCH_SIZE = 100
+
+
+def _scoring(app, slug, batch):
+    from app.utils import calculate_koos_scores, calculate_hoos_scores
+    from app.utils.questionnaire_registry import get_registry
+
+    calculate = {'koos': calculate_koos_scores, 'hoos': calculate_hoos_scores}[slug]
+    rng = random.Random(slug)
+    questionnaire = get_registry(app).get(slug)
+    responses = [random_responses(questionnaire, rng) for _ in range(batch)]
+
+    def run():
+        with app.app_context():
+            for item in responses:
+                calculate(item)
+    return run, batch
+
+
+@benchmark('score_koos_single', 'micro')
+def score_koos_single(app):
+    return _scoring(app, 'koos', 1)
+
+
+@benchmark('score_koos_batch', 'micro')
+def score_koos_batch(app):
+    return _scoring(app, 'koos', BATCH_SIZE)
+
+
+@benchmark('score_hoos_single', 'micro')
+def score_hoos_single(app):
+    return _scoring(app, 'hoos', 1)
+
+
+@benchmark('score_hoos_batch', 'micro')
+def score_hoos_batch(app):
+    return _scoring(app, 'hoos', BATCH_SIZE)
+
+
+@benchmark('score_koos_numpy_batch', 'micro')
+def score_koos_numpy_batch(app):
+    from app.utils.questionnaire_registry import get_registry
+    from app.utils.scoring import get_plan
+
+    plan = get_plan('koos')
+    rng = random.Random('koos')
+    questionnaire = get_registry(app).get('koos')
+    matrix = plan.to_matrix(random_responses(questionnaire, rng) for _ in range(BATCH_SIZE * 10))
+
+    def run():
+        plan.score_batch(matrix)
+    return run, BATCH_SIZE * 10
+
+
+@benchmark('load_questionnaire_data', 'micro')
+def load_questionnaire(app):
+    from app.routes.main import load_questionnaire_data
+
+    def run():
+        with app.app_context():
+            load_questionnaire_data('koos', 'swedish')
+            load_questionnaire_data('hoos', 'swedish')
+    return run, 2
+
+
+def _render(app, slug):
+    from app.questionnaires_config import QUESTIONNAIRES
+    from app.routes.main import load_questionnaire_data
+
+    def run():
+        with app.test_request_context(base_url='https://localhost'):
+            data = load_questionnaire_data(slug, 'swedish')
+            render_template(
+                f'questionnaires/{slug}/{slug}_swe.html',
+                questionnaire_slug=slug,
+                questionnaire_title=QUESTIONNAIRES[slug]['name'],
+                instructions=data['instructions'],
+                sections=data['sections'],
+                evaluation_form=slug,
+                form_action='/f/benchmark',
+            )
+    return run, 1
+
+
+@benchmark('render_koos_swe', 'micro')
+def render_koos(app):
+    return _render(app, 'koos')
+
+
+@benchmark('render_hoos_swe', 'micro')
+def render_hoos(app):
+    return _render(app, 'hoos')
+
+
+_QR_URL = ('https://www.physioengine.com/f/'
+           'WyJQNksxeEIwZVQyQ0ttd3dkTGo5S1d3Iiwia29vcyIsInN3ZWRpc2giLCIiLDE3MDAwNDMyMDBd.benchmarksignature0000000000')
+
+
+@benchmark('qrcode_pil_png', 'micro')
+def qrcode_pil_png(app):
+    import qrcode
+
+    def run():
+        qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        qr.add_data(_QR_URL)
+        qr.make(fit=True)
+        qr.make_image(fill='black', back_color='white').save(io.BytesIO(), 'PNG')
+    return run, 1
+
+
+def _qr_renderer(fmt):
+    from app.utils.qr import QRRenderer
+
+    def run():
+        # A fresh renderer measures encoding rather than the LRU cache
+        QRRenderer().render(_QR_URL, fmt)
+    return run, 1
+
+
+@benchmark('qr_render_png', 'micro')
+def qr_render_png(app):
+    return _qr_renderer('png')
+
+
+@benchmark('qr_render_svg', 'micro')
+def qr_render_svg(app):
+    return _qr_renderer('svg')
+
+
+@benchmark('page_cache_koos_gzip', 'micro')
+def page_cache_koos_gzip(app):
+    from app.utils.session_tokens import get_session_tokens
+
+    client = app.test_client()
+    token = get_session_tokens(app).mint('3fa2b5c4-1d2e-4f60-8a9b-0c1d2e3f4a5b', 'koos', time.time() + 3600)
+    url = f'/f/{token}'
+    client.get(url, base_url='https://localhost')
+
+    def run():
+        client.get(url, base_url='https://localhost', headers={'Accept-Encoding': 'gzip'})
+    return run, 1
@@ -0,0 +1,422 @@
+"""
+Replay captured production traffic against the app in-process.
+
+Set ``TRAFFIC_CAPTURE_ENABLED=1`` on an instance to record a redacted trace
+(see ``app/utils/traffic_capture.py``), copy the JSONL file and replay it
+against each build you want to compare::
+
+    python -m benchmarks.replay run traffic.jsonl --speed 10 --save before
+    git checkout my-branch
+    python -m benchmarks.replay run traffic.jsonl --speed 10 --save after
+    python -m benchmarks.replay compare before after
+
+``--speed`` divides the original inter-arrival times (1 keeps them, 0 sends
+every request as soon as a thread is free). Requests start on schedule on a
+pool of ``--concurrency`` threads, whether or not earlier ones have
+finished, except that the requests of one session are sent in order.
+
+Sessions are followed through their pseudonyms. A captured ``generate_qr``
+creates a real session whose ID and token replace the pseudonym in later
+requests, and sessions whose creation is not in the trace are created
+before their first request (untimed). Patient form submissions send valid
+random answers for the captured question fields. Other redacted values are
+replaced by placeholders, so such requests (e.g. for a report ID) fail the
+same way in every build.
+
+``compare`` reports per endpoint the p50 / p90 / p99 latency change, the
+error rate (status 500 and above) of both runs and the Kolmogorov-Smirnov
+distance between the latency distributions, and exits with status 1 if an
+endpoint got slower than ``--threshold`` at p50 or p90 or its error rate
+rose.
+"""
+
+import argparse
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from benchmarks.env import BASE_URL, benchmark_app, form_data, random_responses
+from benchmarks.harness import environment, load_results, save_results
+from benchmarks.loadgen import percentile
+
+_RULE_ARG_RE = re.compile(r'<(?:[^<>]*:)?(\w+)>')
+
+# Placeholders for redacted values
+SHAPES = {'int': '1', 'str': 'x'}
+
+# Endpoints compared with fewer requests than this are not flagged
+MIN_REQUESTS = 20
+
+
+def load_trace(path, limit=None):
+    """
+    Read a captured trace, ordered by arrival time.
+
+    Args:
+        path (str): JSONL file written by the traffic capture.
+        limit (int, optional): Only the first N requests.
+
+    Returns:
+        list: The records; malformed lines are skipped.
+    """
+    records = []
+    with open(path) as file:
+        for line in file:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(record, dict) and {'t', 'm', 'e', 'p'} <= record.keys():
+                records.append(record)
+    records.sort(key=lambda record: record['t'])
+    return records[:limit] if limit else records
+
+
+class Replayer:
+    """
+    Re-issues captured requests against an app through Flask test clients.
+
+    Args:
+        app (Flask): The build under test.
+        speed (float): Divisor of the captured inter-arrival times; 0 sends
+            requests without waiting.
+        concurrency (int): Threads sending requests.
+    """
+
+    def __init__(self, app, speed=1.0, concurrency=32):
+        self.app = app
+        self.speed = speed
+        self.concurrency = concurrency
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(Counter)
+        self.lag = []
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _client(self):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+            self._local.rng = random.Random()
+        return client
+
+    def _session(self, pseudonym, questionnaire):
+        """Return ``(session_id, token)`` for a pseudonym, creating the session if needed."""
+        with self._lock:
+            known = self._sessions.get(pseudonym)
+        if known is not None or questionnaire is None:
+            return known or (None, None)
+        from app.routes.main import create_sessions
+        with self.app.test_request_context(base_url=BASE_URL):
+            session_id, _ = create_sessions([questionnaire])[0]
+        return self._adopt(pseudonym, session_id)
+
+    def _adopt(self, pseudonym, session_id):
+        from app.routes.main import session_token
+        from app.utils.result_store import get_store, session_key
+        with self.app.app_context():
+            session = get_store().get(session_key(session_id))
+            token = session_token(session_id, session) if session else None
+        with self._lock:
+            self._sessions[pseudonym] = (session_id, token)
+        return session_id, token
+
+    def build(self, record):
+        """
+        Turn a captured record into request arguments for the test client.
+
+        Returns:
+            dict: ``path``, ``method``, ``query_string``, ``data`` and ``headers``.
+        """
+        session_id = token = None
+        if record.get('s') and record['e'] != 'main.generate_qr':
+            session_id, token = self._session(record['s'], record.get('q'))
+
+        view_args = record.get('v', {})
+
+        def fill(match):
+            name = match.group(1)
+            value = view_args.get(name, 'x')
+            if name == 'session_id' and session_id:
+                return session_id
+            if name == 'token' and token:
+                return token
+            return value.lstrip('~')
+
+        path = _RULE_ARG_RE.sub(fill, record['p'])
+        query = {name: SHAPES.get(value, value) for name, value in record.get('a', {}).items()}
+        data = None
+        fields = record.get('f') or {}
+        if record['m'] == 'POST' and fields:
+            data = {name: SHAPES.get(shape, 'x') for name, shape in fields.items()}
+            questionnaire = self._questionnaire(record.get('q'))
+            if questionnaire is not None:
+                answers = form_data(random_responses(questionnaire, self._local.rng))
+                data.update({name: value for name, value in answers.items() if name in fields})
+        headers = {}
+        if 'gzip' in record.get('h', ()):
+            headers['Accept-Encoding'] = 'gzip'
+        if 'idem' in record.get('h', ()):
+            headers['Idempotency-Key'] = str(uuid.uuid4())
+        return {'path': path, 'method': record['m'], 'query_string': query, 'data': data, 'headers': headers}
+
+    def _questionnaire(self, slug):
+        if not slug:
+            return None
+        from app.utils.questionnaire_registry import get_registry
+        try:
+            return get_registry(self.app).get(slug)
+        except Exception:
+            return None
+
+    def send(self, record):
+        """Send one captured request and record its latency and status."""
+        client = self._client()
+        request = self.build(record)
+        start = time.perf_counter()
+        response = client.open(base_url=BASE_URL, buffered=False, **request)
+        try:
+            # Event streams stay open for up to a minute; time them to the headers
+            if response.mimetype != 'text/event-stream':
+                response.get_data()
+            elapsed = time.perf_counter() - start
+        finally:
+            response.close()
+        label = f"{record['m']} {record['e']}"
+        with self._lock:
+            self.latencies[label].append(elapsed)
+            self.statuses[label][response.status_code] += 1
+        if record.get('s') and record['e'] == 'main.generate_qr' and response.location:
+            self._follow_redirect(record['s'], response.location)
+
+    def _follow_redirect(self, pseudonym, location):
+        try:
+            _, target_args = self.app.url_map.bind('').match(urlsplit(location).path)
+        except Exception:
+            return
+        if 'session_id' in target_args:
+            self._adopt(pseudonym, target_args['session_id'])
+
+    def _send_after(self, previous, record):
+        if previous is not None:
+            previous.exception()
+        try:
+            self.send(record)
+        except Exception:
+            label = f"{record['m']} {record['e']}"
+            with self._lock:
+                self.latencies[label].append(0.0)
+                self.statuses[label]['exception'] += 1
+
+    def run(self, records):
+        """
+        Replay ``records`` on schedule.
+
+        Returns:
+            dict: The report from ``report``.
+        """
+        if not records:
+            return self.report(0.0, 0)
+        last = {}
+        first = records[0]['t']
+        start = time.monotonic()
+        with ThreadPoolExecutor(self.concurrency, thread_name_prefix='replay') as pool:
+            for record in records:
+                if self.speed > 0:
+                    due = start + (record['t'] - first) / self.speed
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    self.lag.append(max(time.monotonic() - due, 0.0))
+                session = record.get('s')
+                future = pool.submit(self._send_after, last.get(session) if session else None, record)
+                if session:
+                    last[session] = future
+        return self.report(time.monotonic() - start, records[-1]['t'] - first)
+
+    def report(self, elapsed, captured):
+        """
+        Summarize the replay.
+
+        Args:
+            elapsed (float): Seconds the replay took.
+            captured (float): Seconds the trace covers.
+
+        Returns:
+            dict: Per endpoint request count, error rate, latency percentiles
+            and the sorted latencies in milliseconds, plus the schedule lag.
+        """
+        endpoints = {}
+        for label, values in sorted(self.latencies.items()):
+            ordered = sorted(values)
+            statuses = self.statuses[label]
+            errors = sum(count for status, count in statuses.items() if status == 'exception' or status >= 500)
+            endpoints[label] = {
+                'requests': len(ordered),
+                'errors': errors,
+                'error_rate': errors / len(ordered),
+                'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+                **{f'p{p}': percentile(ordered, p) * 1000 for p in (50, 90, 99)},
+                'max': ordered[-1] * 1000,
+                'latencies': [round(value * 1000, 3) for value in ordered],
+            }
+        lag = sorted(self.lag)
+        return {
+            'environment': environment(),
+            'speed': self.speed,
+            'elapsed': elapsed,
+            'captured': captured,
+            'requests': sum(stats['requests'] for stats in endpoints.values()),
+            'lag_p99': percentile(lag, 99) * 1000 if lag else 0.0,
+            'endpoints': endpoints,
+        }
+
+
+def ks_distance(a, b):
+    """Return the Kolmogorov-Smirnov statistic of two sorted samples."""
+    i = j = 0
+    distance = 0.0
+    while i < len(a) and j < len(b):
+        value = min(a[i], b[j])
+        while i < len(a) and a[i] == value:
+            i += 1
+        while j < len(b) and b[j] == value:
+            j += 1
+        distance = max(distance, abs(i / len(a) - j / len(b)))
+    return distance
+
+
+def compare_replays(baseline, current, threshold):
+    """
+    Compare two replays of the same trace endpoint by endpoint.
+
+    An endpoint regresses if its p50 or p90 latency grew by more than
+    ``threshold`` or its error rate rose by more than one percentage point.
+    Endpoints with fewer than MIN_REQUESTS requests in either run are shown
+    but never flagged.
+
+    Args:
+        baseline (dict): The reference replay.
+        current (dict): The replay to check.
+        threshold (float): Allowed relative slowdown, e.g. 0.25 for 25 %.
+
+    Returns:
+        list: One dict per endpoint present in both runs.
+    """
+    rows = []
+    for label, stats in sorted(current['endpoints'].items()):
+        reference = baseline['endpoints'].get(label)
+        if reference is None:
+            continue
+        changes = {f'p{p}': stats[f'p{p}'] / reference[f'p{p}'] - 1 if reference[f'p{p}'] else 0.0
+                   for p in (50, 90, 99)}
+        distance = ks_distance(reference['latencies'], stats['latencies'])
+        n, m = reference['requests'], stats['requests']
+        # Critical value of the two-sample test at alpha = 0.01
+        critical = 1.628 * math.sqrt((n + m) / (n * m))
+        enough = min(n, m) >= MIN_REQUESTS
+        regressed = enough and (changes['p50'] > threshold or changes['p90'] > threshold
+                                or stats['error_rate'] - reference['error_rate'] > 0.01)
+        rows.append({
+            'endpoint': label, 'requests': (n, m), 'changes': changes,
+            'p50': (reference['p50'], stats['p50']), 'p90': (reference['p90'], stats['p90']),
+            'error_rate': (reference['error_rate'], stats['error_rate']),
+            'ks': distance, 'shifted': enough and distance > critical, 'regressed': regressed,
+        })
+    return rows
+
+
+def format_report(report):
+    """Format a replay report as a table."""
+    lines = [
+        f"{report['requests']} requests in {report['elapsed']:.1f}s "
+        f"(trace covers {report['captured']:.1f}s, speed {report['speed']:g}, "
+        f"p99 schedule lag {report['lag_p99']:.1f} ms)",
+        f"{'endpoint':<36} {'requests':>9} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}",
+    ]
+    for label, stats in report['endpoints'].items():
+        lines.append(f"{label:<36} {stats['requests']:>9} {stats['error_rate']:>7.1%} {stats['p50']:>8.1f} "
+                     f"{stats['p90']:>8.1f} {stats['p99']:>8.1f} {stats['max']:>8.1f}")
+    return '\n'.join(lines)
+
+
+def format_comparison(rows, threshold):
+    """Format the output of ``compare_replays`` as a text table."""
+    lines = [f"{'endpoint':<36} {'requests':>13} {'p50 ms':>15} {'p50':>8} {'p90':>8} {'p99':>8} "
+             f"{'errors':>15} {'KS':>6}"]
+    for row in rows:
+        flags = ('  SHIFTED' if row['shifted'] else '') + ('  REGRESSION' if row['regressed'] else '')
+        lines.append(
+            f"{row['endpoint']:<36} {row['requests'][0]:>6}/{row['requests'][1]:<6} "
+            f"{row['p50'][0]:>7.1f}/{row['p50'][1]:<7.1f} "
+            f"{row['changes']['p50']:>+8.1%} {row['changes']['p90']:>+8.1%} {row['changes']['p99']:>+8.1%} "
+            f"{row['error_rate'][0]:>7.1%}/{row['error_rate'][1]:<7.1%} {row['ks']:>6.2f}{flags}")
+    lines.append(f"threshold: +{threshold:.0%} at p50 or p90, +1 point error rate")
+    return '\n'.join(lines)
+
+
+def replay(trace, speed, concurrency, limit=None):
+    """Replay a trace file against a fresh in-process app."""
+    records = load_trace(trace, limit)
+    print(f'Replaying {len(records)} requests from {trace}', file=sys.stderr)
+    with benchmark_app() as app:
+        return Replayer(app, speed, concurrency).run(records)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.replay', description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    def add_replay_options(subparser):
+        subparser.add_argument('--speed', type=float, default=1.0,
+                               help='Divide inter-arrival times by this factor; 0 sends without waiting.')
+        subparser.add_argument('--concurrency', type=int, default=32, help='Threads sending requests.')
+        subparser.add_argument('--limit', type=int, help='Only replay the first N requests.')
+
+    run_parser = subparsers.add_parser('run', help='Replay a trace and print per-endpoint latencies.')
+    run_parser.add_argument('trace', help='JSONL trace written by the traffic capture.')
+    add_replay_options(run_parser)
+    run_parser.add_argument('--save', metavar='NAME', help='Store the replay as a JSON baseline.')
+
+    compare_parser = subparsers.add_parser(
+        'compare', help='Compare two replays; exits with status 1 on a regression.')
+    compare_parser.add_argument('baseline', help='Baseline name or JSON path.')
+    compare_parser.add_argument('current', nargs='?', help='Stored replay to check instead of replaying now.')
+    compare_parser.add_argument('--trace', help='Trace to replay now if no current replay is given.')
+    compare_parser.add_argument('--threshold', type=float, default=0.25,
+                                help='Allowed relative slowdown (default 0.25 = 25%%).')
+    add_replay_options(compare_parser)
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'run':
+        report = replay(args.trace, args.speed, args.concurrency, args.limit)
+        print(format_report(report))
+        if args.save:
+            print(f'Saved {save_results(report, args.save)}')
+        return 0
+
+    baseline = load_results(args.baseline)
+    if args.current:
+        current = load_results(args.current)
+    elif args.trace:
+        current = replay(args.trace, args.speed, args.concurrency, args.limit)
+    else:
+        parser.error('compare needs a current replay or --trace')
+    rows = compare_replays(baseline, current, args.threshold)
+    print(format_comparison(rows, args.threshold))
+    return 1 if any(row['regressed'] for row in rows) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -7,6 +7,7 @@ environment-specific settings.
 """
 
 import os
+import tempfile
 from dotenv import load_dotenv
 
 # Load environment variables from a .env file
@@ -33,6 +34,213 @@ class Config:
     FORCE_HTTPS = os.environ.get('FORCE_HTTPS', 'true').lower() == 'true'
     DEBUG = os.environ.get('FLASK_DEBUG', '0') == '1'
     LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO')
+    # 'json' for one JSON object per line, 'text' for the classic format
+    LOG_FORMAT = os.environ.get('LOG_FORMAT', 'json')
+    LOG_FILE = os.environ.get('LOG_FILE', os.path.join('logs', 'physioengine.log'))
+    LOG_FILE_MAX_BYTES = int(os.environ.get('LOG_FILE_MAX_BYTES', 5 * 1024 * 1024))
+    LOG_FILE_BACKUP_COUNT = int(os.environ.get('LOG_FILE_BACKUP_COUNT', 10))
+    # Fraction of requests per endpoint whose headers and form field names are
+    # logged; 'default' applies to endpoints not listed. Form values are never logged.
+    LOG_REQUEST_SAMPLE_RATES = {
+        'default': float(os.environ.get('LOG_REQUEST_SAMPLE_RATE', '0')),
+        'main.patient_form': 0.01,
+        'user.fill_questionnaire': 0.01,
+    }
+
+    # Questionnaire registry: data files are compiled once at startup and
+    # reloaded when their mtime changes (checked at most every N seconds, 0 disables)
+    # or when the worker receives SIGHUP
+    QUESTIONNAIRE_DATA_DIR = os.environ.get('QUESTIONNAIRE_DATA_DIR', 'data')
+    QUESTIONNAIRE_RELOAD_INTERVAL = float(os.environ.get('QUESTIONNAIRE_RELOAD_INTERVAL', '5'))
+
+    # Storage for sessions and submitted responses, shared by all workers.
+    # memory:// (single process), sqlite:///path (one host) or redis://host:port/db
+    RESULT_STORE_URL = (os.environ.get('RESULT_STORE_URL') or os.environ.get('REDIS_URL')
+                        or 'sqlite:///results/sessions.sqlite3')
+    # Seconds before an unfinished session and its responses expire
+    SESSION_TTL = int(os.environ.get('SESSION_TTL', 12 * 60 * 60))
+    # Signs the patient form tokens (/f/<token>); changing it invalidates open links
+    SESSION_TOKEN_KEY = os.environ.get('SESSION_TOKEN_KEY') or SECRET_KEY
+    # Verified tokens cached per worker
+    SESSION_TOKEN_CACHE_SIZE = int(os.environ.get('SESSION_TOKEN_CACHE_SIZE', 4096))
+
+    # Append-only archive of scored submissions with running aggregates.
+    # Patient identifiers are replaced by an HMAC keyed with ARCHIVE_PSEUDONYM_KEY.
+    # Identifiers such as personnummer have few enough values to brute-force
+    # the HMAC, so the key must be a dedicated secret; without it patient
+    # identifiers are rejected instead of falling back to SECRET_KEY.
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', os.path.join('results', 'archive'))
+    ARCHIVE_PSEUDONYM_KEY = os.environ.get('ARCHIVE_PSEUDONYM_KEY')
+    ARCHIVE_JOURNAL_MAX_RECORDS = int(os.environ.get('ARCHIVE_JOURNAL_MAX_RECORDS', 1000))
+    ARCHIVE_MAX_SEGMENTS = int(os.environ.get('ARCHIVE_MAX_SEGMENTS', 16))
+    # Bearer token for the /physio/outcomes endpoints; they are disabled without one
+    ARCHIVE_EXPORT_TOKEN = os.environ.get('ARCHIVE_EXPORT_TOKEN')
+
+    # PDF reports of shown results, rendered by REPORT_WORKERS spawned processes
+    # per worker and kept in REPORT_DIR and a per-worker LRU cache for REPORT_TTL seconds
+    REPORTS_ENABLED = os.environ.get('REPORTS_ENABLED', '1') == '1'
+    REPORT_DIR = os.environ.get('REPORT_DIR', os.path.join('results', 'reports'))
+    REPORT_WORKERS = int(os.environ.get('REPORT_WORKERS', 1))
+    REPORT_CACHE_SIZE = int(os.environ.get('REPORT_CACHE_SIZE', 32))
+    REPORT_TTL = int(os.environ.get('REPORT_TTL', 60 * 60))
+    REPORT_TIMEOUT = int(os.environ.get('REPORT_TIMEOUT', 60))
+
+    # JSON scoring API under /api/v1, disabled without API_TOKEN. Limits apply
+    # to NDJSON batches posted to /api/v1/submissions.
+    API_TOKEN = os.environ.get('API_TOKEN')
+    API_MAX_BATCH = int(os.environ.get('API_MAX_BATCH', 10000))
+    API_MAX_LINE_BYTES = int(os.environ.get('API_MAX_LINE_BYTES', 64 * 1024))
+
+    # Metrics: each worker writes snapshots to METRICS_DIR at most every
+    # METRICS_FLUSH_INTERVAL seconds and /metrics merges them. /metrics only
+    # exists if METRICS_TOKEN is set; the scraper must send
+    # 'Authorization: Bearer <token>'.
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'physioengine_metrics'))
+    METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', '5'))
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Profiling endpoints under /_profile (see app/utils/profiling.py). They are
+    # only registered if PROFILING_TOKEN is set, and then require
+    # 'Authorization: Bearer <token>'. Profiles are capped at
+    # PROFILING_MAX_SECONDS and PROFILING_MAX_REQUESTS.
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_SAMPLE_INTERVAL = float(os.environ.get('PROFILING_SAMPLE_INTERVAL', '0.005'))
+    PROFILING_MAX_SECONDS = float(os.environ.get('PROFILING_MAX_SECONDS', '60'))
+    PROFILING_MAX_REQUESTS = int(os.environ.get('PROFILING_MAX_REQUESTS', 1000))
+
+    # Traffic capture for `python -m benchmarks.replay`: redacted requests are
+    # appended to TRAFFIC_CAPTURE_PATH as JSON lines. Identifiers are replaced by
+    # an HMAC keyed with TRAFFIC_CAPTURE_KEY; only the query arguments listed in
+    # TRAFFIC_CAPTURE_KEEP_ARGS (and questionnaire slugs) keep their values.
+    TRAFFIC_CAPTURE_ENABLED = os.environ.get('TRAFFIC_CAPTURE_ENABLED', '0') == '1'
+    TRAFFIC_CAPTURE_PATH = os.environ.get('TRAFFIC_CAPTURE_PATH', os.path.join('results', 'traffic.jsonl'))
+    TRAFFIC_CAPTURE_KEY = os.environ.get('TRAFFIC_CAPTURE_KEY') or SECRET_KEY
+    # Fraction of sessions (with all their requests) that is captured
+    TRAFFIC_CAPTURE_SAMPLE_RATE = float(os.environ.get('TRAFFIC_CAPTURE_SAMPLE_RATE', '1'))
+    TRAFFIC_CAPTURE_KEEP_ARGS = ['evaluation_form', 'questionnaire', 'format']
+    TRAFFIC_CAPTURE_BUFFER_SIZE = int(os.environ.get('TRAFFIC_CAPTURE_BUFFER_SIZE', 10000))
+    TRAFFIC_CAPTURE_FLUSH_INTERVAL = float(os.environ.get('TRAFFIC_CAPTURE_FLUSH_INTERVAL', 2))
+
+    # Janitor: seconds between background sweeps (0 disables the thread, use
+    # `flask sweep` from cron instead), age after which per-session files are
+    # deleted, and the directories holding such files
+    JANITOR_INTERVAL = float(os.environ.get('JANITOR_INTERVAL', 600))
+    JANITOR_LOCK_FILE = os.environ.get('JANITOR_LOCK_FILE', os.path.join('results', 'janitor.lock'))
+    ARTIFACT_TTL = int(os.environ.get('ARTIFACT_TTL', SESSION_TTL))
+    JANITOR_DIRECTORIES = [
+        os.path.join('app', 'static', 'qr_codes'),
+        'results',
+    ]
+
+    # Session funnel tracing: events are buffered in memory and written to
+    # FUNNEL_DB every FUNNEL_FLUSH_INTERVAL seconds. `flask funnel report` shows
+    # stage conversion and latencies, `flask funnel prune` drops old events
+    FUNNEL_ENABLED = os.environ.get('FUNNEL_ENABLED', '1') == '1'
+    FUNNEL_DB = os.environ.get('FUNNEL_DB', os.path.join('results', 'funnel.sqlite3'))
+    FUNNEL_BUFFER_SIZE = int(os.environ.get('FUNNEL_BUFFER_SIZE', 10000))
+    FUNNEL_FLUSH_INTERVAL = float(os.environ.get('FUNNEL_FLUSH_INTERVAL', 5))
+    FUNNEL_RETENTION_DAYS = float(os.environ.get('FUNNEL_RETENTION_DAYS', 90))
+
+    # QR codes: pixels per module, number of encoded images kept in memory and
+    # whether the waiting page embeds the code as a data URI instead of an <img> URL
+    QR_BOX_SIZE = int(os.environ.get('QR_BOX_SIZE', 10))
+    QR_CACHE_SIZE = int(os.environ.get('QR_CACHE_SIZE', 256))
+    QR_INLINE = os.environ.get('QR_INLINE', '0') == '1'
+    # Concurrent QR encodes per worker (0 disables the gate); requests that wait
+    # longer than QR_QUEUE_TIMEOUT seconds for a slot get 503 with Retry-After
+    QR_MAX_CONCURRENCY = int(os.environ.get('QR_MAX_CONCURRENCY', 2))
+    QR_QUEUE_TIMEOUT = float(os.environ.get('QR_QUEUE_TIMEOUT', '1'))
+    QR_RETRY_AFTER = int(os.environ.get('QR_RETRY_AFTER', 2))
+
+    # Printable QR sheets (/physio/qr_sheet): sessions per request and processes
+    # per worker that encode the codes
+    QR_SHEET_MAX_SESSIONS = int(os.environ.get('QR_SHEET_MAX_SESSIONS', 200))
+    QR_SHEET_WORKERS = int(os.environ.get('QR_SHEET_WORKERS', min(os.cpu_count() or 1, 4)))
+
+    # Token-bucket rate limits per client IP, shared by the workers on a host
+    # through a memory-mapped table. Keys are '[METHOD ]endpoint', values
+    # '<requests>/<second|minute|hour|day>' and the count is also the burst size.
+    # Clients over the limit get 429 with Retry-After.
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    RATE_LIMIT_FILE = os.environ.get('RATE_LIMIT_FILE') or os.path.join(tempfile.gettempdir(), 'physioengine_ratelimit')
+    RATE_LIMIT_SLOTS = int(os.environ.get('RATE_LIMIT_SLOTS', 8192))
+    # Requests for a patient session (patient_form, qr_code) are counted per
+    # session and client IP; the others per client IP, which a whole clinic
+    # behind one NAT address shares
+    RATE_LIMITS = {
+        'main.generate_qr': os.environ.get('RATE_LIMIT_GENERATE_QR', '300/minute'),
+        'main.qr_code': '120/minute',
+        'physio.qr_sheet': '10/hour',
+        'POST main.patient_form': os.environ.get('RATE_LIMIT_SUBMIT', '10/minute'),
+        'POST user.fill_questionnaire': os.environ.get('RATE_LIMIT_SELF_SUBMIT', '120/minute'),
+        'api.score': os.environ.get('RATE_LIMIT_API', '600/minute'),
+        'api.submissions': '30/minute',
+    }
+    # Number of proxies in front of the app that append to X-Forwarded-For
+    # (the Heroku router); the client IP used for rate limits is taken from there.
+    # Must match the deployment: with too few every client shares the proxy's
+    # address, with too many clients can pick their own address
+    PROXY_X_FOR = int(os.environ.get('PROXY_X_FOR', 1))
+
+    # Questionnaire pages are rendered once and served from memory, precompressed
+    PAGE_CACHE_ENABLED = os.environ.get('PAGE_CACHE_ENABLED', '1') == '1'
+    PAGE_CACHE_SIZE = int(os.environ.get('PAGE_CACHE_SIZE', 64))
+    PAGE_CACHE_COMPRESS_LEVEL = int(os.environ.get('PAGE_CACHE_COMPRESS_LEVEL', 9))
+    # Patient form pages differ per session, so their brotli variant is built on
+    # the session's first request (quality 5 takes about 2 ms for KOOS and is
+    # ~20% smaller than gzip -9) and the newest ones are kept per page
+    PAGE_CACHE_BROTLI_QUALITY = int(os.environ.get('PAGE_CACHE_BROTLI_QUALITY', 5))
+    PAGE_CACHE_BROTLI_SESSIONS = int(os.environ.get('PAGE_CACHE_BROTLI_SESSIONS', 256))
+    # Pages not served from the page cache are streamed section by section
+    # with incremental gzip, so the head and stylesheets load while the rest renders
+    TEMPLATE_STREAMING = os.environ.get('TEMPLATE_STREAMING', '1') == '1'
+    TEMPLATE_STREAM_CHUNK_SIZE = int(os.environ.get('TEMPLATE_STREAM_CHUNK_SIZE', 16 * 1024))
+    TEMPLATE_STREAM_COMPRESS_LEVEL = int(os.environ.get('TEMPLATE_STREAM_COMPRESS_LEVEL', 6))
+
+    # Static assets the questionnaire service worker (/sw.js) caches on the
+    # patient's phone so repeat visits and dropped connections need no network
+    OFFLINE_PRECACHE = [
+        'css/main.css',
+        'css/components.css',
+        'css/questionnaires.css',
+        'js/questionnaire.js',
+        'images/favicon.png',
+        'images/logo.png',
+    ]
+    # Bootstrap comes from its CDN; the pinned URLs are precached by the
+    # service worker too, or an offline questionnaire would render unstyled
+    BOOTSTRAP_CSS_URL = 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/css/bootstrap.min.css'
+    BOOTSTRAP_JS_URL = 'https://cdn.jsdelivr.net/npm/bootstrap@5.1.3/dist/js/bootstrap.bundle.min.js'
+    OFFLINE_PRECACHE_EXTERNAL = [BOOTSTRAP_CSS_URL, BOOTSTRAP_JS_URL]
+
+    # Fingerprinted static assets written by `flask assets build` into this
+    # folder below app/static; templates link them with asset_url()
+    ASSETS_BUILD_DIR = os.environ.get('ASSETS_BUILD_DIR', 'dist')
+    ASSETS_COMPRESS_LEVEL = int(os.environ.get('ASSETS_COMPRESS_LEVEL', 9))
+    # max-age of static files that are not fingerprinted
+    STATIC_MAX_AGE = int(os.environ.get('STATIC_MAX_AGE', 60))
+
+    # Compiled Jinja templates are cached on disk so new processes skip parsing them
+    TEMPLATE_CACHE_DIR = os.environ.get('TEMPLATE_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'physioengine_jinja')
+
+    # Server-sent events for waiting pages. Results saved by another worker are
+    # noticed within the poll interval; streams are closed before the Heroku
+    # router's 55 s idle timeout and the browser reconnects.
+    RESULT_EVENTS_POLL_INTERVAL = float(os.environ.get('RESULT_EVENTS_POLL_INTERVAL', '2'))
+    RESULT_EVENTS_KEEPALIVE_INTERVAL = float(os.environ.get('RESULT_EVENTS_KEEPALIVE_INTERVAL', '15'))
+    RESULT_EVENTS_MAX_DURATION = float(os.environ.get('RESULT_EVENTS_MAX_DURATION', '50'))
+    # Each open stream holds a gunicorn thread, so only this many streams are
+    # kept open per worker (default: half of GUNICORN_THREADS). Waiting pages
+    # over the limit get a one-shot check and reconnect after the fallback
+    # retry, i.e. they poll instead of holding a thread
+    RESULT_EVENTS_MAX_STREAMS = int(os.environ.get('RESULT_EVENTS_MAX_STREAMS',
+                                                   max(int(os.environ.get('GUNICORN_THREADS', 16)) // 2, 1)))
+    RESULT_EVENTS_FALLBACK_RETRY = float(os.environ.get('RESULT_EVENTS_FALLBACK_RETRY', '5'))
+
+    # Physio dashboard (/physio/dashboard): sessions remembered per browser, and
+    # seconds between the batched status requests while patients are answering
+    DASHBOARD_MAX_SESSIONS = int(os.environ.get('DASHBOARD_MAX_SESSIONS', 30))
+    DASHBOARD_POLL_INTERVAL = float(os.environ.get('DASHBOARD_POLL_INTERVAL', '3'))
 
     # Determine the BASE_URL
     # This motherfucker is the reason it doesn't work when scanning QR codes on a phone.
@@ -89,4 +297,9 @@ class Config:
             'data:',
             'https://www.physioengine.com',
         ],
+        # The service worker fetches OFFLINE_PRECACHE_EXTERNAL to precache it
+        'connect-src': [
+            "'self'",
+            'https://cdn.jsdelivr.net',
+        ],
     }
@@ -0,0 +1,56 @@
+"""
+Gunicorn settings for PhysioEngine.
+
+The application is loaded and warmed up once in the master (``preload_app``)
+and workers are forked from it, so questionnaire data, compiled templates,
+rendered questionnaire pages and the QR encoder are shared copy-on-write
+instead of being rebuilt by every worker on its first requests.
+"""
+
+import gc
+import os
+
+wsgi_app = 'run:app'
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 16))
+workers = int(os.environ.get('WEB_CONCURRENCY', 2))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def when_ready(server):
+    """Warm up the preloaded application before the first worker is forked."""
+    if not server.cfg.preload_app:
+        return
+    from app.utils.warmup import warm_up
+    warm_up(server.app.wsgi())
+    # Keep the warmed objects out of the collector so workers do not touch
+    # (and copy) their pages when collecting garbage
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """Finish per-process setup in a newly started worker."""
+    app = worker.wsgi
+    if not worker.cfg.preload_app:
+        from app.utils.warmup import warm_up
+        warm_up(app)
+
+    # Values recorded while warming up in the master belong to no worker
+    from app.utils.metrics import REGISTRY
+    REGISTRY.reset()
+    # Nor do funnel events the master buffered; each worker would flush its copy
+    from app.utils.funnel import get_funnel
+    tracer = get_funnel(app)
+    if tracer is not None:
+        tracer.reset()
+
+    # Gunicorn resets SIGHUP in workers; restore the questionnaire reload handler
+    from app.utils.questionnaire_registry import get_registry
+    get_registry(app).install_signal_handler()
+
+
+def child_exit(server, worker):
+    """Delete the metrics snapshot of a worker that exited, so /metrics stops counting it."""
+    from app.utils.metrics import remove_snapshot
+    from config import Config
+    remove_snapshot(Config.METRICS_DIR, worker.pid)
@@ -1,7 +1,10 @@
 import os
 from app import create_app
 
-app = create_app()
+# Report pool processes are spawned and re-import this module as __mp_main__
+# when it is the main script; they must not build a second app
+if __name__ != '__mp_main__':
+    app = create_app()
 
 if __name__ == '__main__':
     port = int(os.environ.get("PORT", 8000))
@@ -0,0 +1,218 @@
+"""
+Tests for the RESP client of ``RedisResultStore`` against a fake server.
+
+``FakeRedis`` speaks just enough of the Redis protocol for the store: AUTH,
+SELECT, SET (NX, PX), GET, MGET, EXISTS, DEL and MULTI/EXEC. Keys containing
+``error`` get an error reply and keys containing ``garbage`` an unparseable
+one, to exercise the client's failure paths.
+"""
+
+import socket
+import threading
+import time
+
+import pytest
+
+from app.utils.result_store import RedisError, RedisResultStore
+
+
+class FakeRedis:
+    """A threaded, in-memory server speaking a subset of RESP."""
+
+    def __init__(self, password=None):
+        self.password = password
+        self.data = {}
+        self.connections = 0
+        self.open_connections = 0
+        self.batches = []
+        self._lock = threading.Lock()
+        self._server = socket.create_server(('127.0.0.1', 0))
+        self.port = self._server.getsockname()[1]
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def close(self):
+        self._server.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            with self._lock:
+                self.connections += 1
+                self.open_connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        state = {'authenticated': self.password is None, 'queued': None}
+        buffer = b''
+        try:
+            while True:
+                data = conn.recv(65536)
+                if not data:
+                    return
+                buffer += data
+                # Every command complete in the buffer belongs to one pipelined batch
+                batch = []
+                while True:
+                    command, buffer = _parse_command(buffer)
+                    if command is None:
+                        break
+                    batch.append(command)
+                if batch:
+                    with self._lock:
+                        self.batches.append([command[0].decode().upper() for command in batch])
+                    conn.sendall(b''.join(self._handle(command, state) for command in batch))
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self.open_connections -= 1
+            conn.close()
+
+    def _handle(self, command, state):
+        name = command[0].decode().upper()
+        args = command[1:]
+        if name == 'AUTH':
+            if args[-1].decode() != self.password:
+                return b'-WRONGPASS invalid password\r\n'
+            state['authenticated'] = True
+            return b'+OK\r\n'
+        if not state['authenticated']:
+            return b'-NOAUTH Authentication required.\r\n'
+        if name == 'MULTI':
+            state['queued'] = []
+            return b'+OK\r\n'
+        if name == 'EXEC':
+            queued, state['queued'] = state['queued'], None
+            replies = [self._run(*command) for command in queued]
+            return b'*%d\r\n' % len(replies) + b''.join(replies)
+        if state['queued'] is not None:
+            state['queued'].append((name, args))
+            return b'+QUEUED\r\n'
+        return self._run(name, args)
+
+    def _run(self, name, args):
+        if any(b'garbage' in arg for arg in args):
+            return b'?not a reply\r\n'
+        if any(b'error' in arg for arg in args):
+            return b'-ERR rejected\r\n'
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires) in self.data.items() if expires and expires <= now]:
+                del self.data[key]
+            if name == 'SELECT':
+                return b'+OK\r\n'
+            if name == 'SET':
+                key, value, options = args[0], args[1], [arg.upper() for arg in args[2:]]
+                if b'NX' in options and key in self.data:
+                    return b'$-1\r\n'
+                expires = now + int(options[options.index(b'PX') + 1]) / 1000 if b'PX' in options else None
+                self.data[key] = (value, expires)
+                return b'+OK\r\n'
+            if name == 'GET':
+                return _bulk(self.data.get(args[0], (None,))[0])
+            if name == 'MGET':
+                return b'*%d\r\n' % len(args) + b''.join(_bulk(self.data.get(key, (None,))[0]) for key in args)
+            if name == 'EXISTS':
+                return b':%d\r\n' % sum(key in self.data for key in args)
+            if name == 'DEL':
+                return b':%d\r\n' % sum(self.data.pop(key, None) is not None for key in args)
+        return b'-ERR unknown command\r\n'
+
+
+def _bulk(value):
+    return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+
+def _parse_command(buffer):
+    """Split one complete command off ``buffer``; returns ``(None, buffer)`` if there is none."""
+    lines = buffer.split(b'\r\n')
+    if len(lines) < 2:
+        return None, buffer
+    count, position, parts = int(lines[0][1:]), 1, []
+    for _ in range(count):
+        if position + 1 >= len(lines):
+            return None, buffer
+        parts.append(lines[position + 1])
+        position += 2
+    if position >= len(lines):
+        return None, buffer
+    return parts, b'\r\n'.join(lines[position:])
+
+
+@pytest.fixture
+def server():
+    fake = FakeRedis(password='secret')
+    yield fake
+    fake.close()
+
+
+def make_store(server, password='secret', **kwargs):
+    return RedisResultStore(f'redis://:{password}@127.0.0.1:{server.port}/2', **kwargs)
+
+
+def test_round_trip(server):
+    store = make_store(server, default_ttl=60)
+    store.put_many({'a': {'x': 1}, 'b': [1, 2], 'c': 'three'})
+    assert store.get_many(['a', 'b', 'c', 'missing']) == {'a': {'x': 1}, 'b': [1, 2], 'c': 'three'}
+    assert store.exists('a')
+    assert store.add('a', 2) is False
+    assert store.add('d', 4) is True
+    assert store.consume('a') == {'x': 1}
+    assert store.consume('a') is None
+    store.delete('b')
+    assert store.get('b') is None
+    assert server.connections == 1
+
+
+def test_pipelined_replies_stay_in_order(server):
+    store = make_store(server)
+    items = {f'key{i}': i for i in range(50)}
+    store.put_many(items)
+    # The handshake and the 50 SETs each went out in one write
+    assert ['AUTH', 'SELECT'] in server.batches
+    assert ['SET'] * 50 in server.batches
+    assert store.get_many(items) == items
+
+
+def test_error_reply_does_not_desync_connection(server):
+    store = make_store(server)
+    store.put('before', 1)
+    with pytest.raises(RedisError):
+        store.put_many({'ok': 1, 'error': 2, 'also-ok': 3})
+    # The next command gets its own reply, on a fresh connection
+    assert store.get_many(['before', 'ok', 'also-ok']) == {'before': 1, 'ok': 1, 'also-ok': 3}
+    assert server.connections == 2
+    _wait_for(lambda: server.open_connections == 1)
+
+
+def test_unparseable_reply_closes_connection(server):
+    store = make_store(server)
+    store.put('value', 1)
+    with pytest.raises(ConnectionError):
+        store.put_many({'garbage': 1, 'next': 2})
+    assert store.get('value') == 1
+    assert server.connections == 2
+    _wait_for(lambda: server.open_connections == 1)
+
+
+def test_failed_auth_is_not_cached(server):
+    store = make_store(server, password='wrong')
+    with pytest.raises(RedisError):
+        store.get('value')
+    _wait_for(lambda: server.open_connections == 0)
+
+    # A later call makes a fresh handshake instead of reusing the failed connection
+    store.password = 'secret'
+    store.put('value', 1)
+    assert store.get('value') == 1
+    assert server.connections == 2
+
+
+def _wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)